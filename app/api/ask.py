@@ -1,44 +1,94 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from app.vectorstore import chromadb_store
+from app import metrics
+from app.vectorstore import chromadb_store, rerank, term_index
+import json
+import logging
 import os
 import re
-# Use Google Gemini
-from langchain_google_genai import ChatGoogleGenerativeAI
+import time
+# Use Google Gemini through the shared client (concurrency limit, timeouts, coalescing)
+from app.llm import LLMTimeoutError, get_llm_client
 from langchain.prompts import PromptTemplate
 
-def get_llm():
-    api_key = os.environ.get("GOOGLE_API_KEY")
-    if not api_key:
-        # Try to load from .env if not in env
-        from dotenv import load_dotenv
-        load_dotenv()
-        api_key = os.environ.get("GOOGLE_API_KEY")
-        
-    if not api_key:
-        raise ValueError("GOOGLE_API_KEY not found. Please set it in .env or environment variables.")
-        
-    return ChatGoogleGenerativeAI(model="gemini-2.0-flash", google_api_key=api_key, temperature=0)
+LLMClass = None # Deprecated in favor of get_llm_client
 
-LLMClass = None # Deprecated in favor of get_llm
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# In-memory per-tenant last-answer cache for simple refinement chaining.
-import threading
-_LAST_ANSWERS: dict = {}
-_LAST_ANSWERS_LOCK = threading.Lock()
+# Per-tenant last answer for simple refinement chaining, shared across workers.
+from app.conversation_state import get_state_store
+
+# Max matches returned per term by the presence fallback
+FALLBACK_MAX_MATCHES = int(os.environ.get("FALLBACK_MAX_MATCHES", "50"))
+
+# Prompt context budgets (estimated tokens) for answers and summaries
+from app.processing.context_builder import build_context
+ASK_CONTEXT_TOKENS = int(os.environ.get("ASK_CONTEXT_TOKENS", "2000"))
+SUMMARY_CONTEXT_TOKENS = int(os.environ.get("SUMMARY_CONTEXT_TOKENS", "1000"))
+
+# Chunks retrieved per question when no reranker is configured
+ASK_TOP_K = int(os.environ.get("ASK_TOP_K", "10"))
+
+# Question -> embedding cache so repeated questions skip the Ollama round trip.
+from app.cache import SemanticAnswerCache, TTLCache
+_QUERY_EMBEDDINGS = TTLCache(
+    maxsize=int(os.environ.get("QUERY_CACHE_SIZE", "2048")),
+    ttl=float(os.environ.get("QUERY_CACHE_TTL", "3600")),
+)
+
+# Paraphrased questions reuse an earlier LLM answer while the tenant's collection is unchanged.
+ANSWER_CACHE_ENABLED = os.environ.get("ANSWER_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+_ANSWER_CACHE = SemanticAnswerCache(
+    threshold=float(os.environ.get("ANSWER_CACHE_THRESHOLD", "0.95")),
+    maxsize=int(os.environ.get("ANSWER_CACHE_SIZE", "256")),
+    ttl=float(os.environ.get("ANSWER_CACHE_TTL", "3600")),
+)
 
 class AskRequest(BaseModel):
     question: str
     tenant_id: str = None
     prev_answer: str | None = None
 
-@router.post("/ask")
-async def ask(request: AskRequest):
+def _sse(event, data):
+    """Format one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def _remember_answer(tenant_id, answer):
+    """Cache the last answer for this tenant to support refinement chaining."""
+    tenant_key = tenant_id or "default"
+    try:
+        await run_in_threadpool(lambda: get_state_store().set(f"last_answer:{tenant_key}", answer))
+    except Exception as e:
+        logger.warning("Failed to store last answer for tenant %s: %s", tenant_key, e)
+
+
+def _cache_answer(plan, answer, llm_seconds):
+    """Store a freshly generated answer in the semantic answer cache, if the plan allows it."""
+    entry = plan.get("cache")
+    if not entry or not answer:
+        return
+    response = {k: v for k, v in plan["response"].items() if k not in ("question", "tenant_id")}
+    _ANSWER_CACHE.store(entry["tenant"], entry["question"], entry["embedding"], entry["version"],
+                        {"answer": answer, **response}, llm_seconds)
+
+
+async def _plan_answer(request: AskRequest):
+    """
+    Run everything up to the LLM call. Returns {"response": {...}} when the answer is already
+    known (no LLM needed), or {"prompt": str, "response": {...}} where the response still
+    lacks its "answer" and the prompt must be sent to the LLM. Plans whose answer may be
+    reused for similar questions also carry a "cache" entry for _cache_answer; every plan
+    names the "path" that produced it for the request metrics.
+    """
     question = request.question
     tenant_id = request.tenant_id
     prev_answer = request.prev_answer
+    labels = {"tenant": tenant_id}
 
     # Detect summary intent (avoid misclassifying "summarise in 100 words" as refinement)
     is_summary_intent = bool(re.search(r"\bsummary\b|\bsummarize\b|\bsummarise\b|tl;dr", question, re.I))
@@ -50,8 +100,7 @@ async def ask(request: AskRequest):
         tenant_key = tenant_id or "default"
         source_answer = prev_answer
         if not source_answer:
-            with _LAST_ANSWERS_LOCK:
-                source_answer = _LAST_ANSWERS.get(tenant_key)
+            source_answer = await run_in_threadpool(lambda: get_state_store().get(f"last_answer:{tenant_key}"))
 
         if not source_answer:
             # No previous answer supplied — inform the client how to request a rewrite.
@@ -60,50 +109,70 @@ async def ask(request: AskRequest):
         # Heuristic: if original already shorter than target, return it unchanged with a note
         orig_word_count = len([w for w in source_answer.split() if w.strip()])
         if orig_word_count <= word_target:
-            return {
+            return {"path": "refine", "response": {
                 "answer": source_answer,
                 "rewritten_from": source_answer,
                 "word_limit": word_target,
                 "note": f"Original answer already {orig_word_count} words; no shortening performed.",
                 "question": question,
                 "tenant_id": tenant_id,
-            }
+            }}
 
         # Prepare rewrite prompt
-        llm_for_rewrite = get_llm()
         rewrite_prompt = (
             f"Rewrite the following answer to be at most {word_target} words. "
             "Do not add new information; only rephrase and shorten while preserving facts.\n\n"
             "Original answer:\n" + source_answer + "\n\nRewritten answer:\n"
         )
-        # Call Gemini
-        response = llm_for_rewrite.invoke(rewrite_prompt)
-        rewritten = response.content if hasattr(response, "content") else str(response)
-
-        # cache rewritten answer as the last answer for tenant
-        with _LAST_ANSWERS_LOCK:
-            _LAST_ANSWERS[tenant_key] = rewritten
-
-        return {
-            "answer": rewritten,
+        return {"path": "refine", "prompt": rewrite_prompt, "response": {
             "rewritten_from": source_answer,
             "word_limit": word_target,
             "question": question,
             "tenant_id": tenant_id,
-        }
+        }}
     # 1. Retrieve relevant chunks from ChromaDB using correct collection name
-    # Generate embedding for the question
-    from app.processing import document_processing
-    # We can reuse the embed_chunks function but for a single string
-    # Note: embed_chunks expects a list
+    # Generate embedding for the question with the shared embedding service (off the event loop)
+    from app.processing.embedding_service import get_embedding_service
     try:
-        query_embedding = document_processing.embed_chunks([question])
+        service = get_embedding_service()
+        cache_key = (service.model, question.strip())
+        question_embedding = _QUERY_EMBEDDINGS.get(cache_key)
+        if question_embedding is None:
+            with metrics.span("query_embed", **labels):
+                question_embedding = await service.aembed_query(question)
+            _QUERY_EMBEDDINGS.set(cache_key, question_embedding)
+        query_embedding = [question_embedding]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate embedding for question: {str(e)}")
 
-    client = chromadb_store.get_chroma_client()
-    collection = client.get_or_create_collection(chromadb_store.COLLECTION_NAME)
-    results = chromadb_store.hybrid_search(collection, query_embedding, k=10)  # Increase k for more context
+    # Search only the asking tenant's collection
+    collection = chromadb_store.get_tenant_collection(tenant_id)
+    # Read the version before retrieval so an answer built from a collection that changes
+    # mid-request is never served afterwards
+    cache_entry = None
+    if ANSWER_CACHE_ENABLED:
+        cache_entry = {
+            "tenant": tenant_id or "default",
+            "question": question.strip(),
+            "embedding": question_embedding,
+            "version": (collection.name, await run_in_threadpool(chromadb_store.collection_version, collection.name)),
+        }
+        hit = _ANSWER_CACHE.lookup(cache_entry["tenant"], question_embedding, cache_entry["version"])
+        if hit:
+            cached, similarity = hit
+            logger.info("Answer cache hit (similarity %.3f) for: %r", similarity, question)
+            await _remember_answer(tenant_id, cached["answer"])
+            return {"path": "cached", "response": {**cached, "question": question, "tenant_id": tenant_id,
+                                 "cached": True, "cache_similarity": round(similarity, 4)}}
+
+    reranker = rerank.get_reranker()
+    with metrics.span("vector_query", **labels):
+        k = ASK_TOP_K if reranker is None else rerank.RERANK_CANDIDATES
+        results = await run_in_threadpool(chromadb_store.hybrid_search, collection, query_embedding, k=k, query_text=question)
+    if reranker is not None:
+        # Over-fetch, then let the reranker pick the final few
+        with metrics.span("rerank", **labels):
+            results = await run_in_threadpool(rerank.rerank, reranker, question, results, rerank.RERANK_TOP_K)
     docs = []
     metadatas = []
     if results and "documents" in results and results["documents"]:
@@ -112,11 +181,11 @@ async def ask(request: AskRequest):
     context = "\n".join(docs) if docs else "No relevant context found in the uploaded documents."
 
     # Debug logging for troubleshooting chunking and retrieval
-    print("[RETRIEVAL DEBUG] Retrieved docs (first 2 shown):")
-    for i, doc in enumerate(docs[:2]):
-        print(f"[RETRIEVAL DEBUG] Doc {i}: {repr(doc[:200])} ...")
-    print(f"[RETRIEVAL DEBUG] Total docs retrieved: {len(docs)}")
-    print(f"[RETRIEVAL DEBUG] Context passed to LLM (first 500 chars): {repr(context[:500])}")
+    if logger.isEnabledFor(logging.DEBUG):
+        for i, doc in enumerate(docs[:2]):
+            logger.debug("Retrieved doc %d: %r ...", i, doc[:200])
+        logger.debug("Total docs retrieved: %d", len(docs))
+        logger.debug("Context passed to LLM (first 500 chars): %r", context[:500])
 
     # Removed special-case surname handler to keep logic generic
 
@@ -142,15 +211,6 @@ async def ask(request: AskRequest):
     trigger_fallback = (not docs) or context.startswith("No relevant context") or docs_look_like_placeholders(docs) or presence_query
     if trigger_fallback:
         try:
-            all_results = collection.get(include=["documents", "metadatas"], limit=1000)
-            stored_docs = all_results.get("documents", [])
-            stored_metas = all_results.get("metadatas", [])
-            # Normalize nested lists returned by Chroma (e.g., [[doc1, doc2...]])
-            if stored_docs and isinstance(stored_docs[0], list):
-                stored_docs = stored_docs[0]
-            if stored_metas and isinstance(stored_metas[0], list):
-                stored_metas = stored_metas[0]
-
             # Normalize question and try to extract quoted term
             q = question
             m = re.search(r"['\"“”](.+?)['\"“”]", q)
@@ -161,63 +221,58 @@ async def ask(request: AskRequest):
                 # fallback: use words longer than 3 chars
                 terms = [w for w in re.findall(r"\w+", q) if len(w) > 3]
 
+            # Look up matching chunks in the persistent term index instead of scanning stored documents
             found = []
-            for idx, doc in enumerate(stored_docs):
-                text = (doc or "").lower()
+            with metrics.span("fallback_scan", **labels):
                 for term in terms:
-                    if term.lower() in text:
-                        meta = stored_metas[idx] if stored_metas and len(stored_metas) > idx else {}
-                        snippet_start = text.find(term.lower())
-                        snippet = doc[max(0, snippet_start-60):snippet_start+60] if snippet_start >=0 else doc[:120]
-                        found.append({"term": term, "chunk_index": idx, "snippet": snippet, "meta": meta})
-            print(f"[FALLBACK DEBUG] Terms searched: {terms}")
-            print(f"[FALLBACK DEBUG] Found: {found}")
+                    hits = await run_in_threadpool(term_index.search_term, collection, term, FALLBACK_MAX_MATCHES, 60)
+                    for hit in hits["matches"]:
+                        found.append({"term": term, "chunk_index": hit["chunk_index"], "snippet": hit["snippet"], "meta": hit["meta"]})
+            logger.debug("Fallback terms searched: %s", terms)
+            logger.debug("Fallback found: %s", found)
             if found:
                 # Return concise grounded answer for presence queries
                 first = found[0]
-                return {
+                return {"path": "fallback", "response": {
                     "answer": f"Yes — found '{first['term']}' in the uploaded documents (chunk {first['chunk_index']}). Snippet: {first['snippet']}",
                     "chunks": docs,
                     "citations": [m.get("chunk") for m in metadatas],
                     "question": question,
                     "tenant_id": tenant_id,
                     "debug_found": found
-                }
+                }}
         except Exception as e:
-            print(f"[FALLBACK DEBUG] fallback search error: {e}")
+            logger.warning("Fallback search error: %s", e)
 
     # If the user asked for a summary, produce one from available docs (or stored docs)
     m_summary = re.search(r"\bsummary\b|\bsummarize\b|\bsummarize the document\b", question, re.I)
     if m_summary:
-        # Select top-K chunks for summarization to keep prompts focused and small
-        TOP_K = 5
-        MAX_CHARS = 4000
+        # Pack the retrieved (or first stored) chunks into the summary budget
+        MAX_STORED_CANDIDATES = 20
         selected_chunks = []
+        selected_metas = []
         if docs:
-            selected_chunks = docs[:TOP_K]
+            selected_chunks, selected_metas = docs, metadatas
         else:
             try:
-                all_results = collection.get(include=["documents"], limit=1000)
-                stored_docs = all_results.get("documents", [])
-                if stored_docs and isinstance(stored_docs[0], list):
-                    stored_docs = stored_docs[0]
-                selected_chunks = stored_docs[:TOP_K] if stored_docs else []
+                all_results = collection.get(include=["documents", "metadatas"], limit=MAX_STORED_CANDIDATES)
+                selected_chunks = all_results.get("documents", []) or []
+                selected_metas = all_results.get("metadatas", []) or []
             except Exception as e:
-                print(f"[SUMMARY DEBUG] failed to pull stored docs: {e}")
+                logger.warning("Summary failed to pull stored docs: %s", e)
 
         if not selected_chunks:
-            return {
+            return {"path": "summary", "response": {
                 "answer": "The answer to your question is not found in the provided document. No document text available to summarize.",
                 "chunks": docs,
                 "citations": [m.get("chunk") for m in metadatas],
                 "question": question,
                 "tenant_id": tenant_id
-            }
+            }}
 
-        summary_text = "\n".join(selected_chunks)
-        if len(summary_text) > MAX_CHARS:
-            summary_text = summary_text[:MAX_CHARS]
-            print(f"[SUMMARY DEBUG] summary_text truncated to {MAX_CHARS} chars")
+        packed = build_context(selected_chunks, selected_metas, max_tokens=SUMMARY_CONTEXT_TOKENS)
+        summary_text = packed["text"]
+        logger.debug("Summary packed %d chunks into ~%d tokens", len(packed["chunks"]), packed["tokens"])
 
         # Build a safe summarization prompt
         summary_prompt = (
@@ -226,28 +281,19 @@ async def ask(request: AskRequest):
             "Content:\n" + summary_text + "\n\nSummary:\n"
         )
 
-        llm_sum = get_llm()
-        # Call Gemini
-        response = llm_sum.invoke(summary_prompt)
-        summary_answer = response.content if hasattr(response, "content") else str(response)
-
-        # Cache summary for tenant
-        tenant_key = tenant_id or "default"
-        try:
-            with _LAST_ANSWERS_LOCK:
-                _LAST_ANSWERS[tenant_key] = summary_answer
-        except Exception:
-            pass
-
-        return {
-            "answer": summary_answer,
+        return {"path": "summary", "prompt": summary_prompt, "cache": cache_entry, "response": {
             "chunks": docs,
             "citations": [m.get("chunk") for m in metadatas],
             "question": question,
             "tenant_id": tenant_id
-        }
-
-    # Build context with filename information
+        }}
+
+    # Pack the retrieved chunks into the prompt budget, then add filename information
+    packed = build_context(docs, metadatas, max_tokens=ASK_CONTEXT_TOKENS)
+    logger.debug("Packed %d/%d chunks into ~%d tokens", len(packed["chunks"]), len(docs), packed["tokens"])
+    docs, metadatas = packed["chunks"], packed["metadatas"]
+    if docs:
+        context = packed["text"]
     context_with_files = context
     if metadatas:
         # Extract unique filenames from metadata
@@ -278,25 +324,86 @@ Question: {question}
 Answer directly and concisely without introductory phrases like "I'm here to help" or "Let me assist you".
         """
     )
-    # Instantiate the LLM
-    llm = get_llm()
-    # Use .invoke() if available (langchain-core new API), else fall back to calling
-    # Call Gemini
-    response = llm.invoke(prompt.format(context=context_with_files, question=question))
-    answer = response.content if hasattr(response, "content") else str(response)
-
-    # Cache the last answer for this tenant to support refinement chaining
-    tenant_key = tenant_id or "default"
-    try:
-        with _LAST_ANSWERS_LOCK:
-            _LAST_ANSWERS[tenant_key] = answer
-    except Exception:
-        pass
-
-    return {
-        "answer": answer,
+    return {"path": "answer", "prompt": prompt.format(context=context_with_files, question=question), "cache": cache_entry, "response": {
         "chunks": docs,
         "citations": [m.get("chunk") for m in metadatas],
         "question": question,
         "tenant_id": tenant_id
+    }}
+
+
+@router.post("/ask")
+async def ask(request: AskRequest):
+    plan = await _plan_answer(request)
+    metrics.ASK_REQUESTS.inc(tenant=metrics.tenant_label(request.tenant_id), path=plan["path"])
+    if "prompt" not in plan:
+        return plan["response"]
+
+    # Call Gemini
+    started = time.perf_counter()
+    try:
+        with metrics.span("llm", tenant=request.tenant_id):
+            answer = await get_llm_client().ainvoke(plan["prompt"])
+    except LLMTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    _cache_answer(plan, answer, time.perf_counter() - started)
+    await _remember_answer(request.tenant_id, answer)
+    return {"answer": answer, **plan["response"]}
+
+
+metrics.register_stats("rag_answer_cache", "Semantic answer cache.", _ANSWER_CACHE.stats)
+metrics.register_stats("rag_query_embedding_cache", "Question embedding cache.", _QUERY_EMBEDDINGS.stats)
+metrics.register_stats("rag_llm_client", "Shared LLM client.", lambda: get_llm_client().stats())
+
+
+@router.get("/ask/cache_stats")
+def ask_cache_stats():
+    """Hit rates of the answer and question-embedding caches, LLM calls saved and LLM client load."""
+    return {
+        "answer_cache": {"enabled": ANSWER_CACHE_ENABLED, **_ANSWER_CACHE.stats()},
+        "query_embedding_cache": _QUERY_EMBEDDINGS.stats(),
+        "llm_client": get_llm_client().stats(),
     }
+
+
+@router.post("/ask/stream")
+async def ask_stream(request: AskRequest):
+    """
+    Server-sent events variant of /ask. Emits a `citations` event (chunks, citations and the
+    other response fields) as soon as retrieval is done, then one `token` event per streamed
+    piece of the answer, then `done` with the full response (or `error`).
+    """
+    plan = await _plan_answer(request)
+    metrics.ASK_REQUESTS.inc(tenant=metrics.tenant_label(request.tenant_id), path=plan["path"])
+
+    async def events():
+        response = plan["response"]
+        if "prompt" not in plan:
+            yield _sse("citations", {k: v for k, v in response.items() if k != "answer"})
+            yield _sse("token", {"text": response["answer"]})
+            yield _sse("done", response)
+            return
+
+        yield _sse("citations", response)
+        parts = []
+        started = time.perf_counter()
+        try:
+            # Stream from Gemini
+            with metrics.span("llm", tenant=request.tenant_id):
+                async for text in get_llm_client().astream(plan["prompt"]):
+                    parts.append(text)
+                    yield _sse("token", {"text": text})
+        except Exception as e:
+            logger.error("Answer stream failed: %s", e)
+            yield _sse("error", {"detail": str(e)})
+            return
+        answer = "".join(parts)
+        _cache_answer(plan, answer, time.perf_counter() - started)
+        await _remember_answer(request.tenant_id, answer)
+        yield _sse("done", {"answer": answer, **response})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
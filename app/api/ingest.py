@@ -1,19 +1,30 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+import hashlib
+import logging
 import os
-from app.processing import document_processing
+import time
+import uuid
+from typing import Optional
+from app import catalog, metrics
+from app.processing import document_processing, ingest_jobs, pipeline
 from app.vectorstore import chromadb_store
 
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 # Debug endpoint to inspect ChromaDB contents (safe for JSON)
 @router.get("/debug/chromadb")
-async def debug_chromadb():
-    """Return summary of chunks and vectors in the ChromaDB 'documents' collection for debugging."""
-    from app.vectorstore import chromadb_store
-    client = chromadb_store.get_chroma_client()
+async def debug_chromadb(tenant_id: Optional[str] = None):
+    """Return summary of chunks and vectors in the tenant's ChromaDB collection for debugging."""
     try:
-        collection = client.get_or_create_collection(chromadb_store.COLLECTION_NAME)
+        collection = chromadb_store.get_tenant_collection(tenant_id)
         results = collection.get(include=["embeddings", "metadatas", "documents"], limit=100)
         embeddings = results.get("embeddings", [])
         docs = results.get("documents", [])
@@ -30,118 +41,81 @@ async def debug_chromadb():
     except Exception as e:
         import traceback
         tb = traceback.format_exc()
-        print(f"[DEBUG SEARCH_TERM ERROR] {repr(e)}\n{tb}")
+        logger.error("Chroma debug dump failed: %r", e, exc_info=True)
         return {"error": str(e), "repr": repr(e), "traceback": tb}
 
 
+@router.get("/debug/embedding_cache")
+async def debug_embedding_cache():
+    """Return size and hit/miss counters of the persistent embedding cache."""
+    from app.processing.embedding_cache import get_embedding_cache
+    cache = get_embedding_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+
 @router.get("/debug/search_term")
-async def debug_search_term(term: str):
-    """Deterministic substring search for a term across stored documents.
-    Use for quick presence checks (case-insensitive). Returns matching chunk indexes,
-    snippets and optional metadata.
+async def debug_search_term(term: str, limit: int = 50, tenant_id: Optional[str] = None):
+    """Indexed presence search for a term across all stored documents.
+    Use for quick presence checks (case-insensitive, whole words; the last word also
+    matches as a prefix). Returns the total match count plus up to `limit` matching chunk
+    indexes, snippets and metadata.
     """
-    from app.vectorstore import chromadb_store
-    client = chromadb_store.get_chroma_client()
-    print(f"[DEBUG SEARCH_TERM] term={term!r}, client={type(client)!r}")
+    from app.vectorstore import term_index
+    logger.debug("Term search: term=%r", term)
     try:
-        collection = client.get_or_create_collection(chromadb_store.COLLECTION_NAME)
-        print(f"[DEBUG SEARCH_TERM] collection obtained: {collection!r}")
-        results = collection.get(include=["documents", "metadatas"], limit=1000)
-        print(f"[DEBUG SEARCH_TERM] raw results keys: {list(results.keys())}")
-        stored_docs = results.get("documents", [])
-        stored_metas = results.get("metadatas", [])
-        # Normalize if Chroma returns nested lists (e.g., [ [doc1, doc2, ...] ])
-        if stored_docs and isinstance(stored_docs[0], list):
-            print("[DEBUG SEARCH_TERM] normalizing nested stored_docs")
-            stored_docs = stored_docs[0]
-        if stored_metas and isinstance(stored_metas[0], list):
-            print("[DEBUG SEARCH_TERM] normalizing nested stored_metas")
-            stored_metas = stored_metas[0]
-
-        term_l = term.lower()
-        found = []
-        for idx, doc in enumerate(stored_docs):
-            try:
-                if not doc:
-                    continue
-                text = doc.lower()
-                pos = text.find(term_l)
-                if pos >= 0:
-                    snippet = doc[max(0, pos-80):pos+80]
-                    meta = stored_metas[idx] if stored_metas and len(stored_metas) > idx else {}
-                    found.append({"chunk_index": idx, "snippet": snippet, "meta": meta})
-            except Exception as inner_e:
-                print(f"[DEBUG SEARCH_TERM] error inspecting doc idx={idx}: {inner_e}")
-
-        resp = {"term": term, "matches": found, "match_count": len(found), "doc_count": len(stored_docs)}
-        print(f"[DEBUG SEARCH_TERM] response: match_count={len(found)}, doc_count={len(stored_docs)}")
+        collection = chromadb_store.get_tenant_collection(tenant_id)
+        resp = await run_in_threadpool(term_index.search_term, collection, term, limit)
+        logger.debug("Term search: match_count=%d, doc_count=%d", resp["match_count"], resp["doc_count"])
         return resp
     except Exception as e:
         import traceback
         tb = traceback.format_exc()
-        print(f"[DEBUG SEARCH_TERM ERROR] {repr(e)}\n{tb}")
+        logger.error("Term search failed: %r", e, exc_info=True)
         return {"error": str(e), "repr": repr(e), "traceback": tb}
 
 @router.post("/reset_vectorstore")
-async def reset_vectorstore():
-    """Delete the ChromaDB 'documents' collection to fix embedding dimension mismatches."""
-    from app.vectorstore import chromadb_store
-    client = chromadb_store.get_chroma_client()
+async def reset_vectorstore(tenant_id: Optional[str] = None):
+    """Delete the tenant's ChromaDB collection to fix embedding dimension mismatches."""
+    name = chromadb_store.collection_name_for_tenant(tenant_id)
     try:
-        client.delete_collection(chromadb_store.COLLECTION_NAME)
-        return {"status": "success", "message": f"ChromaDB '{chromadb_store.COLLECTION_NAME}' collection deleted."}
+        chromadb_store.drop_collection(name)
+        catalog.delete_collection_documents(name)
+        return {"status": "success", "message": f"ChromaDB '{name}' collection deleted."}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
 @router.get("/files")
-async def list_files():
-    """Get list of all unique filenames stored in ChromaDB."""
-    from app.vectorstore import chromadb_store
-    client = chromadb_store.get_chroma_client()
+async def list_files(tenant_id: Optional[str] = None):
+    """Get list of all ingested files from the document catalog."""
     try:
-        collection = client.get_or_create_collection(chromadb_store.COLLECTION_NAME)
-        results = collection.get(include=["metadatas"], limit=10000)
-        metadatas = results.get("metadatas", [])
-        
-        # Extract unique filenames with metadata
-        files_map = {}
-        for meta in metadatas:
-            if meta and "filename" in meta:
-                fname = meta["filename"]
-                if fname not in files_map:
-                    files_map[fname] = {
-                        "filename": fname,
-                        "upload_time": meta.get("upload_time"),
-                        "file_size": meta.get("file_size"),
-                        "content_type": meta.get("content_type")
-                    }
-        
-        # Return list of file objects sorted by filename
-        return {"status": "success", "files": sorted(list(files_map.values()), key=lambda x: x["filename"])}
+        tenant_key = tenant_id or catalog.DEFAULT_TENANT
+        documents = catalog.list_documents(tenant_key)
+        if not documents:
+            # Files stored before the catalog existed are catalogued from their chunk metadata
+            collection = chromadb_store.get_tenant_collection(tenant_id)
+            if await run_in_threadpool(catalog.backfill_documents, collection, tenant_key):
+                documents = catalog.list_documents(tenant_key)
+        files = [{
+            "filename": doc.filename,
+            "upload_time": doc.upload_time,
+            "file_size": doc.file_size,
+            "content_type": doc.content_type,
+            "chunks": doc.chunk_count,
+        } for doc in documents]
+        return {"status": "success", "files": files}
     except Exception as e:
         return {"status": "error", "message": str(e), "files": []}
 
 @router.delete("/file/{filename}")
-async def delete_file(filename: str):
-    """Delete all chunks associated with a specific filename from ChromaDB."""
-    from app.vectorstore import chromadb_store
-    client = chromadb_store.get_chroma_client()
+async def delete_file(filename: str, tenant_id: Optional[str] = None):
+    """Delete all chunks associated with a specific filename from the tenant's ChromaDB collection."""
     try:
-        collection = client.get_or_create_collection(chromadb_store.COLLECTION_NAME)
-        
-        # Get all documents with their IDs and metadata
-        results = collection.get(include=["metadatas"], limit=10000)
-        ids = results.get("ids", [])
-        metadatas = results.get("metadatas", [])
-        
-        # Find IDs that match the filename
-        ids_to_delete = []
-        for i, meta in enumerate(metadatas):
-            if meta and meta.get("filename") == filename:
-                ids_to_delete.append(ids[i])
-        
+        collection = chromadb_store.get_tenant_collection(tenant_id)
+        ids_to_delete = await run_in_threadpool(_delete_file_chunks, collection, filename, tenant_id or catalog.DEFAULT_TENANT)
+
         if ids_to_delete:
-            collection.delete(ids=ids_to_delete)
             return {
                 "status": "success", 
                 "message": f"Deleted {len(ids_to_delete)} chunks for file: {filename}",
@@ -157,79 +131,428 @@ async def delete_file(filename: str):
         import traceback
         return {"status": "error", "message": str(e), "traceback": traceback.format_exc()}
 
-UPLOAD_DIR = "/tmp/rag_uploads"
+def _delete_file_chunks(collection, filename, tenant_key):
+    """
+    Delete a file's catalog row and every chunk stored for it: the catalogued IDs plus any
+    chunk whose metadata names the file, so nothing a lost or racing write left behind
+    stays retrievable. Waits for a running ingest of the same file. Returns the deleted IDs.
+    """
+    with ingest_jobs.source_lock(tenant_key, filename):
+        document = catalog.delete_document(filename, tenant_key)
+        ids_to_delete = set(catalog.document_chunk_ids(document)) if document is not None else set()
+        ids_to_delete.update(chromadb_store.get_source_chunks(collection, {"filename": filename}))
+        ids_to_delete = sorted(ids_to_delete)
+        if ids_to_delete:
+            chromadb_store.delete_embeddings(collection, ids_to_delete)
+    return ids_to_delete
+
+
+# Uploads are spooled here until their ingestion job has run; can be overridden by env vars
+UPLOAD_DIR = os.environ.get("UPLOAD_DIR", "/tmp/rag_uploads")
+MAX_UPLOAD_MB = float(os.environ.get("MAX_UPLOAD_MB", "1024"))
+UPLOAD_BLOCK_BYTES = 1 << 20
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-@router.post("/ingest/file")
-async def ingest_file(file: UploadFile = File(...)):
-    try:
-        print(f"\n[INGEST] Starting ingestion for file: {file.filename}")
-        
-        # 1. Save file
-        file_location = os.path.join(UPLOAD_DIR, file.filename)
-        with open(file_location, "wb") as f:
-            content = await file.read()
-            f.write(content)
-        print(f"[INGEST] File saved: {file_location} ({len(content)} bytes)")
-
-        # 2. Normalize
-        print(f"[INGEST] Normalizing document, content_type: {file.content_type}")
-        normalized = document_processing.normalize_document(content, file.content_type)
-        
-        # 3. Chunk
-        if isinstance(normalized, bytes):
-            text = normalized.decode(errors="ignore")
+
+# Room for multipart boundaries, part headers and small form fields on top of the file itself
+_MULTIPART_OVERHEAD_BYTES = 1 << 20
+_MAX_FIELD_BYTES = 65536
+
+
+async def _spool_upload(request):
+    """
+    Stream a multipart/form-data request body straight into a uniquely named file under
+    UPLOAD_DIR, hashing the "file" part as its bytes arrive, so no request holds the whole
+    file in memory and nothing is copied twice. Uploads larger than MAX_UPLOAD_MB are
+    rejected with 413: up front from Content-Length, otherwise as soon as the limit is
+    crossed, and the partial copy is removed. Returns a dict with the spooled path, sha256
+    hex digest, size, filename and content type of the file, and the other form fields.
+    """
+    max_bytes = int(MAX_UPLOAD_MB * 1024 * 1024)
+    too_large = HTTPException(status_code=413, detail=f"Upload exceeds the {MAX_UPLOAD_MB:g} MB limit")
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > max_bytes + _MULTIPART_OVERHEAD_BYTES:
+        raise too_large
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or not params.get(b"boundary"):
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload")
+
+    upload = {"path": None, "size": 0, "filename": None, "content_type": None, "fields": {}}
+    digest = hashlib.sha256()
+    part = {}
+    pending = []  # file bytes parsed from the current body chunk, written off the event loop
+    out = None
+
+    def on_part_begin():
+        part.clear()
+        part.update(headers={}, field=b"", value=b"", kind=None, data=bytearray())
+
+    def on_header_field(data, start, end):
+        part["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        part["value"] += data[start:end]
+
+    def on_header_end():
+        part["headers"][part["field"].lower()] = part["value"]
+        part["field"] = part["value"] = b""
+
+    def on_headers_finished():
+        nonlocal out
+        _, disposition = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        part["name"] = disposition.get(b"name", b"").decode("utf-8", "replace")
+        filename = disposition.get(b"filename")
+        if part["name"] == "file" and filename is not None and out is None:
+            part["kind"] = "file"
+            upload["filename"] = filename.decode("utf-8", "replace")
+            upload["content_type"] = part["headers"].get(b"content-type", b"").decode("latin-1") or None
+            name = os.path.basename(upload["filename"]) or "upload"
+            upload["path"] = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}_{name}")
+            out = open(upload["path"], "wb")
         else:
-            text = str(normalized)
-        
-        print(f"[INGEST] Extracted text length: {len(text)} chars")
-        chunks = document_processing.chunk_document(text)
-        print(f"[INGEST] Created {len(chunks)} chunks")
-        
-        if len(chunks) == 0:
-            return {"status": "error", "message": "No text could be extracted from the file", "filename": file.filename, "chunks": 0}
-
-        # 4. Embed
-        print(f"[INGEST] Generating embeddings for {len(chunks)} chunks")
-        embeddings = document_processing.embed_chunks(chunks)
-        print(f"[INGEST] Generated {len(embeddings)} embeddings")
-
-        # 5. Store in ChromaDB
-        print(f"[INGEST] Storing in ChromaDB")
-        import datetime
-        upload_time = datetime.datetime.now().isoformat()
-        
-        client = chromadb_store.get_chroma_client()
-        collection = client.get_or_create_collection(chromadb_store.COLLECTION_NAME)
-        
+            part["kind"] = "field"
+
+    def on_part_data(data, start, end):
+        if part["kind"] == "file":
+            upload["size"] += end - start
+            if upload["size"] > max_bytes:
+                raise too_large
+            pending.append(bytes(data[start:end]))
+        elif len(part["data"]) < _MAX_FIELD_BYTES:
+            part["data"] += data[start:end]
+
+    def on_part_end():
+        if part["kind"] == "field":
+            upload["fields"][part["name"]] = part["data"].decode("utf-8", "replace")
+
+    def write(blocks):
+        for block in blocks:
+            out.write(block)
+            digest.update(block)
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_bytes + _MULTIPART_OVERHEAD_BYTES:
+                raise too_large
+            parser.write(chunk)
+            if pending:
+                blocks = pending[:]
+                pending.clear()
+                await run_in_threadpool(write, blocks)
+        parser.finalize()
+        if out is None:
+            raise HTTPException(status_code=422, detail="The upload has no 'file' part")
+    except BaseException:
+        if out is not None:
+            out.close()
+            _remove_upload(upload["path"])
+        raise
+    out.close()
+    upload["sha256"] = digest.hexdigest()
+    return upload
+
+
+def _remove_upload(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning("Could not remove spooled upload %s: %s", path, e)
+
+
+def _hash_file(path):
+    """SHA-256 hex digest and size of a file, read in blocks."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(UPLOAD_BLOCK_BYTES), b""):
+            digest.update(block)
+            size += len(block)
+    return digest.hexdigest(), size
+
+
+def _timed_iter(items, timings, key):
+    """Pass items through, adding the time spent producing them to timings[key]."""
+    iterator = iter(items)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            timings[key] = timings.get(key, 0.0) + time.perf_counter() - started
+        yield item
+
+
+def _chunk_stream(units, labels, job=None):
+    """
+    Chunk extracted text units as they arrive. Extraction runs ahead on its own thread
+    through a bounded queue, so CPU-bound parsing overlaps chunking and the stages after it.
+    Records the normalize and chunk stage timings, reports running counts and finishes
+    the job's extract and chunk stages once the input runs out.
+    """
+    timings = {}
+    chars = 0
+
+    def extracted():
+        # Runs on the extract stage's thread
+        nonlocal chars
+        count = 0
+        for unit in _timed_iter(units, timings, "normalize"):
+            chars += len(unit)
+            count += 1
+            if job:
+                job.update_stage("extract", chars=chars, units=count)
+            yield unit
+        logger.debug("Extracted text length: %d chars", chars)
+        if job:
+            job.finish_stage("extract", chars=chars, units=count)
+
+    if job:
+        job.start_stage("extract")
+        job.start_stage("chunk")
+    count = 0
+    arrived = _timed_iter(pipeline.staged(extracted(), name="extract"), timings, "wait")
+    for chunk in _timed_iter(document_processing.iter_chunks(arrived), timings, "total"):
+        count += 1
+        if job:
+            job.update_stage("chunk", chunks=count)
+        yield chunk
+    metrics.STAGE_SECONDS.observe(timings.get("normalize", 0.0), stage="normalize", **labels)
+    # Time spent chunking, not waiting for the extractor
+    metrics.STAGE_SECONDS.observe(timings["total"] - timings.get("wait", 0.0), stage="chunk", **labels)
+    metrics.INGESTED_CHUNKS.inc(count, **labels)
+    logger.debug("Created %d chunks", count)
+    if job:
+        job.finish_stage("chunk", chunks=count)
+
+
+def _sync_source_chunks(collection, source_field, source, chunks, existing, extra_meta, job=None, labels=None):
+    """
+    Make the stored chunks for one source match `chunks`, an iterable of chunk dicts (text
+    and start/end offsets) such as _chunk_stream() yields. Each stage runs on its own
+    thread with a bounded queue to the next: extraction, chunking into batches, embedding
+    the chunks whose deterministic ID is new, and upserting in this thread. The stages
+    overlap in time and memory stays flat however long the source is. Unchanged chunks get
+    their metadata refreshed and stale ones are deleted at the end. `existing` holds the IDs
+    currently stored for the source. Returns the chunk IDs and counts; raises ValueError
+    (deleting nothing) if there are no chunks. `labels` (file_type, tenant) tag the embed
+    and vector_add timing metrics. The job's embed and store stages report running counts.
+    """
+    labels = labels or {}
+    seen = {}
+    ids = []
+    embedded = 0
+
+    def embed_batch(batch):
+        # Runs on the embed stage's thread, one batch at a time and in order
+        nonlocal embedded
+        if job and not ids:
+            job.start_stage("embed")
+        batch_ids = chromadb_store.make_chunk_ids(source, [chunk["text"] for chunk in batch], seen=seen)
         metadatas = [{
-            "filename": file.filename, 
-            "chunk": i, 
-            "text": chunk,
-            "upload_time": upload_time,
-            "file_size": len(content),
-            "content_type": file.content_type
-        } for i, chunk in enumerate(chunks)]
-        chromadb_store.add_embeddings(collection, embeddings, metadatas)
-        
-        print(f"[INGEST] ✓ Successfully ingested {file.filename}: {len(chunks)} chunks stored")
-        return {"status": "success", "filename": file.filename, "chunks": len(chunks)}
-        
+            source_field: source,
+            "chunk": len(ids) + i,
+            "text": chunk["text"],
+            "content_hash": chromadb_store.content_hash(chunk["text"]),
+            "char_start": chunk["start"],
+            "char_end": chunk["end"],
+            **extra_meta,
+        } for i, chunk in enumerate(batch)]
+        ids.extend(batch_ids)
+        new_positions = [i for i, chunk_id in enumerate(batch_ids) if chunk_id not in existing]
+        progress = (lambda done, total: job.update_stage("embed", embeddings=embedded + done)) if job else None
+        with metrics.span("embed", **labels):
+            embeddings = document_processing.embed_chunks(
+                [batch[i]["text"] for i in new_positions], progress=progress
+            ) if new_positions else []
+        embedded += len(new_positions)
+        if job:
+            job.update_stage("embed", embeddings=embedded)
+        return batch_ids, metadatas, new_positions, embeddings
+
+    added = unchanged = 0
+    # Chunking (and extraction behind it) runs on its own thread, so it overlaps embedding
+    chunk_batches = pipeline.staged(pipeline.batched(chunks), name="chunk")
+    for batch_ids, metadatas, new_positions, embeddings in pipeline.staged(chunk_batches, embed_batch, name="embed"):
+        if job and not added + unchanged:
+            job.start_stage("store")
+        new = set(new_positions)
+        kept_positions = [i for i in range(len(batch_ids)) if i not in new]
+        # Upsert new chunks, refresh unchanged ones
+        if new_positions:
+            with metrics.span("vector_add", **labels):
+                chromadb_store.add_embeddings(
+                    collection, embeddings, [metadatas[i] for i in new_positions], ids=[batch_ids[i] for i in new_positions]
+                )
+        if kept_positions:
+            chromadb_store.update_metadatas(
+                collection, [batch_ids[i] for i in kept_positions], [metadatas[i] for i in kept_positions]
+            )
+        added += len(new_positions)
+        unchanged += len(kept_positions)
+        if job:
+            job.update_stage("store", stored=added, updated=unchanged)
+    if job:
+        job.finish_stage("embed", embeddings=added)
+
+    if not ids:
+        raise ValueError(f"No text could be extracted from {source}")
+    current_ids = set(ids)
+    stale_ids = [chunk_id for chunk_id in existing if chunk_id not in current_ids]
+    if stale_ids:
+        chromadb_store.delete_embeddings(collection, stale_ids)
+    logger.info("%s: %d new, %d unchanged, %d stale chunks", source, added, unchanged, len(stale_ids))
+    if job:
+        job.finish_stage("store", stored=added, updated=unchanged, deleted=len(stale_ids))
+    return {"ids": ids, "added": added, "unchanged": unchanged, "deleted": len(stale_ids)}
+
+
+def _run_file_ingest(job, file_location, filename, content_type, tenant_id=None, file_hash=None, file_size=None):
+    """
+    Worker-side ingestion pipeline: extract -> chunk -> embed -> store, reporting per-stage
+    progress. Extractors read the spooled file from disk, which is removed afterwards.
+    """
+    try:
+        # One job per file at a time, so concurrent uploads of it cannot interleave their writes
+        with ingest_jobs.source_lock(tenant_id or catalog.DEFAULT_TENANT, filename):
+            return _ingest_spooled_file(job, file_location, filename, content_type, tenant_id, file_hash, file_size)
+    finally:
+        _remove_upload(file_location)
+
+
+def _ingest_spooled_file(job, file_location, filename, content_type, tenant_id, file_hash, file_size):
+    logger.info("Job %s: starting ingestion for file: %s", job.id, filename)
+    if file_hash is None:
+        file_hash, file_size = _hash_file(file_location)
+
+    # Skip files whose bytes are identical to what is already stored
+    tenant_key = tenant_id or catalog.DEFAULT_TENANT
+    labels = {"file_type": metrics.file_type_label(filename, content_type), "tenant": metrics.tenant_label(tenant_key)}
+    collection = chromadb_store.get_tenant_collection(tenant_id)
+    document = catalog.get_document(filename, tenant_key)
+    if document is not None:
+        if document.file_hash == file_hash:
+            logger.info("%s unchanged since last ingest; skipping", filename)
+            for stage in ingest_jobs.STAGES:
+                job.finish_stage(stage, skipped=True)
+            return {"status": "unchanged", "filename": filename, "chunks": document.chunk_count}
+        existing = set(catalog.document_chunk_ids(document))
+    else:
+        existing = set()
+    # Chunks missing from the catalog (stored before it existed, or by a write that lost a race)
+    # are found by metadata, so they are replaced or deleted like the rest
+    existing.update(chromadb_store.get_source_chunks(collection, {"filename": filename}))
+
+    # 1-4. Extract, chunk, embed and store as overlapping stages with bounded queues between them
+    import datetime
+    upload_time = datetime.datetime.now().isoformat()
+    units = document_processing.iter_document_text(file_location, content_type)
+    stats = _sync_source_chunks(collection, "filename", filename, _chunk_stream(units, labels, job), existing, {
+        "upload_time": upload_time,
+        "file_size": file_size,
+        "content_type": content_type,
+        "file_hash": file_hash,
+    }, job=job, labels=labels)
+    catalog.record_document(
+        filename,
+        stats.pop("ids"),
+        tenant_id=tenant_key,
+        collection=collection.name,
+        content_type=content_type,
+        file_size=file_size,
+        file_hash=file_hash,
+        upload_time=upload_time,
+    )
+
+    chunk_count = stats["added"] + stats["unchanged"]
+    logger.info("Ingested %s: %d chunks stored", filename, chunk_count)
+    return {"status": "success", "filename": filename, "chunks": chunk_count, **stats}
+
+
+_UPLOAD_REQUEST_BODY = {
+    "required": True,
+    "content": {"multipart/form-data": {"schema": {
+        "type": "object",
+        "required": ["file"],
+        "properties": {"file": {"type": "string", "format": "binary"}, "tenant_id": {"type": "string"}},
+    }}},
+}
+
+
+@router.post("/ingest/file", openapi_extra={"requestBody": _UPLOAD_REQUEST_BODY})
+async def ingest_file(request: Request):
+    """
+    Spool the upload (multipart form: `file`, optional `tenant_id`) to disk and queue it
+    for background ingestion.
+    Returns a job ID immediately; poll /ingest/jobs/{job_id} for status and per-stage progress.
+    Uploads over MAX_UPLOAD_MB are rejected with 413.
+    """
+    upload = {}
+    try:
+        upload = await _spool_upload(request)
+        filename, content_type = upload["filename"], upload["content_type"]
+        tenant_id = upload["fields"].get("tenant_id") or None
+        logger.debug("File saved: %s (%d bytes)", upload["path"], upload["size"])
+
+        job = ingest_jobs.IngestJob(filename, content_type, tenant_id)
+        ingest_jobs.submit_job(job, _run_file_ingest, upload["path"], filename, content_type, tenant_id,
+                               file_hash=upload["sha256"], file_size=upload["size"])
+        logger.info("Queued job %s for %s", job.id, filename)
+        return {"status": "queued", "job_id": job.id, "filename": filename}
+    except HTTPException:
+        raise
+    except ingest_jobs.QueueFullError as e:
+        _remove_upload(upload["path"])
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         import traceback
         error_trace = traceback.format_exc()
-        print(f"[INGEST ERROR] Failed to ingest {file.filename}:")
-        print(error_trace)
-        return {"status": "error", "message": str(e), "filename": file.filename, "chunks": 0, "traceback": error_trace}
+        logger.error("Failed to queue %s", upload.get("filename"), exc_info=True)
+        if upload.get("path"):
+            _remove_upload(upload["path"])
+        return {"status": "error", "message": str(e), "filename": upload.get("filename"), "chunks": 0, "traceback": error_trace}
+
+
+@router.get("/ingest/jobs")
+async def list_ingest_jobs():
+    """List known ingestion jobs, oldest first."""
+    return {"jobs": ingest_jobs.job_statuses()}
+
+
+@router.get("/ingest/jobs/{job_id}")
+async def get_ingest_job(job_id: str):
+    """Return status and per-stage progress (extract/chunk/embed/store) for an ingestion job."""
+    job = ingest_jobs.job_status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown ingestion job: {job_id}")
+    return job
 
 
 import requests
 
-@router.post("/ingest/url")
-async def ingest_url(url: str):
+# Seconds to wait for the remote server when downloading a URL (connect and each read)
+URL_FETCH_TIMEOUT = float(os.environ.get("URL_FETCH_TIMEOUT", "30"))
+
+
+def _ingest_url(url, tenant_id):
+    """Download a URL and sync its chunks into the tenant's collection. Blocking; runs in the threadpool."""
     # 1. Download file
     try:
-        response = requests.get(url)
+        response = requests.get(url, timeout=URL_FETCH_TIMEOUT)
         response.raise_for_status()
         content = response.content
         # Guess filetype from URL or headers
@@ -240,23 +563,29 @@ async def ingest_url(url: str):
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to download: {e}")
 
-    # 2. Normalize
-    normalized = document_processing.normalize_document(content, filetype)
+    # Skip URLs whose content is identical to what is already stored
+    file_hash = hashlib.sha256(content).hexdigest()
+    labels = {"file_type": "url", "tenant": metrics.tenant_label(tenant_id)}
+    collection = chromadb_store.get_tenant_collection(tenant_id)
+    with ingest_jobs.source_lock(tenant_id or catalog.DEFAULT_TENANT, url):
+        existing = chromadb_store.get_source_chunks(collection, {"url": url})
+        if existing and all(meta and meta.get("file_hash") == file_hash for meta in existing.values()):
+            metrics.INGESTED_DOCUMENTS.inc(status="unchanged", **labels)
+            return {"status": "unchanged", "url": url, "chunks": len(existing)}
 
-    # 3. Chunk
-    if isinstance(normalized, bytes):
-        text = normalized.decode(errors="ignore")
-    else:
-        text = str(normalized)
-    chunks = document_processing.chunk_document(text)
+        # 2-5. Extract, chunk, embed and store as overlapping stages with bounded queues between them
+        units = document_processing.iter_document_text(content, filetype)
+        try:
+            stats = _sync_source_chunks(collection, "url", url, _chunk_stream(units, labels), existing,
+                                        {"file_hash": file_hash}, labels=labels)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    stats.pop("ids")
+    metrics.INGESTED_DOCUMENTS.inc(status="success", **labels)
 
-    # 4. Embed
-    embeddings = document_processing.embed_chunks(chunks)
+    return {"status": "success", "url": url, "chunks": stats["added"] + stats["unchanged"], **stats}
 
-    # 5. Store in ChromaDB
-    client = chromadb_store.get_chroma_client()
-    collection = client.get_or_create_collection(chromadb_store.COLLECTION_NAME)
-    metadatas = [{"url": url, "chunk": i, "text": chunk} for i, chunk in enumerate(chunks)]
-    chromadb_store.add_embeddings(collection, embeddings, metadatas)
 
-    return {"status": "success", "url": url, "chunks": len(chunks)}
+@router.post("/ingest/url")
+async def ingest_url(url: str, tenant_id: Optional[str] = None):
+    return await run_in_threadpool(_ingest_url, url, tenant_id)
@@ -0,0 +1,148 @@
+# In-process caches for the query path: a small LRU/TTL cache and a semantic answer cache
+
+import math
+import operator
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache. Entries expire `ttl` seconds after they are written (ttl=None
+    keeps them until evicted), and the least recently used entry is dropped once
+    `maxsize` is exceeded.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=_MISSING):
+        ttl = self.ttl if ttl is _MISSING else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+            return default if entry is _MISSING else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def _normalize(vector):
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+class SemanticAnswerCache:
+    """
+    Per-tenant cache of answered questions, matched by cosine similarity of question
+    embeddings. An entry is only served while the collection version it was answered against
+    is still current, and expires after `ttl` seconds; each tenant keeps at most
+    `maxsize` entries (least recently used evicted). Tracks hits, misses and the LLM calls
+    and seconds saved by hits.
+    """
+
+    def __init__(self, threshold=0.95, maxsize=256, ttl=3600):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._tenants = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, tenant, embedding, version):
+        """Return (response, similarity) for the closest fresh entry above the threshold, else None."""
+        query = _normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            entries = self._tenants.get(tenant)
+            best_key, best_sim = None, -1.0
+            if entries:
+                for key, entry in list(entries.items()):
+                    if entry["version"] != version or entry["expires_at"] <= now:
+                        del entries[key]
+                        continue
+                    sim = sum(map(operator.mul, query, entry["embedding"]))
+                    if sim > best_sim:
+                        best_key, best_sim = key, sim
+            if best_key is None or best_sim < self.threshold:
+                self.misses += 1
+                return None
+            entries.move_to_end(best_key)
+            entry = entries[best_key]
+            self.hits += 1
+            self.saved_seconds += entry["llm_seconds"]
+            return entry["response"], best_sim
+
+    def store(self, tenant, question, embedding, version, response, llm_seconds=0.0):
+        with self._lock:
+            entries = self._tenants.setdefault(tenant, OrderedDict())
+            entries[question] = {
+                "embedding": _normalize(embedding),
+                "version": version,
+                "response": response,
+                "llm_seconds": llm_seconds,
+                "expires_at": time.monotonic() + self.ttl,
+            }
+            entries.move_to_end(question)
+            while len(entries) > self.maxsize:
+                entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": sum(len(entries) for entries in self._tenants.values()),
+                "tenants": len(self._tenants),
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "saved_llm_calls": self.hits,
+                "saved_llm_seconds": round(self.saved_seconds, 3),
+            }
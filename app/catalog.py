@@ -0,0 +1,129 @@
+# Document catalog: one SQL row per ingested file with the IDs of its chunks
+
+import json
+import logging
+import threading
+
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+
+from app.db import get_session
+from app.models import Document
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TENANT = "default"
+_BACKFILL_PAGE_SIZE = 1000
+# (tenant, collection) pairs already backfilled by this process
+_BACKFILLED = set()
+_BACKFILLED_LOCK = threading.Lock()
+
+
+def get_document(filename, tenant_id=DEFAULT_TENANT):
+    with get_session() as session:
+        return session.exec(
+            select(Document).where(Document.tenant_id == tenant_id, Document.filename == filename)
+        ).first()
+
+
+def document_chunk_ids(document):
+    return json.loads(document.chunk_ids or "[]")
+
+
+def record_document(filename, chunk_ids, tenant_id=DEFAULT_TENANT, **fields):
+    """
+    Insert or replace the catalog row for a file after it has been stored. If another
+    process inserts the row first, it is replaced instead of failing on the unique key.
+    """
+    for attempt in range(2):
+        with get_session() as session:
+            document = session.exec(
+                select(Document).where(Document.tenant_id == tenant_id, Document.filename == filename)
+            ).first()
+            if document is None:
+                document = Document(tenant_id=tenant_id, filename=filename)
+            for name, value in fields.items():
+                setattr(document, name, value)
+            document.chunk_ids = json.dumps(list(chunk_ids))
+            document.chunk_count = len(chunk_ids)
+            session.add(document)
+            try:
+                session.commit()
+            except IntegrityError:
+                session.rollback()
+                if attempt:
+                    raise
+                continue
+            session.refresh(document)
+            return document
+
+
+def list_documents(tenant_id=DEFAULT_TENANT):
+    with get_session() as session:
+        return list(session.exec(
+            select(Document).where(Document.tenant_id == tenant_id).order_by(Document.filename)
+        ).all())
+
+
+def delete_document(filename, tenant_id=DEFAULT_TENANT):
+    """Remove a file's catalog row and return it (None if it was not catalogued)."""
+    with get_session() as session:
+        document = session.exec(
+            select(Document).where(Document.tenant_id == tenant_id, Document.filename == filename)
+        ).first()
+        if document is not None:
+            session.delete(document)
+            session.commit()
+        return document
+
+
+def delete_collection_documents(collection):
+    """Forget every catalogued file stored in a collection (used when the collection is dropped)."""
+    with get_session() as session:
+        for document in session.exec(select(Document).where(Document.collection == collection)).all():
+            session.delete(document)
+        session.commit()
+
+
+def backfill_documents(collection, tenant_id=DEFAULT_TENANT):
+    """
+    Catalog the files stored in a Chroma collection before the catalog existed, from their
+    chunk metadata. Runs once per (tenant, collection) per process; files that already have
+    a row are left alone. Returns the number of files added.
+    """
+    key = (tenant_id, collection.name)
+    with _BACKFILLED_LOCK:
+        if key in _BACKFILLED:
+            return 0
+        _BACKFILLED.add(key)
+    files = {}
+    offset = 0
+    while True:
+        page = collection.get(include=["metadatas"], limit=_BACKFILL_PAGE_SIZE, offset=offset)
+        ids = page.get("ids", [])
+        if not ids:
+            break
+        for chunk_id, meta in zip(ids, page.get("metadatas") or []):
+            filename = (meta or {}).get("filename")
+            if filename:
+                files.setdefault(filename, {"ids": [], "meta": meta})["ids"].append(chunk_id)
+        offset += len(ids)
+    added = 0
+    for filename, entry in files.items():
+        if get_document(filename, tenant_id) is not None:
+            continue
+        meta = entry["meta"]
+        record_document(
+            filename,
+            entry["ids"],
+            tenant_id=tenant_id,
+            collection=collection.name,
+            content_type=meta.get("content_type"),
+            file_size=meta.get("file_size"),
+            file_hash=meta.get("file_hash"),
+            upload_time=meta.get("upload_time") or meta.get("timestamp"),
+        )
+        added += 1
+    if added:
+        logger.info("Catalogued %d files already stored in '%s'", added, collection.name)
+    return added
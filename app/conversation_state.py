@@ -0,0 +1,112 @@
+# Conversation state (e.g. each tenant's last answer, used by refinements like "in 100 words")
+
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from app.cache import TTLCache
+
+# Defaults; can be overridden by env vars
+CONVERSATION_STATE_BACKEND = os.environ.get("CONVERSATION_STATE_BACKEND", "sqlite")  # sqlite | memory
+CONVERSATION_STATE_PATH = os.environ.get("CONVERSATION_STATE_PATH", "./conversation_state.db")
+CONVERSATION_STATE_MAX_KEYS = int(os.environ.get("CONVERSATION_STATE_MAX_KEYS", "10000"))
+CONVERSATION_STATE_TTL = float(os.environ.get("CONVERSATION_STATE_TTL", "86400"))
+
+
+class MemoryStateStore:
+    """Per-process store. State is lost on restart and not visible to other workers."""
+
+    def __init__(self, maxsize=CONVERSATION_STATE_MAX_KEYS, ttl=CONVERSATION_STATE_TTL):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, value):
+        self._cache.set(key, value)
+
+    def delete(self, key):
+        self._cache.pop(key)
+
+    def stats(self):
+        return {"backend": "memory", **self._cache.stats()}
+
+
+class SQLiteStateStore:
+    """
+    Store in a local SQLite file shared by every worker on the host. Entries expire `ttl`
+    seconds after they are written; past `maxsize` keys the least recently written are dropped.
+    """
+
+    def __init__(self, path=CONVERSATION_STATE_PATH, maxsize=CONVERSATION_STATE_MAX_KEYS, ttl=CONVERSATION_STATE_TTL):
+        self.path = str(Path(path).expanduser().resolve())
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS state (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_state_updated ON state(updated_at)")
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM state WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO state (key, value, updated_at, expires_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now + self.ttl),
+            )
+            self._conn.execute("DELETE FROM state WHERE expires_at <= ?", (now,))
+            self._conn.execute(
+                "DELETE FROM state WHERE key IN (SELECT key FROM state ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+                (self.maxsize,),
+            )
+            self._conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM state WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM state WHERE expires_at > ?", (time.time(),)).fetchone()[0]
+        return {"backend": "sqlite", "path": self.path, "size": size, "maxsize": self.maxsize}
+
+
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_state_store():
+    """Return the process-wide conversation state store selected by CONVERSATION_STATE_BACKEND."""
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            if CONVERSATION_STATE_BACKEND == "memory":
+                _STORE = MemoryStateStore()
+            elif CONVERSATION_STATE_BACKEND == "sqlite":
+                _STORE = SQLiteStateStore()
+            else:
+                raise ValueError(f"Unknown CONVERSATION_STATE_BACKEND: {CONVERSATION_STATE_BACKEND!r}")
+        return _STORE
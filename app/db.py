@@ -2,9 +2,12 @@ from sqlmodel import SQLModel, create_engine, Session
 import os
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./rag_platform.db")
-engine = create_engine(DATABASE_URL, echo=True)
+# SQL statement logging is for local debugging only; set DB_ECHO=1 to enable
+DB_ECHO = os.getenv("DB_ECHO", "0").lower() in ("1", "true", "yes")
+engine = create_engine(DATABASE_URL, echo=DB_ECHO)
 
 def init_db():
+    from app import models  # noqa: F401 -- register tables before create_all
     SQLModel.metadata.create_all(engine)
 
 def get_session():
@@ -0,0 +1,233 @@
+# Shared async LLM client: one chat model per process, bounded concurrency, timeouts, single-flight
+
+import asyncio
+import os
+import threading
+import time
+
+# Defaults; can be overridden by env vars
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "gemini")  # gemini | fake
+FAKE_LLM_LATENCY_MS = float(os.environ.get("FAKE_LLM_LATENCY_MS", "500"))
+FAKE_LLM_RESPONSE = os.environ.get("FAKE_LLM_RESPONSE", "")
+FAKE_LLM_STREAM_CHUNKS = int(os.environ.get("FAKE_LLM_STREAM_CHUNKS", "8"))
+LLM_MODEL = os.environ.get("LLM_MODEL", "gemini-2.0-flash")
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "8"))
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", "60"))
+
+
+class LLMTimeoutError(RuntimeError):
+    """Raised when an LLM call (including time queued for a slot) exceeds its timeout."""
+
+
+class FakeChatModel:
+    """
+    Offline stand-in for Gemini (LLM_BACKEND=fake). Answers every prompt with a canned
+    response after `latency_ms`; streaming spreads that latency over `stream_chunks` pieces.
+    """
+
+    def __init__(self, latency_ms=FAKE_LLM_LATENCY_MS, response=FAKE_LLM_RESPONSE, stream_chunks=FAKE_LLM_STREAM_CHUNKS):
+        self.latency_ms = latency_ms
+        self.response = response
+        self.stream_chunks = max(1, stream_chunks)
+
+    def _answer(self, prompt):
+        return self.response or f"Fake answer for a {len(prompt)}-character prompt."
+
+    def _pieces(self, prompt):
+        words = self._answer(prompt).split(" ")
+        size = -(-len(words) // self.stream_chunks)
+        return [" ".join(words[i:i + size]) + (" " if i + size < len(words) else "") for i in range(0, len(words), size)]
+
+    def invoke(self, prompt):
+        from langchain_core.messages import AIMessage
+        time.sleep(self.latency_ms / 1000.0)
+        return AIMessage(content=self._answer(prompt))
+
+    async def ainvoke(self, prompt):
+        from langchain_core.messages import AIMessage
+        await asyncio.sleep(self.latency_ms / 1000.0)
+        return AIMessage(content=self._answer(prompt))
+
+    def stream(self, prompt):
+        from langchain_core.messages import AIMessageChunk
+        pieces = self._pieces(prompt)
+        for piece in pieces:
+            time.sleep(self.latency_ms / 1000.0 / len(pieces))
+            yield AIMessageChunk(content=piece)
+
+    async def astream(self, prompt):
+        from langchain_core.messages import AIMessageChunk
+        pieces = self._pieces(prompt)
+        for piece in pieces:
+            await asyncio.sleep(self.latency_ms / 1000.0 / len(pieces))
+            yield AIMessageChunk(content=piece)
+
+
+def get_llm():
+    """
+    Build the chat model selected by LLM_BACKEND. For Gemini the key comes from
+    GOOGLE_API_KEY (loaded from .env when not in the environment).
+    """
+    if LLM_BACKEND == "fake":
+        return FakeChatModel()
+    if LLM_BACKEND != "gemini":
+        raise ValueError(f"Unknown LLM_BACKEND: {LLM_BACKEND!r}")
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    api_key = os.environ.get("GOOGLE_API_KEY")
+    if not api_key:
+        # Try to load from .env if not in env
+        from dotenv import load_dotenv
+        load_dotenv()
+        api_key = os.environ.get("GOOGLE_API_KEY")
+
+    if not api_key:
+        raise ValueError("GOOGLE_API_KEY not found. Please set it in .env or environment variables.")
+
+    return ChatGoogleGenerativeAI(model=LLM_MODEL, google_api_key=api_key, temperature=0)
+
+
+def _text(message):
+    return message.content if hasattr(message, "content") else str(message)
+
+
+def _mark_retrieved(future):
+    # Nobody may be waiting on a shared result; don't log its exception as unretrieved
+    if not future.cancelled():
+        future.exception()
+
+
+class LLMClient:
+    """
+    Async front for one shared chat model. At most `max_concurrency` calls run at once per
+    process; each call, including time spent waiting for a slot, is limited to `timeout`
+    seconds. Identical prompts already in flight are not sent again: later callers await
+    the first call's result (a coalesced stream yields the whole answer as one piece).
+    """
+
+    def __init__(self, llm_factory=get_llm, max_concurrency=LLM_MAX_CONCURRENCY, timeout=LLM_TIMEOUT):
+        self._factory = llm_factory
+        self._llm = None
+        self._llm_lock = threading.Lock()
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._loop = None
+        self._semaphore = None
+        self._inflight = {}
+        self.calls = 0
+        self.coalesced = 0
+        self.timeouts = 0
+
+    @property
+    def llm(self):
+        with self._llm_lock:
+            if self._llm is None:
+                self._llm = self._factory()
+            return self._llm
+
+    def _loop_state(self):
+        # Semaphores and futures belong to one event loop; start fresh if the loop changed
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._inflight = {}
+        return loop, self._semaphore, self._inflight
+
+    def _share(self, inflight, prompt, future):
+        inflight[prompt] = future
+
+        def done(f):
+            if inflight.get(prompt) is f:
+                del inflight[prompt]
+            _mark_retrieved(f)
+
+        future.add_done_callback(done)
+
+    async def _invoke(self, semaphore, prompt):
+        async with semaphore:
+            self.calls += 1
+            return _text(await self.llm.ainvoke(prompt))
+
+    async def ainvoke(self, prompt, timeout=None):
+        """Return the answer text for `prompt`."""
+        _, semaphore, inflight = self._loop_state()
+        shared = inflight.get(prompt)
+        if shared is not None:
+            self.coalesced += 1
+            return await asyncio.shield(shared)
+        timeout = timeout or self.timeout
+        task = asyncio.ensure_future(self._timed(self._invoke(semaphore, prompt), timeout))
+        self._share(inflight, prompt, task)
+        # Shielded so a caller that goes away doesn't cancel the call for the others
+        return await asyncio.shield(task)
+
+    async def _timed(self, coro, remaining, timeout=None):
+        try:
+            return await asyncio.wait_for(coro, remaining)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise LLMTimeoutError(f"LLM call timed out after {timeout or remaining}s")
+
+    async def astream(self, prompt, timeout=None):
+        """Yield the answer text for `prompt` piece by piece as the model produces it."""
+        loop, semaphore, inflight = self._loop_state()
+        shared = inflight.get(prompt)
+        if shared is not None:
+            self.coalesced += 1
+            yield await asyncio.shield(shared)
+            return
+        timeout = timeout or self.timeout
+        deadline = loop.time() + timeout
+        result = loop.create_future()
+        self._share(inflight, prompt, result)
+        parts = []
+        try:
+            await self._timed(semaphore.acquire(), timeout)
+            try:
+                self.calls += 1
+                stream = self.llm.astream(prompt).__aiter__()
+                while True:
+                    try:
+                        chunk = await self._timed(stream.__anext__(), deadline - loop.time(), timeout)
+                    except StopAsyncIteration:
+                        break
+                    text = _text(chunk)
+                    if text:
+                        parts.append(text)
+                        yield text
+            finally:
+                semaphore.release()
+        except Exception as e:
+            if not result.done():
+                result.set_exception(e)
+            raise
+        except BaseException:
+            # The streaming caller went away; callers sharing this prompt get an error, not a hang
+            if not result.done():
+                result.set_exception(RuntimeError("Shared LLM stream was abandoned"))
+            raise
+        result.set_result("".join(parts))
+
+    def stats(self):
+        return {
+            "max_concurrency": self.max_concurrency,
+            "timeout": self.timeout,
+            "in_flight": len(self._inflight),
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "timeouts": self.timeouts,
+        }
+
+
+_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def get_llm_client():
+    """Return the process-wide LLMClient."""
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            _CLIENT = LLMClient()
+        return _CLIENT
@@ -0,0 +1,120 @@
+# Logging setup: levels per module, sampled debug records and a non-blocking queue handler
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+
+from app import metrics
+
+# Defaults; can be overridden by env vars
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+# Per-logger overrides, e.g. "app.api.ask=DEBUG,app.processing.document_processing=WARNING"
+LOG_LEVELS = os.environ.get("LOG_LEVELS", "")
+# Fraction of DEBUG records kept once DEBUG is enabled (1.0 keeps all)
+LOG_DEBUG_SAMPLE_RATE = float(os.environ.get("LOG_DEBUG_SAMPLE_RATE", "1.0"))
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")  # text | json
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+
+# Attributes every LogRecord has; anything else was passed through `extra=`
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class DebugSampler(logging.Filter):
+    """Keep every INFO+ record and a random `rate` fraction of DEBUG records."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or self.rate >= 1.0 or random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the standard fields plus any `extra=` fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update({k: v for k, v in vars(record).items() if k not in _RECORD_FIELDS})
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Never block the caller: when the queue is full the record is dropped and counted."""
+
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _DroppingQueueHandler.dropped += 1
+
+
+_LISTENER = None
+_CONFIGURE_LOCK = threading.Lock()
+
+
+def _parse_levels(spec):
+    levels = {}
+    for item in spec.split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(force=False):
+    """
+    Route all logging through a bounded queue to one background writer on stderr. Levels come
+    from LOG_LEVEL and the per-logger LOG_LEVELS overrides; DEBUG records are sampled at
+    LOG_DEBUG_SAMPLE_RATE. Safe to call more than once (later calls are no-ops unless forced).
+    """
+    global _LISTENER
+    with _CONFIGURE_LOCK:
+        if _LISTENER is not None and not force:
+            return
+        if _LISTENER is not None:
+            _LISTENER.stop()
+
+        stream = logging.StreamHandler(sys.stderr)
+        if LOG_FORMAT == "json":
+            stream.setFormatter(JsonFormatter())
+        else:
+            stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+        handler = _DroppingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+        handler.addFilter(DebugSampler(LOG_DEBUG_SAMPLE_RATE))
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(LOG_LEVEL.upper())
+        for name, level in _parse_levels(LOG_LEVELS).items():
+            logging.getLogger(name).setLevel(level)
+
+        _LISTENER = logging.handlers.QueueListener(handler.queue, stream, respect_handler_level=True)
+        _LISTENER.start()
+
+
+@atexit.register
+def _flush_on_exit():
+    with _CONFIGURE_LOCK:
+        if _LISTENER is not None:
+            _LISTENER.stop()
+
+
+metrics.register_stats("rag_logging", "Logging pipeline.", lambda: {"dropped_records": _DroppingQueueHandler.dropped})
@@ -1,6 +1,11 @@
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from app.logging_config import configure_logging
+configure_logging()
+from app import metrics
 from app.api import ingest, ask
 from app.db import init_db
+from app.vectorstore import chromadb_store
 from fastapi.middleware.cors import CORSMiddleware
 
 app = FastAPI()
@@ -16,6 +21,10 @@ app.add_middleware(
 @app.on_event("startup")
 def on_startup():
     init_db()
+    # Create the shared Chroma client (and check the persist dir) once per process
+    chromadb_store.get_chroma_client()
+    # Build the per-process BM25 indexes in the background; /ask is vector-only until they are ready
+    chromadb_store.warm_lexical_indexes()
 
 app.include_router(ingest.router, prefix="/api")
 app.include_router(ask.router, prefix="/api")
@@ -23,3 +32,8 @@ app.include_router(ask.router, prefix="/api")
 @app.get("/")
 def root():
     return {"message": "Universal Enterprise RAG Platform API is running."}
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Stage timings, request/ingest counters and cache statistics in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
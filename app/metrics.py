@@ -0,0 +1,211 @@
+# Process-local counters, histograms and stage timing spans, rendered in the Prometheus text format
+
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Label every series with the tenant; set to 0 to collapse tenants when there are very many
+METRICS_TENANT_LABELS = os.environ.get("METRICS_TENANT_LABELS", "1").lower() not in ("0", "false", "no")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# File types reported as themselves; anything else is "other"
+_FILE_TYPES = {"pdf", "docx", "doc", "xlsx", "xls", "pptx", "ppt", "csv", "txt", "html", "htm", "xml",
+               "json", "md", "rtf", "png", "jpg", "jpeg", "tiff", "bmp", "gif", "url"}
+
+_REGISTRY = []
+_COLLECTORS = []
+_REGISTRY_LOCK = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with a fixed set of label names."""
+
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(values.items())]
+
+
+class Histogram:
+    """Cumulative-bucket histogram of observed values (seconds, by convention)."""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            series["counts"][bisect.bisect_left(self.buckets, value)] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        with self._lock:
+            series = {key: {"counts": list(s["counts"]), "sum": s["sum"], "count": s["count"]}
+                      for key, s in self._series.items()}
+        lines = []
+        for key, s in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), s["counts"]):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(s['sum'])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {s['count']}")
+        return lines
+
+
+def counter(name, documentation, labelnames=()):
+    metric = Counter(name, documentation, labelnames)
+    with _REGISTRY_LOCK:
+        _REGISTRY.append(metric)
+    return metric
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    metric = Histogram(name, documentation, labelnames, buckets)
+    with _REGISTRY_LOCK:
+        _REGISTRY.append(metric)
+    return metric
+
+
+def register_stats(prefix, documentation, stats_fn):
+    """
+    Export the numeric fields of a component's stats() dict (cache sizes, hit counts, ...)
+    as gauges named <prefix>_<field>, read at scrape time.
+    """
+    with _REGISTRY_LOCK:
+        _COLLECTORS.append((prefix, documentation, stats_fn))
+
+
+STAGE_SECONDS = histogram(
+    "rag_stage_duration_seconds", "Time spent in each pipeline stage.", ("stage", "file_type", "tenant")
+)
+STAGE_ERRORS = counter(
+    "rag_stage_errors_total", "Pipeline stage executions that raised.", ("stage", "file_type", "tenant")
+)
+INGESTED_DOCUMENTS = counter(
+    "rag_ingested_documents_total", "Documents processed by ingestion, by outcome.", ("file_type", "tenant", "status")
+)
+INGESTED_CHUNKS = counter(
+    "rag_ingested_chunks_total", "Chunks produced by ingestion.", ("file_type", "tenant")
+)
+ASK_REQUESTS = counter(
+    "rag_ask_requests_total", "Ask requests by how they were answered.", ("tenant", "path")
+)
+
+
+def tenant_label(tenant_id):
+    if not METRICS_TENANT_LABELS:
+        return "all"
+    return tenant_id or "default"
+
+
+def file_type_label(filename=None, content_type=None):
+    """Short, bounded file type label from the file extension (falling back to the content type)."""
+    ext = os.path.splitext(filename or "")[1].lstrip(".").lower()
+    if ext in _FILE_TYPES:
+        return ext
+    content_type = (content_type or "").lower()
+    for file_type, marker in (("pdf", "pdf"), ("docx", "wordprocessingml"), ("xlsx", "spreadsheetml"),
+                              ("pptx", "presentationml"), ("csv", "csv"), ("html", "html"), ("json", "json"),
+                              ("md", "markdown"), ("xml", "xml"), ("txt", "text/plain")):
+        if marker in content_type:
+            return file_type
+    return "other"
+
+
+@contextmanager
+def span(stage, file_type="", tenant=None):
+    """Time a pipeline stage into rag_stage_duration_seconds, counting it in rag_stage_errors_total if it raises."""
+    labels = {"stage": stage, "file_type": file_type, "tenant": tenant_label(tenant)}
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(**labels)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, **labels)
+
+
+def render():
+    """Return every metric in the Prometheus text exposition format (version 0.0.4)."""
+    with _REGISTRY_LOCK:
+        metrics = list(_REGISTRY)
+        collectors = list(_COLLECTORS)
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(metric.render())
+    for prefix, documentation, stats_fn in collectors:
+        try:
+            stats = stats_fn() or {}
+        except Exception as e:
+            logger.warning("Failed to collect %s: %s", prefix, e)
+            continue
+        for field, value in stats.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f"{prefix}_{field}"
+            lines.append(f"# HELP {name} {documentation} ({field})")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
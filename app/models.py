@@ -1,4 +1,4 @@
-from sqlmodel import SQLModel, Field
+from sqlmodel import SQLModel, Field, Column, String, UniqueConstraint
 from typing import Optional
 
 class Tenant(SQLModel, table=True):
@@ -11,7 +11,27 @@ class User(SQLModel, table=True):
     tenant_id: int
 
 class Document(SQLModel, table=True):
+    __table_args__ = (UniqueConstraint("tenant_id", "filename"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    tenant_id: int
-    filename: str
-    metadata: Optional[str] = None
+    tenant_id: str = Field(default="default", index=True)
+    filename: str = Field(index=True)
+    # `metadata` is reserved on SQLAlchemy models, so the attribute is renamed but the column is not
+    extra_metadata: Optional[str] = Field(default=None, sa_column=Column("metadata", String, nullable=True))
+    collection: Optional[str] = None
+    content_type: Optional[str] = None
+    file_size: Optional[int] = None
+    file_hash: Optional[str] = None
+    upload_time: Optional[str] = None
+    chunk_count: int = 0
+    # JSON list of the Chroma IDs of this document's chunks
+    chunk_ids: str = "[]"
+
+class IngestJobRecord(SQLModel, table=True):
+    # Latest state of a background ingestion job, so any worker can answer a status poll
+    job_id: str = Field(primary_key=True)
+    status: str = Field(default="queued", index=True)
+    created_at: float = Field(default=0.0, index=True)
+    updated_at: float = 0.0
+    # JSON of IngestJob.to_dict()
+    state: str = "{}"
@@ -0,0 +1,208 @@
+# Single-pass, streaming recursive text chunker with character offsets
+
+import os
+import re
+from collections import deque
+
+from app.processing.context_builder import estimate_tokens
+
+# Defaults; can be overridden by env vars
+CHUNK_SIZE = int(os.environ.get("CHUNK_SIZE", "1000"))
+CHUNK_OVERLAP = int(os.environ.get("CHUNK_OVERLAP", "200"))
+CHUNK_UNIT = os.environ.get("CHUNK_UNIT", "chars")  # chars | tokens
+
+SEPARATORS = ["\n\n", "\n", ". ", " ", ""]
+
+_LENGTH_FUNCTIONS = {"chars": len, "tokens": estimate_tokens}
+# Small stream items (lines, cells) are batched into blocks of about this many characters
+_BLOCK_CHARS = 65536
+
+
+class _Merger:
+    """
+    Packs consecutive small pieces into chunks of at most chunk_size, carrying up to
+    `overlap` worth of trailing pieces into the next chunk. Pieces are (start, text, length).
+    """
+
+    def __init__(self, chunk_size, overlap):
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.pieces = deque()
+        self.total = 0
+
+    def add(self, piece):
+        """Add a piece; returns the chunk it completed, if any."""
+        length = piece[2]
+        chunk = None
+        if self.total + length > self.chunk_size and self.pieces:
+            chunk = _join(self.pieces)
+            while self.total > self.overlap or (self.total + length > self.chunk_size and self.total > 0):
+                self.total -= self.pieces.popleft()[2]
+        self.pieces.append(piece)
+        self.total += length
+        return chunk
+
+    def flush(self):
+        """Close the current group; returns its last chunk, if any."""
+        chunk = _join(self.pieces) if self.pieces else None
+        self.pieces.clear()
+        self.total = 0
+        return chunk
+
+
+def _join(pieces):
+    # Pieces are contiguous, so the chunk is a slice of the source; strip it and fix the offsets
+    text = "".join(piece[1] for piece in pieces)
+    stripped = text.strip()
+    if not stripped:
+        return None
+    start = pieces[0][0] + len(text) - len(text.lstrip())
+    return {"text": stripped, "start": start, "end": start + len(stripped)}
+
+
+class _Level:
+    """
+    Splits a stream of text on one separator (kept at the start of each piece). Pieces
+    under chunk_size go to the merger; a piece that reaches chunk_size is streamed into
+    a child level that splits it on the next separator, exactly as a recursive splitter
+    would, without waiting for the piece to end.
+    """
+
+    def __init__(self, separators, chunk_size, overlap, length_function, start=0):
+        self.separator = separators[0]
+        self.rest = separators[1:]
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.length = length_function
+        self.pattern = re.compile(re.escape(self.separator)) if self.separator else None
+        self.merger = _Merger(chunk_size, overlap)
+        self.child = None
+        self.buffer = ""
+        self.start = start  # source offset of buffer[0]
+        self.scan = 0  # no separator starts before this position in the buffer
+        self.next_check = chunk_size
+
+    def _make_child(self):
+        return _Level(self.rest, self.chunk_size, self.overlap, self.length, self.start)
+
+    def _piece(self, start, text):
+        if not text:
+            return
+        length = self.length(text)
+        if length < self.chunk_size:
+            chunk = self.merger.add((start, text, length))
+            if chunk:
+                yield chunk
+            return
+        chunk = self.merger.flush()
+        if chunk:
+            yield chunk
+        if not self.rest:
+            # Nothing finer to split on: the piece becomes its own (oversized) chunk
+            yield {"text": text, "start": start, "end": start + len(text)}
+            return
+        child = _Level(self.rest, self.chunk_size, self.overlap, self.length, start)
+        yield from child.feed(text)
+        yield from child.close()
+
+    def feed(self, text):
+        if self.pattern is None:
+            # Last resort: every character is a piece
+            for i, char in enumerate(text):
+                yield from self._piece(self.start + i, char)
+            self.start += len(text)
+            return
+        buffer = self.buffer + text
+        begin, scan = 0, self.scan
+        for match in self.pattern.finditer(buffer, self.scan):
+            end = match.start()
+            if self.child is None and begin < end:
+                # Common case inlined: a finished piece that fits goes straight to the merger
+                piece = buffer[begin:end]
+                length = self.length(piece)
+                if length < self.chunk_size:
+                    chunk = self.merger.add((self.start, piece, length))
+                    if chunk:
+                        yield chunk
+                    self.start += end - begin
+                    begin, scan = end, match.end()
+                    continue
+            yield from self._end_piece(buffer[begin:end])
+            begin, scan = end, match.end()
+        if begin:
+            self.next_check = self.chunk_size
+        self.buffer = buffer[begin:]
+        # Resume after the last separator, leaving room for one split across feeds
+        self.scan = max(scan - begin, len(self.buffer) - len(self.separator) + 1, 0)
+        yield from self._spill()
+
+    def _end_piece(self, piece):
+        if self.child is not None:
+            yield from self.child.feed(piece)
+            yield from self.child.close()
+            self.child = None
+        else:
+            yield from self._piece(self.start, piece)
+        self.start += len(piece)
+        self.next_check = self.chunk_size
+
+    def _spill(self):
+        # Text of the unfinished piece that can no longer be part of a separator match
+        safe = len(self.buffer) - len(self.separator) + 1
+        if safe <= 0 or not self.rest:
+            return
+        if self.child is None:
+            if len(self.buffer) < self.next_check:
+                return
+            if self.length(self.buffer) < self.chunk_size:
+                self.next_check = len(self.buffer) * 2
+                return
+            # Long enough that it will be split further: start streaming it down now
+            chunk = self.merger.flush()
+            if chunk:
+                yield chunk
+            self.child = self._make_child()
+        head, self.buffer = self.buffer[:safe], self.buffer[safe:]
+        yield from self.child.feed(head)
+        self.start += safe
+        self.scan = max(0, self.scan - safe)
+
+    def close(self):
+        if self.pattern is not None:
+            yield from self._end_piece(self.buffer)
+            self.buffer = ""
+        chunk = self.merger.flush()
+        if chunk:
+            yield chunk
+
+
+def iter_chunks(source, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP, unit=CHUNK_UNIT, separators=None):
+    """
+    Lazily split `source` (a string, or an iterable of strings such as pages or file
+    blocks read one at a time) into overlapping chunks that respect document structure:
+    paragraphs first, then lines, sentences, words and finally characters.
+
+    Produces the same chunks as LangChain's RecursiveCharacterTextSplitter with the same
+    separators (kept at the start of each piece, chunks stripped), in a single pass over
+    the input. `unit` sizes chunks in characters or estimated tokens. Each chunk is a dict
+    with its text and the [start, end) character offsets of that text in the source.
+    """
+    if chunk_size <= 0:
+        raise ValueError(f"chunk_size must be > 0, got {chunk_size}")
+    if overlap < 0 or overlap > chunk_size:
+        raise ValueError(f"overlap must be between 0 and chunk_size ({chunk_size}), got {overlap}")
+    if unit not in _LENGTH_FUNCTIONS:
+        raise ValueError(f"Unknown chunk unit: {unit!r}")
+    level = _Level(list(separators or SEPARATORS), chunk_size, overlap, _LENGTH_FUNCTIONS[unit])
+    if isinstance(source, str):
+        source = (source,)
+    block, size = [], 0
+    for text in source:
+        block.append(text)
+        size += len(text)
+        if size >= _BLOCK_CHARS:
+            yield from level.feed("".join(block))
+            block, size = [], 0
+    if size:
+        yield from level.feed("".join(block))
+    yield from level.close()
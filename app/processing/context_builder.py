@@ -0,0 +1,129 @@
+# Packs retrieved chunks into an LLM prompt context under a token budget
+
+import os
+
+from app.vectorstore.lexical_index import tokenize
+
+# Defaults; can be overridden by env vars
+CONTEXT_MMR_LAMBDA = float(os.environ.get("CONTEXT_MMR_LAMBDA", "0.7"))
+# Candidates at least this similar to an already selected chunk are dropped as near-duplicates
+CONTEXT_DUP_THRESHOLD = float(os.environ.get("CONTEXT_DUP_THRESHOLD", "0.9"))
+CHARS_PER_TOKEN = 4
+# Shorter shared prefix/suffix runs between adjacent chunks are treated as coincidence
+_MIN_OVERLAP_CHARS = 20
+
+
+def estimate_tokens(text):
+    """Rough token count for budget purposes (about four characters per token)."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _source(meta):
+    return meta.get("filename") or meta.get("url") if meta else None
+
+
+def _similarity(a, b):
+    """Jaccard similarity of two token sets."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _overlap(prev, nxt):
+    """Length of the longest suffix of `prev` that `nxt` starts with."""
+    for start in range(max(0, len(prev) - len(nxt)), len(prev) - _MIN_OVERLAP_CHARS + 1):
+        if nxt.startswith(prev[start:]):
+            return len(prev) - start
+    return 0
+
+
+def _mmr_order(token_sets, mmr_lambda, dup_threshold):
+    """
+    Order candidates by maximal marginal relevance. Relevance comes from the retrieval rank;
+    redundancy is the highest token similarity to anything already chosen.
+    """
+    n = len(token_sets)
+    relevance = [1.0 - i / n for i in range(n)]
+    redundancy = [0.0] * n
+    remaining = list(range(n))
+    order = []
+    while remaining:
+        best = max(remaining, key=lambda i: mmr_lambda * relevance[i] - (1 - mmr_lambda) * redundancy[i])
+        remaining.remove(best)
+        if redundancy[best] >= dup_threshold:
+            continue
+        order.append(best)
+        for i in remaining:
+            redundancy[i] = max(redundancy[i], _similarity(token_sets[i], token_sets[best]))
+    return order
+
+
+def build_context(docs, metadatas=None, max_tokens=2000, mmr_lambda=CONTEXT_MMR_LAMBDA,
+                  dup_threshold=CONTEXT_DUP_THRESHOLD):
+    """
+    Select and pack retrieved chunks (best first) into at most `max_tokens` estimated tokens.
+    Near-duplicates are dropped, the rest are diversified with MMR, and consecutive chunks
+    of the same source are merged into one passage with their shared overlap removed.
+    Returns the context text plus the chunks and metadatas that made it in.
+    """
+    metadatas = list(metadatas or [{}] * len(docs))
+    candidates = [i for i, doc in enumerate(docs) if doc and doc.strip()]
+    token_sets = [set(tokenize(docs[i])) for i in candidates]
+    order = [candidates[j] for j in _mmr_order(token_sets, mmr_lambda, dup_threshold)]
+
+    # (source, chunk index) -> candidate, to find each chunk's neighbours
+    positions = {}
+    for i in order:
+        meta = metadatas[i] or {}
+        if _source(meta) is not None and isinstance(meta.get("chunk"), int):
+            positions[(_source(meta), meta["chunk"])] = i
+
+    def neighbour(i, step):
+        meta = metadatas[i] or {}
+        return positions.get((_source(meta), meta["chunk"] + step)) if isinstance(meta.get("chunk"), int) else None
+
+    budget = max_tokens * CHARS_PER_TOKEN
+    selected, strip, used = [], {}, 0
+    for i in order:
+        prev, nxt = neighbour(i, -1), neighbour(i, 1)
+        head = _overlap(docs[prev], docs[i]) if prev in strip else 0
+        tail = _overlap(docs[i], docs[nxt]) if nxt in strip else 0
+        cost = len(docs[i]) - head - tail
+        if used + cost > budget:
+            continue
+        selected.append(i)
+        strip[i] = head
+        if tail:
+            strip[nxt] = tail
+        used += cost
+    if not selected and order:
+        # Even the best chunk is over budget on its own: send a truncated copy of it
+        i = order[0]
+        selected, strip = [i], {i: 0}
+        docs = list(docs)
+        docs[i] = docs[i][:budget]
+
+    # Merge runs of consecutive chunks; each passage keeps the rank of its best member
+    passages, placed = [], set()
+    for i in selected:
+        if i in placed:
+            continue
+        start = i
+        while neighbour(start, -1) in strip:
+            start = neighbour(start, -1)
+        parts, member = [], start
+        while member in strip:
+            parts.append(docs[member][strip[member]:])
+            placed.add(member)
+            member = neighbour(member, 1)
+        passages.append("".join(parts).strip())
+
+    text = "\n\n".join(passages)
+    return {
+        "text": text,
+        "passages": passages,
+        "chunks": [docs[i] for i in selected],
+        "metadatas": [metadatas[i] for i in selected],
+        "tokens": estimate_tokens(text),
+        "dropped": len(docs) - len(selected),
+    }
@@ -1,8 +1,24 @@
 # Document normalization, chunking, embedding for multiple file formats
 
+import codecs
+import csv
 import io
+import itertools
+import logging
 import mimetypes
+import multiprocessing
+import os
 import re
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from app.logging_config import configure_logging
+from app.processing.chunking import CHUNK_OVERLAP, CHUNK_SIZE, iter_chunks
+
+logger = logging.getLogger(__name__)
 
 # Import libraries with graceful fallbacks
 try:
@@ -35,11 +51,6 @@ try:
 except ImportError:
     Presentation = None
 
-try:
-    import pandas as pd
-except ImportError:
-    pd = None
-
 try:
     import chardet
 except ImportError:
@@ -71,154 +82,359 @@ def detect_encoding(doc_bytes):
     return 'utf-8'
 
 
-def extract_text_from_pdf(doc_bytes):
-    """Extract text from PDF using pdfplumber (preferred) or PyPDF2 fallback."""
-    text_parts = []
-    
-    # Try pdfplumber first (better for complex PDFs)
-    if pdfplumber:
+# Documents arrive either as bytes or as the path of a spooled upload; extractors whose
+# libraries can read from a file are given one instead of a copy of the bytes
+TEXT_SAMPLE_BYTES = 65536
+TEXT_BLOCK_BYTES = 1 << 20
+
+
+def _open_source(source):
+    """Binary file object for a document given as bytes or as a file path."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    return open(source, "rb")
+
+
+def _read_source(source):
+    """The document's bytes, for extractors that need all of them at once."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source)
+    with open(source, "rb") as f:
+        return f.read()
+
+
+def _sample_encoding(f):
+    """Detect the encoding of a binary file from its first TEXT_SAMPLE_BYTES, then rewind it."""
+    encoding = detect_encoding(f.read(TEXT_SAMPLE_BYTES)) or "utf-8"
+    f.seek(0)
+    if encoding.lower() == "ascii":
+        # A pure-ASCII sample says nothing about the rest; UTF-8 is a superset
+        return "utf-8"
+    try:
+        return codecs.lookup(encoding).name
+    except LookupError:
+        return "utf-8"
+
+
+def _iter_text_file(path):
+    """
+    Decode a text file block by block. The encoding is detected from the first
+    TEXT_SAMPLE_BYTES rather than the whole file; undecodable bytes are dropped.
+    """
+    with open(path, "rb") as f:
+        encoding = _sample_encoding(f)
+        decoder = codecs.getincrementaldecoder(encoding)(errors="ignore")
+        logger.debug("Decoding text file with %s encoding", encoding)
+        while True:
+            block = f.read(TEXT_BLOCK_BYTES)
+            text = decoder.decode(block, final=not block)
+            if text:
+                yield text
+            if not block:
+                return
+
+
+# Page-sharded PDF extraction; can be overridden by env vars
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get("PDF_PARALLEL_MIN_PAGES", "40"))
+PDF_PAGES_PER_SHARD = int(os.environ.get("PDF_PAGES_PER_SHARD", "20"))
+PDF_MAX_WORKERS = int(os.environ.get("PDF_MAX_WORKERS", str(os.cpu_count() or 1)))
+
+_PDF_POOL = None
+_PDF_POOL_LOCK = threading.Lock()
+
+
+def _get_pdf_pool():
+    """Long-lived process pool for PDF shards (spawned, so it is safe to create from worker threads)."""
+    global _PDF_POOL
+    with _PDF_POOL_LOCK:
+        if _PDF_POOL is None:
+            _PDF_POOL = ProcessPoolExecutor(
+                max_workers=PDF_MAX_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=configure_logging,
+            )
+        return _PDF_POOL
+
+
+def _reset_pdf_pool():
+    global _PDF_POOL
+    with _PDF_POOL_LOCK:
+        if _PDF_POOL is not None:
+            _PDF_POOL.shutdown(wait=False, cancel_futures=True)
+        _PDF_POOL = None
+
+
+def _count_pdf_pages(source):
+    """Return the page count, or None if neither backend can open the file."""
+    if PyPDF2:
         try:
-            with pdfplumber.open(io.BytesIO(doc_bytes)) as pdf:
-                for page_num, page in enumerate(pdf.pages):
-                    try:
-                        page_text = page.extract_text()
-                        if page_text and page_text.strip():
-                            text_parts.append(f"[Page {page_num + 1}]\n{page_text.strip()}")
-                            print(f"[PDF] pdfplumber: Page {page_num + 1} extracted {len(page_text)} chars")
-                    except Exception as e:
-                        print(f"[PDF WARNING] Page {page_num + 1} failed: {e}")
-                        
-                if text_parts:
-                    return "\n\n".join(text_parts)
+            with _open_source(source) as f:
+                return len(PyPDF2.PdfReader(f).pages)
         except Exception as e:
-            print(f"[PDF] pdfplumber failed: {e}, trying PyPDF2...")
-    
-    # Fallback to PyPDF2
-    if PyPDF2:
+            logger.warning("PyPDF2 could not count pages: %s", e)
+    if pdfplumber:
         try:
-            reader = PyPDF2.PdfReader(io.BytesIO(doc_bytes))
-            for page_num, page in enumerate(reader.pages):
-                try:
-                    page_text = page.extract_text()
-                    if page_text and page_text.strip():
-                        lines = [line.strip() for line in page_text.split('\n') if line.strip()]
-                        cleaned_text = '\n'.join(lines)
-                        text_parts.append(f"[Page {page_num + 1}]\n{cleaned_text}")
-                        print(f"[PDF] PyPDF2: Page {page_num + 1} extracted {len(cleaned_text)} chars")
-                except Exception as e:
-                    print(f"[PDF WARNING] Page {page_num + 1} failed: {e}")
-                    
-            if text_parts:
-                return "\n\n".join(text_parts)
+            with _open_source(source) as f, pdfplumber.open(f) as pdf:
+                return len(pdf.pages)
         except Exception as e:
-            print(f"[PDF] PyPDF2 failed: {e}")
-    
+            logger.warning("pdfplumber could not count pages: %s", e)
     return None
 
 
-def extract_text_from_excel(doc_bytes, filetype):
-    """Extract text from Excel files (.xlsx, .xls)."""
-    text_parts = []
-    
-    # Try openpyxl for .xlsx
-    if filetype in ["application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", ".xlsx"] and openpyxl:
-        try:
-            wb = openpyxl.load_workbook(io.BytesIO(doc_bytes), data_only=True)
-            for sheet_name in wb.sheetnames:
-                sheet = wb[sheet_name]
-                text_parts.append(f"\n[Sheet: {sheet_name}]\n")
-                
-                # Extract all rows
-                for row in sheet.iter_rows(values_only=True):
-                    # Filter out None values and convert to strings
-                    row_data = [str(cell) for cell in row if cell is not None]
-                    if row_data:
-                        text_parts.append(" | ".join(row_data))
-                        
-            if text_parts:
-                print(f"[EXCEL] Extracted from {len(wb.sheetnames)} sheets using openpyxl")
-                return "\n".join(text_parts)
-        except Exception as e:
-            print(f"[EXCEL] openpyxl failed: {e}")
-    
-    # Try pandas for both .xlsx and .xls
-    if pd:
+def _iter_pdf_page_range(source, start, end):
+    """
+    Yield (page_number, text) for the non-empty pages in [start, end).
+    The backend is chosen per page: pdfplumber first, PyPDF2 only for pages pdfplumber
+    could not read.
+    """
+    plumber_doc = None
+    pypdf_reader = None
+    pypdf_file = None
+
+    if pdfplumber:
         try:
-            # Try reading all sheets
-            excel_file = pd.ExcelFile(io.BytesIO(doc_bytes))
-            text_parts = []
-            
-            for sheet_name in excel_file.sheet_names:
-                df = pd.read_excel(excel_file, sheet_name=sheet_name)
-                text_parts.append(f"\n[Sheet: {sheet_name}]\n")
-                text_parts.append(df.to_string(index=False))
-                
-            if text_parts:
-                print(f"[EXCEL] Extracted from {len(excel_file.sheet_names)} sheets using pandas")
-                return "\n".join(text_parts)
+            plumber_doc = pdfplumber.open(source if isinstance(source, str) else io.BytesIO(source))
         except Exception as e:
-            print(f"[EXCEL] pandas failed: {e}")
-    
-    # Try xlrd for old .xls files
-    if filetype in ["application/vnd.ms-excel", ".xls"] and xlrd:
+            logger.warning("pdfplumber failed: %s, trying PyPDF2", e)
+
+    try:
+        for page_num in range(start, end):
+            page_text = None
+            if plumber_doc is not None:
+                try:
+                    extracted = plumber_doc.pages[page_num].extract_text()
+                    if extracted and extracted.strip():
+                        page_text = extracted.strip()
+                        logger.debug("pdfplumber: page %d extracted %d chars", page_num + 1, len(extracted))
+                except Exception as e:
+                    logger.warning("pdfplumber page %d failed: %s", page_num + 1, e)
+
+            if page_text is None and PyPDF2:
+                try:
+                    if pypdf_reader is None:
+                        pypdf_file = _open_source(source)
+                        pypdf_reader = PyPDF2.PdfReader(pypdf_file)
+                    extracted = pypdf_reader.pages[page_num].extract_text()
+                    if extracted and extracted.strip():
+                        lines = [line.strip() for line in extracted.split('\n') if line.strip()]
+                        page_text = '\n'.join(lines)
+                        logger.debug("PyPDF2: page %d extracted %d chars", page_num + 1, len(page_text))
+                except Exception as e:
+                    logger.warning("PyPDF2 page %d failed: %s", page_num + 1, e)
+
+            if page_text:
+                yield page_num + 1, page_text
+    finally:
+        if plumber_doc is not None:
+            plumber_doc.close()
+        if pypdf_file is not None:
+            pypdf_file.close()
+
+
+def _extract_pdf_page_range(source, start, end):
+    """List form of _iter_pdf_page_range. Runs in a worker process, so it must stay a top-level function."""
+    return list(_iter_pdf_page_range(source, start, end))
+
+
+def iter_pdf_pages(source, parallel=None):
+    """
+    Yield (page_number, text) for the non-empty pages of a PDF (bytes or a file path; workers
+    given a path open the file themselves instead of receiving a copy), in page order.
+    With parallel=True (or None and at least PDF_PARALLEL_MIN_PAGES pages) the document is
+    split into PDF_PAGES_PER_SHARD-page ranges that are extracted across a process pool,
+    with at most two shards per worker in flight so results never pile up ahead of the reader.
+    """
+    page_count = _count_pdf_pages(source)
+    if not page_count:
+        return
+
+    if parallel is None:
+        parallel = page_count >= PDF_PARALLEL_MIN_PAGES and PDF_MAX_WORKERS > 1
+    shard = max(1, PDF_PAGES_PER_SHARD)
+    ranges = [(start, min(start + shard, page_count)) for start in range(0, page_count, shard)]
+
+    resume_at = 0
+    if parallel and len(ranges) > 1:
+        window = deque()
+        pending = iter(ranges)
         try:
-            wb = xlrd.open_workbook(file_contents=doc_bytes)
-            for sheet in wb.sheets():
-                text_parts.append(f"\n[Sheet: {sheet.name}]\n")
-                for row_idx in range(sheet.nrows):
-                    row_data = [str(cell.value) for cell in sheet.row(row_idx) if cell.value]
-                    if row_data:
-                        text_parts.append(" | ".join(row_data))
-                        
-            if text_parts:
-                print(f"[EXCEL] Extracted from {wb.nsheets} sheets using xlrd")
-                return "\n".join(text_parts)
-        except Exception as e:
-            print(f"[EXCEL] xlrd failed: {e}")
-    
+            pool = _get_pdf_pool()
+            for start, end in itertools.islice(pending, max(1, PDF_MAX_WORKERS) * 2):
+                window.append((end, pool.submit(_extract_pdf_page_range, source, start, end)))
+            while window:
+                end, future = window[0]
+                pages = future.result()
+                window.popleft()
+                for start, next_end in itertools.islice(pending, 1):
+                    window.append((next_end, pool.submit(_extract_pdf_page_range, source, start, next_end)))
+                yield from pages
+                resume_at = end
+            logger.info("Extracted %d PDF pages in %d parallel shards", page_count, len(ranges))
+            return
+        except BrokenProcessPool as e:
+            logger.warning("PDF process pool failed: %s, extracting pages %d+ serially", e, resume_at + 1)
+            _reset_pdf_pool()
+        finally:
+            for _, future in window:
+                future.cancel()
+
+    yield from _iter_pdf_page_range(source, resume_at, page_count)
+
+
+def extract_text_from_pdf(source, parallel=None):
+    """
+    Extract text from PDF, choosing pdfplumber or PyPDF2 per page (see iter_pdf_pages).
+    Output keeps the `[Page N]` order whether or not pages were extracted in parallel.
+    """
+    pages = list(iter_pdf_pages(source, parallel))
+    if pages:
+        return "\n\n".join(f"[Page {page_num}]\n{text}" for page_num, text in pages)
+    return None
+
+
+# Spreadsheet and CSV rows are grouped into units of about this many characters, each
+# repeating the header row, so a chunk of rows still says what its columns are
+EXCEL_GROUP_CHARS = int(os.environ.get("EXCEL_GROUP_CHARS", str(CHUNK_SIZE * 9 // 10)))
+CSV_GROUP_CHARS = int(os.environ.get("CSV_GROUP_CHARS", str(EXCEL_GROUP_CHARS)))
+
+_ZIP_MAGIC = b"PK\x03\x04"
+
+
+def _iter_excel_sheets(source):
+    """
+    Yield (sheet_name, rows) for each worksheet, rows being lazy sequences of cell values.
+    .xlsx files (zip containers) are streamed with openpyxl in read-only mode; legacy .xls
+    files are read with xlrd, loading one sheet at a time. Each workbook is parsed once.
+    """
+    with _open_source(source) as f:
+        is_xlsx = f.read(len(_ZIP_MAGIC)) == _ZIP_MAGIC
+
+    if is_xlsx:
+        if not openpyxl:
+            raise ImportError("openpyxl is required to read .xlsx files")
+        with _open_source(source) as f:
+            wb = openpyxl.load_workbook(f, read_only=True, data_only=True)
+            try:
+                for sheet in wb.worksheets:
+                    yield sheet.title, sheet.iter_rows(values_only=True)
+            finally:
+                wb.close()
+        return
+
+    if not xlrd:
+        raise ImportError("xlrd is required to read .xls files")
+    if isinstance(source, str):
+        wb = xlrd.open_workbook(filename=source, on_demand=True)
+    else:
+        wb = xlrd.open_workbook(file_contents=bytes(source), on_demand=True)
+    try:
+        for index in range(wb.nsheets):
+            sheet = wb.sheet_by_index(index)
+            yield sheet.name, (sheet.row_values(row_idx) for row_idx in range(sheet.nrows))
+            wb.unload_sheet(index)
+    finally:
+        wb.release_resources()
+
+
+def _iter_row_groups(rows, title=None, group_chars=EXCEL_GROUP_CHARS):
+    """
+    Yield table rows as text groups: an optional "[title]" line, the header row (the first
+    non-empty row) and as many following rows as fit in `group_chars`. Cells are joined
+    with " | "; empty cells inside a row stay as empty placeholders so every value lines
+    up with its header column, and only trailing empty cells are dropped.
+    """
+    prefix = None
+    group = []
+    size = 0
+    for row in rows:
+        row_data = ["" if cell is None else str(cell) for cell in row]
+        while row_data and row_data[-1] == "":
+            row_data.pop()
+        if not row_data:
+            continue
+        row_text = " | ".join(row_data)
+        if prefix is None:
+            prefix = f"[{title}]\n{row_text}" if title else row_text
+            size = len(prefix)
+            continue
+        if group and size + 1 + len(row_text) > group_chars:
+            yield prefix + "\n" + "\n".join(group)
+            group = []
+            size = len(prefix)
+        group.append(row_text)
+        size += 1 + len(row_text)
+    if prefix is not None:
+        yield "\n".join([prefix] + group)
+
+
+def iter_excel_row_groups(source, group_chars=EXCEL_GROUP_CHARS):
+    """
+    Yield the text of a workbook as row groups, each starting with "[Sheet: name]" and the
+    sheet's header row (see _iter_row_groups).
+    """
+    sheets = 0
+    for sheet_name, rows in _iter_excel_sheets(source):
+        sheets += 1
+        yield from _iter_row_groups(rows, f"Sheet: {sheet_name}", group_chars)
+    logger.debug("Read %d Excel sheets", sheets)
+
+
+def extract_text_from_excel(source, filetype=None):
+    """Extract text from Excel files (.xlsx, .xls) as header-carrying row groups."""
+    try:
+        text = "\n\n".join(iter_excel_row_groups(source))
+        return text or None
+    except Exception as e:
+        logger.warning("Excel extraction failed: %s", e)
     return None
 
 
-def extract_text_from_powerpoint(doc_bytes):
+def _iter_powerpoint_slides(source):
+    """Yield the text parts of each slide of a .pptx, one list per slide."""
+    with _open_source(source) as f:
+        prs = Presentation(f)
+    for slide_num, slide in enumerate(prs.slides, 1):
+        text_parts = [f"\n[Slide {slide_num}]\n"]
+
+        for shape in slide.shapes:
+            if hasattr(shape, "text") and shape.text:
+                text_parts.append(shape.text.strip())
+
+            # Extract text from tables
+            if shape.has_table:
+                table = shape.table
+                for row in table.rows:
+                    row_text = " | ".join([cell.text.strip() for cell in row.cells if cell.text])
+                    if row_text:
+                        text_parts.append(row_text)
+        yield text_parts
+
+
+def extract_text_from_powerpoint(source):
     """Extract text from PowerPoint files (.pptx)."""
     if not Presentation:
         return None
         
     try:
-        prs = Presentation(io.BytesIO(doc_bytes))
-        text_parts = []
-        
-        for slide_num, slide in enumerate(prs.slides, 1):
-            text_parts.append(f"\n[Slide {slide_num}]\n")
-            
-            for shape in slide.shapes:
-                if hasattr(shape, "text") and shape.text:
-                    text_parts.append(shape.text.strip())
-                    
-                # Extract text from tables
-                if shape.has_table:
-                    table = shape.table
-                    for row in table.rows:
-                        row_text = " | ".join([cell.text.strip() for cell in row.cells if cell.text])
-                        if row_text:
-                            text_parts.append(row_text)
-        
+        slides = list(_iter_powerpoint_slides(source))
+        text_parts = [part for parts in slides for part in parts]
         if text_parts:
-            print(f"[PPTX] Extracted from {len(prs.slides)} slides")
+            logger.debug("Extracted %d PowerPoint slides", len(slides))
             return "\n".join(text_parts)
     except Exception as e:
-        print(f"[PPTX] Extraction failed: {e}")
+        logger.warning("PowerPoint extraction failed: %s", e)
     
     return None
 
 
-def extract_text_from_word(doc_bytes):
+def extract_text_from_word(source):
     """Extract text from Word documents (.docx)."""
     if not DocxDocument:
         return None
         
     try:
-        doc = DocxDocument(io.BytesIO(doc_bytes))
+        with _open_source(source) as f:
+            doc = DocxDocument(f)
         text_parts = []
         
         # Extract paragraphs
@@ -234,39 +450,43 @@ def extract_text_from_word(doc_bytes):
                     text_parts.append(row_text)
         
         if text_parts:
-            print(f"[DOCX] Extracted {len(text_parts)} paragraphs/rows")
+            logger.debug("Extracted %d Word paragraphs/rows", len(text_parts))
             return "\n".join(text_parts)
     except Exception as e:
-        print(f"[DOCX] Extraction failed: {e}")
+        logger.warning("Word extraction failed: %s", e)
     
     return None
 
 
-def extract_text_from_csv(doc_bytes):
-    """Extract text from CSV files."""
-    if not pd:
-        # Fallback to basic parsing
-        try:
-            text = doc_bytes.decode(detect_encoding(doc_bytes))
-            return text
-        except Exception:
-            return None
-    
+def iter_csv_row_groups(source, group_chars=CSV_GROUP_CHARS):
+    """
+    Yield a CSV file as header-carrying row groups (see _iter_row_groups), parsing it
+    record by record with the csv module instead of loading a DataFrame.
+    """
+    # Allow very long fields (e.g. embedded documents) instead of failing on them
+    csv.field_size_limit(min(sys.maxsize, 2 ** 31 - 1))
+    with _open_source(source) as raw:
+        encoding = _sample_encoding(raw)
+        with io.TextIOWrapper(raw, encoding=encoding, errors="ignore", newline="") as f:
+            yield from _iter_row_groups(csv.reader(f), group_chars=group_chars)
+
+
+def extract_text_from_csv(source):
+    """Extract text from CSV files as header-carrying row groups."""
     try:
-        df = pd.read_csv(io.BytesIO(doc_bytes))
-        text = df.to_string(index=False)
-        print(f"[CSV] Extracted {len(df)} rows, {len(df.columns)} columns")
-        return text
+        return "\n\n".join(iter_csv_row_groups(source)) or None
     except Exception as e:
-        print(f"[CSV] pandas failed: {e}, trying basic text extraction")
+        logger.warning("CSV parsing failed: %s, trying basic text extraction", e)
         try:
+            doc_bytes = _read_source(source)
             return doc_bytes.decode(detect_encoding(doc_bytes))
         except Exception:
             return None
 
 
-def extract_text_from_html(doc_bytes):
+def extract_text_from_html(source):
     """Extract text from HTML files."""
+    doc_bytes = _read_source(source)
     if not BeautifulSoup:
         # Fallback: return raw text
         try:
@@ -280,108 +500,138 @@ def extract_text_from_html(doc_bytes):
         for script in soup(["script", "style"]):
             script.decompose()
         text = soup.get_text(separator='\n', strip=True)
-        print(f"[HTML] Extracted {len(text)} chars")
+        logger.debug("Extracted %d chars of HTML text", len(text))
         return text
     except Exception as e:
-        print(f"[HTML] Extraction failed: {e}")
+        logger.warning("HTML extraction failed: %s", e)
         try:
             return doc_bytes.decode(detect_encoding(doc_bytes))
         except Exception:
             return None
 
 
-def extract_text_from_image(doc_bytes):
+def extract_text_from_image(source):
     """Extract text from images using OCR."""
     if not HAS_OCR:
         return "Error: OCR not available. Install Pillow and pytesseract to process images."
     
     try:
-        image = Image.open(io.BytesIO(doc_bytes))
-        text = pytesseract.image_to_string(image)
-        print(f"[OCR] Extracted {len(text)} chars from image")
+        with _open_source(source) as f, Image.open(f) as image:
+            text = pytesseract.image_to_string(image)
+        logger.debug("OCR extracted %d chars from image", len(text))
         return text if text.strip() else "Error: No text found in image."
     except Exception as e:
-        print(f"[OCR] Failed: {e}")
+        logger.warning("OCR failed: %s", e)
         return f"Error: Image OCR failed - {str(e)}"
 
 
-def normalize_document(doc_bytes, filetype):
+# (kind, markers) checked in order against the lowercased content type or extension
+_DOCUMENT_KINDS = [
+    ("pdf", ["pdf", "application/pdf"]),
+    ("word", ["docx", "wordprocessingml", "msword"]),
+    ("excel", ["xlsx", "xls", "spreadsheetml", "ms-excel"]),
+    ("powerpoint", ["pptx", "ppt", "presentationml", "ms-powerpoint"]),
+    ("csv", ["csv", "text/csv"]),
+    ("html", ["html", "htm", "text/html"]),
+    ("image", ["image/", "png", "jpg", "jpeg", "tiff", "bmp", "gif"]),
+    ("json", ["json", "application/json"]),
+    ("xml", ["xml", "application/xml", "text/xml"]),
+    ("markdown", ["markdown", ".md", "text/markdown"]),
+]
+
+PDF_ERROR = "Error: Unable to extract text from PDF. The file may be corrupted or image-based."
+CSV_ERROR = "Error: Unable to extract text from CSV file."
+EXCEL_ERROR = "Error: Unable to extract text from Excel file. Make sure openpyxl (or xlrd for .xls) is installed."
+POWERPOINT_ERROR = "Error: Unable to extract text from PowerPoint file. Make sure python-pptx is installed."
+
+
+def document_kind(filetype):
+    """Map a content type or extension to the extractor family used for it ("text" if none matches)."""
+    filetype_lower = filetype.lower() if isinstance(filetype, str) else ""
+    for kind, markers in _DOCUMENT_KINDS:
+        if any(x in filetype_lower for x in markers):
+            return kind
+    return "text"
+
+
+def normalize_document(source, filetype):
     """
-    Extracts text from various file formats.
+    Extracts text from various file formats, given as bytes or as a file path.
     Supports: PDF, DOCX, XLSX, XLS, PPTX, CSV, TXT, HTML, XML, JSON, MD, RTF, and images.
     """
-    print(f"[NORMALIZE] Processing filetype: {filetype}")
+    logger.debug("Normalizing filetype: %s", filetype)
     
-    # Normalize filetype
-    filetype_lower = filetype.lower() if isinstance(filetype, str) else ""
+    kind = document_kind(filetype)
     
     # PDF files
-    if any(x in filetype_lower for x in ["pdf", "application/pdf"]):
-        result = extract_text_from_pdf(doc_bytes)
+    if kind == "pdf":
+        result = extract_text_from_pdf(source)
         if result:
             return result
-        return "Error: Unable to extract text from PDF. The file may be corrupted or image-based."
+        return PDF_ERROR
     
     # Word documents
-    elif any(x in filetype_lower for x in ["docx", "wordprocessingml", "msword"]):
-        result = extract_text_from_word(doc_bytes)
+    elif kind == "word":
+        result = extract_text_from_word(source)
         if result:
             return result
         return "Error: Unable to extract text from Word document."
     
     # Excel files
-    elif any(x in filetype_lower for x in ["xlsx", "xls", "spreadsheetml", "ms-excel"]):
-        result = extract_text_from_excel(doc_bytes, filetype_lower)
+    elif kind == "excel":
+        result = extract_text_from_excel(source)
         if result:
             return result
-        return "Error: Unable to extract text from Excel file. Make sure openpyxl or pandas is installed."
+        return EXCEL_ERROR
     
     # PowerPoint files
-    elif any(x in filetype_lower for x in ["pptx", "ppt", "presentationml", "ms-powerpoint"]):
-        result = extract_text_from_powerpoint(doc_bytes)
+    elif kind == "powerpoint":
+        result = extract_text_from_powerpoint(source)
         if result:
             return result
-        return "Error: Unable to extract text from PowerPoint file. Make sure python-pptx is installed."
+        return POWERPOINT_ERROR
     
     # CSV files
-    elif any(x in filetype_lower for x in ["csv", "text/csv"]):
-        result = extract_text_from_csv(doc_bytes)
+    elif kind == "csv":
+        result = extract_text_from_csv(source)
         if result:
             return result
-        return "Error: Unable to extract text from CSV file."
+        return CSV_ERROR
     
     # HTML files
-    elif any(x in filetype_lower for x in ["html", "htm", "text/html"]):
-        result = extract_text_from_html(doc_bytes)
+    elif kind == "html":
+        result = extract_text_from_html(source)
         if result:
             return result
         return "Error: Unable to extract text from HTML file."
     
     # Image files
-    elif any(x in filetype_lower for x in ["image/", "png", "jpg", "jpeg", "tiff", "bmp", "gif"]):
-        return extract_text_from_image(doc_bytes)
+    elif kind == "image":
+        return extract_text_from_image(source)
     
     # JSON files
-    elif any(x in filetype_lower for x in ["json", "application/json"]):
+    elif kind == "json":
         try:
             import json
+            doc_bytes = _read_source(source)
             data = json.loads(doc_bytes.decode(detect_encoding(doc_bytes)))
             text = json.dumps(data, indent=2)
-            print(f"[JSON] Extracted {len(text)} chars")
+            logger.debug("Extracted %d chars of JSON", len(text))
             return text
         except Exception as e:
-            print(f"[JSON] Failed: {e}")
+            logger.warning("JSON parsing failed: %s", e)
             return f"Error: JSON parsing failed - {str(e)}"
     
     # XML files
-    elif any(x in filetype_lower for x in ["xml", "application/xml", "text/xml"]):
-        result = extract_text_from_html(doc_bytes)  # BeautifulSoup can parse XML too
+    elif kind == "xml":
+        result = extract_text_from_html(source)  # BeautifulSoup can parse XML too
         if result:
             return result
     
     # Markdown files
-    elif any(x in filetype_lower for x in ["markdown", ".md", "text/markdown"]):
+    elif kind == "markdown":
         try:
+            doc_bytes = _read_source(source)
             text = doc_bytes.decode(detect_encoding(doc_bytes))
             if markdown:
                 # Convert to HTML first, then extract text
@@ -391,65 +641,119 @@ def normalize_document(doc_bytes, filetype):
                     return soup.get_text(separator='\n', strip=True)
             return text
         except Exception as e:
-            print(f"[MARKDOWN] Failed: {e}")
+            logger.warning("Markdown conversion failed: %s", e)
     
     # Plain text files (default fallback)
     else:
+        doc_bytes = _read_source(source)
         try:
             encoding = detect_encoding(doc_bytes)
             text = doc_bytes.decode(encoding)
-            print(f"[TEXT] Decoded with {encoding} encoding")
+            logger.debug("Decoded text with %s encoding", encoding)
             return text
         except Exception as e:
-            print(f"[TEXT] Decoding failed: {e}")
+            logger.warning("Text decoding failed: %s", e)
             try:
                 return doc_bytes.decode(errors="ignore")
             except Exception:
                 return "Error: Unable to decode file as text."
 
 
-def chunk_document(text, chunk_size=1000, overlap=200):
+def iter_document_text(source, filetype):
     """
-    Splits text into overlapping chunks using RecursiveCharacterTextSplitter.
-    This respects document structure (paragraphs, sentences) for better context.
+    Yield a document's normalized text in pieces (PDF pages, spreadsheet and CSV row groups,
+    PowerPoint slides) as they are extracted. The pieces concatenate to exactly what
+    normalize_document() returns, so chunking the stream gives the same chunks. Plain-text
+    files given by path are decoded block by block; other formats come back as one piece.
+    An extraction error is raised, never cut short into partial text; only a CSV that fails
+    before its first row group falls back to being indexed as plain text.
     """
-    from langchain_text_splitters import RecursiveCharacterTextSplitter
-    
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=overlap,
-        separators=["\n\n", "\n", ". ", " ", ""],
-        length_function=len,
-    )
-    
-    chunks = text_splitter.split_text(text)
-    print(f"[INGEST DEBUG] Total chunks created: {len(chunks)}")
-    return chunks
+    kind = document_kind(filetype)
+    if kind == "pdf":
+        units = (f"[Page {page_num}]\n{text}" for page_num, text in iter_pdf_pages(source))
+        separator, error = "\n\n", PDF_ERROR
+    elif kind == "csv":
+        units = iter_csv_row_groups(source)
+        separator, error = "\n\n", CSV_ERROR
+    elif kind == "excel":
+        units = iter_excel_row_groups(source)
+        separator, error = "\n\n", EXCEL_ERROR
+    elif kind == "powerpoint" and Presentation:
+        units = ("\n".join(parts) for parts in _iter_powerpoint_slides(source))
+        separator, error = "\n", POWERPOINT_ERROR
+    elif kind == "text" and isinstance(source, str):
+        yield from _iter_text_file(source)
+        return
+    else:
+        normalized = normalize_document(source, filetype)
+        yield normalized.decode(errors="ignore") if isinstance(normalized, bytes) else str(normalized)
+        return
 
+    empty = True
+    try:
+        for unit in units:
+            yield unit if empty else separator + unit
+            empty = False
+    except Exception as e:
+        if kind != "csv" or not empty:
+            # Partial text would be stored as the whole document and its other chunks deleted
+            logger.error("Streaming %s extraction failed: %s", kind, e)
+            raise
+        logger.warning("CSV parsing failed (%s); indexing it as plain text", e)
+    if empty:
+        # A CSV that cannot be parsed is still worth indexing as plain text
+        yield normalize_document(source, filetype) if kind == "csv" else error
 
 
-def embed_chunks(chunks):
+def chunk_document(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP, with_offsets=False):
     """
-    Calls Ollama's embedding API via LangChain for real embeddings.
+    Splits text into overlapping chunks that respect document structure (paragraphs,
+    lines, sentences) for better context. With `with_offsets`, returns the chunk dicts
+    (text plus start/end character offsets) instead of plain strings.
     """
-    # Prefer the official langchain-ollama if available
-    try:
-        from langchain_ollama import OllamaEmbeddings as OllamaEmbeddingsOfficial
-        embedder = OllamaEmbeddingsOfficial(model="all-minilm:22m")
-    except Exception:
-        try:
-            from langchain_community.embeddings import OllamaEmbeddings
-            embedder = OllamaEmbeddings(model="all-minilm:22m")
-        except Exception:
-            raise ImportError("Please install langchain-ollama or langchain-community: pip install langchain-ollama or pip install langchain-community")
-    
+    chunks = list(iter_chunks(text, chunk_size, overlap))
+    logger.debug("Total chunks created: %d", len(chunks))
+    if with_offsets:
+        return chunks
+    return [chunk["text"] for chunk in chunks]
+
+
+def embed_chunks(chunks, progress=None):
+    """
+    Embeds chunks through the shared Ollama embedding service (batched, concurrent, retried).
+    Chunks already in the persistent embedding cache are not sent to Ollama.
+    `progress(done, total)` is called as batches complete.
+    """
+    from app.processing.embedding_cache import get_embedding_cache
+    from app.processing.embedding_service import get_embedding_service
+
     try:
-        embeddings = embedder.embed_documents(chunks)
+        service = get_embedding_service()
+        cache = get_embedding_cache()
+        if cache is None:
+            embeddings = service.embed_documents(chunks, progress=progress)
+        else:
+            embeddings = cache.get_many(service.model, chunks)
+            missing = list(dict.fromkeys(chunk for chunk, vector in zip(chunks, embeddings) if vector is None))
+            cached_count = sum(vector is not None for vector in embeddings)
+            logger.info("Embedding cache: %d of %d chunks cached, embedding %d unique chunks",
+                        cached_count, len(chunks), len(missing))
+            if missing:
+                # Progress counts input chunks; a unique text may stand for several duplicate inputs
+                uncached = len(chunks) - cached_count
+                vectors = service.embed_documents(
+                    missing,
+                    progress=(lambda done, total: progress(cached_count + uncached * done // total, len(chunks)))
+                    if progress else None,
+                )
+                cache.put_many(service.model, missing, vectors)
+                fresh = dict(zip(missing, vectors))
+                embeddings = [vector if vector is not None else fresh[chunk] for chunk, vector in zip(chunks, embeddings)]
         if embeddings and len(embeddings) > 0:
-            print(f"[DEBUG] Embedding dimension: {len(embeddings[0])}")
+            logger.debug("Embedding dimension: %d", len(embeddings[0]))
         else:
-            print("[DEBUG] No embeddings generated.")
+            logger.debug("No embeddings generated")
         return embeddings
     except Exception as e:
-        print(f"[EMBED ERROR] Failed to generate embeddings: {e}")
+        logger.error("Failed to generate embeddings: %s", e)
         raise e
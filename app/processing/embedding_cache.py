@@ -0,0 +1,162 @@
+# Content-addressed, on-disk embedding cache (SQLite + packed float32 vectors)
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from pathlib import Path
+
+from app import metrics
+
+# Defaults; can be overridden by env vars
+EMBED_CACHE_ENABLED = os.environ.get("EMBED_CACHE_ENABLED", "1") not in ("0", "false", "False")
+EMBED_CACHE_PATH = os.environ.get("EMBED_CACHE_PATH", "./embedding_cache.db")
+EMBED_CACHE_MAX_MB = float(os.environ.get("EMBED_CACHE_MAX_MB", "512"))
+
+
+def cache_key(model, text):
+    """Key a vector by (model name, SHA-256 of the chunk text)."""
+    digest = hashlib.sha256(text.encode("utf-8", errors="surrogatepass")).hexdigest()
+    return f"{model}:{digest}"
+
+
+def _pack(vector):
+    return array("f", vector).tobytes()
+
+
+def _unpack(blob):
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+class EmbeddingCache:
+    """
+    Persistent map of (model, text hash) -> embedding. Vectors are stored as packed float32
+    blobs. When the stored vectors exceed `max_bytes`, the least recently used entries are
+    evicted. Hit/miss/eviction counters are kept for the lifetime of the process.
+    """
+
+    def __init__(self, path=EMBED_CACHE_PATH, max_bytes=int(EMBED_CACHE_MAX_MB * 1024 * 1024)):
+        self.path = str(Path(path).expanduser().resolve())
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    def _select_in(self, select, keys):
+        """Run `select ... WHERE key IN (...)` over keys in slices that stay under SQLite's parameter limit."""
+        rows = []
+        for i in range(0, len(keys), 500):
+            part = keys[i:i + 500]
+            placeholders = ",".join("?" * len(part))
+            rows.extend(self._conn.execute(f"{select} WHERE key IN ({placeholders})", part).fetchall())
+        return rows
+
+    def get_many(self, model, texts):
+        """Return a list aligned with `texts`: the cached vector, or None on a miss."""
+        keys = [cache_key(model, text) for text in texts]
+        found = {}
+        with self._lock:
+            rows = self._select_in("SELECT key, vector FROM embeddings", list(dict.fromkeys(keys)))
+            found.update((key, _unpack(blob)) for key, blob in rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?", [(now, key) for key in found]
+                )
+                self._conn.commit()
+            results = [found.get(key) for key in keys]
+            hit_count = sum(1 for r in results if r is not None)
+            self.hits += hit_count
+            self.misses += len(results) - hit_count
+        return results
+
+    def put_many(self, model, texts, vectors):
+        rows = {}
+        now = time.time()
+        for text, vector in zip(texts, vectors):
+            blob = _pack(vector)
+            rows[cache_key(model, text)] = (blob, len(blob))
+        if not rows:
+            return
+        with self._lock:
+            existing = sum(size for _, size in self._select_in("SELECT key, size FROM embeddings", list(rows)))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, size, last_access) VALUES (?, ?, ?, ?)",
+                [(key, blob, size, now) for key, (blob, size) in rows.items()],
+            )
+            self._total_bytes += sum(size for _, size in rows.values()) - existing
+            self._evict_locked()
+            self._conn.commit()
+
+    def _evict_locked(self):
+        """Drop least recently used entries until the cache is back under max_bytes."""
+        while self._total_bytes > self.max_bytes:
+            victims = self._conn.execute(
+                "SELECT key, size FROM embeddings ORDER BY last_access ASC LIMIT 256"
+            ).fetchall()
+            if not victims:
+                self._total_bytes = 0
+                break
+            freed = 0
+            batch = []
+            for key, size in victims:
+                batch.append((key,))
+                freed += size
+                if self._total_bytes - freed <= self.max_bytes:
+                    break
+            self._conn.executemany("DELETE FROM embeddings WHERE key = ?", batch)
+            self._total_bytes -= freed
+            self.evictions += len(batch)
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_embedding_cache():
+    """Return the process-wide EmbeddingCache, or None when EMBED_CACHE_ENABLED is off."""
+    global _CACHE
+    if not EMBED_CACHE_ENABLED:
+        return None
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = EmbeddingCache()
+        return _CACHE
+
+
+def _cache_stats():
+    cache = get_embedding_cache()
+    return cache.stats() if cache is not None else {}
+
+
+metrics.register_stats("rag_embedding_cache", "Persistent embedding cache.", _cache_stats)
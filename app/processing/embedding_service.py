@@ -0,0 +1,164 @@
+# Shared embedding client: one long-lived embedder, batched and concurrent requests
+
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Defaults; can be overridden by env vars
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "ollama")  # ollama | fake
+EMBED_FAKE_DIM = int(os.environ.get("EMBED_FAKE_DIM", "384"))
+EMBED_FAKE_LATENCY_MS = float(os.environ.get("EMBED_FAKE_LATENCY_MS", "0"))
+EMBED_MODEL = os.environ.get("EMBED_MODEL", "all-minilm:22m")
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "64"))
+EMBED_MAX_CONCURRENCY = int(os.environ.get("EMBED_MAX_CONCURRENCY", "4"))
+EMBED_QUERY_CONCURRENCY = int(os.environ.get("EMBED_QUERY_CONCURRENCY", "2"))
+EMBED_MAX_RETRIES = int(os.environ.get("EMBED_MAX_RETRIES", "3"))
+EMBED_RETRY_BACKOFF = float(os.environ.get("EMBED_RETRY_BACKOFF", "0.5"))
+
+
+def _build_embedder(model):
+    """Create the LangChain Ollama embedder, preferring the official langchain-ollama package."""
+    try:
+        from langchain_ollama import OllamaEmbeddings as OllamaEmbeddingsOfficial
+        return OllamaEmbeddingsOfficial(model=model)
+    except Exception:
+        try:
+            from langchain_community.embeddings import OllamaEmbeddings
+            return OllamaEmbeddings(model=model)
+        except Exception:
+            raise ImportError("Please install langchain-ollama or langchain-community: pip install langchain-ollama or pip install langchain-community")
+
+
+class FakeEmbeddings:
+    """
+    Deterministic offline stand-in for the Ollama embedder (EMBEDDING_BACKEND=fake). Each text
+    becomes a normalized vector of hashed word counts, so texts sharing words get similar
+    vectors. `latency_ms` is slept once per call to mimic a remote embedder.
+    """
+
+    def __init__(self, dim=EMBED_FAKE_DIM, latency_ms=EMBED_FAKE_LATENCY_MS):
+        self.dim = dim
+        self.latency_ms = latency_ms
+
+    def _vector(self, text):
+        vector = [0.0] * self.dim
+        for word in re.findall(r"\w+", text.lower()):
+            h = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+            vector[h % self.dim] += 1.0 if (h >> 32) & 1 else -1.0
+        norm = math.sqrt(sum(x * x for x in vector))
+        if not norm:
+            vector[0] = norm = 1.0
+        return [x / norm for x in vector]
+
+    def embed_documents(self, texts):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class EmbeddingService:
+    """
+    Long-lived embedding client. The underlying embedder (and its HTTP connection pool) is
+    created once and reused. Documents are split into batches of `batch_size`; at most
+    `max_concurrency` batches are in flight at a time across all callers, and a failed batch
+    is retried on its own without re-sending the batches that already succeeded. Queries run on
+    their own small pool (`query_concurrency`) so questions never queue behind bulk uploads.
+    """
+
+    def __init__(self, model=EMBED_MODEL, batch_size=EMBED_BATCH_SIZE, max_concurrency=EMBED_MAX_CONCURRENCY,
+                 max_retries=EMBED_MAX_RETRIES, retry_backoff=EMBED_RETRY_BACKOFF, embedder=None,
+                 query_concurrency=EMBED_QUERY_CONCURRENCY):
+        self.model = model
+        self.batch_size = max(1, batch_size)
+        self.max_retries = max(0, max_retries)
+        self.retry_backoff = retry_backoff
+        self._embedder = embedder if embedder is not None else _build_embedder(model)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix="embed")
+        self._query_executor = ThreadPoolExecutor(max_workers=max(1, query_concurrency), thread_name_prefix="embed-query")
+
+    def _embed_batch(self, texts):
+        attempt = 0
+        while True:
+            try:
+                vectors = self._embedder.embed_documents(texts)
+                if len(vectors) != len(texts):
+                    raise RuntimeError(f"Embedder returned {len(vectors)} vectors for {len(texts)} texts")
+                return vectors
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.retry_backoff * (2 ** attempt)
+                attempt += 1
+                logger.warning("Batch of %d failed (%s); retry %d/%d in %.1fs", len(texts), e, attempt, self.max_retries, delay)
+                time.sleep(delay)
+
+    def _batches(self, texts):
+        return [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+
+    def embed_documents(self, texts, progress=None):
+        """
+        Embed a list of texts, returning vectors in input order.
+        `progress(done, total)` is called as batches complete.
+        """
+        texts = list(texts)
+        if not texts:
+            return []
+        futures = [self._executor.submit(self._embed_batch, batch) for batch in self._batches(texts)]
+        embeddings = []
+        for future in futures:
+            embeddings.extend(future.result())
+            if progress:
+                progress(len(embeddings), len(texts))
+        return embeddings
+
+    def embed_query(self, text):
+        return self._query_executor.submit(self._embed_batch, [text]).result()[0]
+
+    async def aembed_documents(self, texts, progress=None):
+        """Async variant of embed_documents; batches run on the shared pool without blocking the event loop."""
+        texts = list(texts)
+        if not texts:
+            return []
+        loop = asyncio.get_running_loop()
+        futures = [loop.run_in_executor(self._executor, self._embed_batch, batch) for batch in self._batches(texts)]
+        embeddings = []
+        for future in futures:
+            embeddings.extend(await future)
+            if progress:
+                progress(len(embeddings), len(texts))
+        return embeddings
+
+    async def aembed_query(self, text):
+        loop = asyncio.get_running_loop()
+        vectors = await loop.run_in_executor(self._query_executor, self._embed_batch, [text])
+        return vectors[0]
+
+
+_SERVICE = None
+_SERVICE_LOCK = threading.Lock()
+
+
+def get_embedding_service():
+    """Return the process-wide EmbeddingService (backend chosen by EMBEDDING_BACKEND), creating it on first use."""
+    global _SERVICE
+    with _SERVICE_LOCK:
+        if _SERVICE is None:
+            if EMBEDDING_BACKEND == "fake":
+                # Own model name so fake vectors never mix with real ones in the embedding cache
+                _SERVICE = EmbeddingService(model=f"fake-{EMBED_FAKE_DIM}", embedder=FakeEmbeddings())
+            elif EMBEDDING_BACKEND == "ollama":
+                _SERVICE = EmbeddingService()
+            else:
+                raise ValueError(f"Unknown EMBEDDING_BACKEND: {EMBEDDING_BACKEND!r}")
+        return _SERVICE
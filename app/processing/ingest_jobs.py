@@ -0,0 +1,290 @@
+# Background ingestion jobs: a bounded worker pool with per-stage progress tracking
+
+import json
+import logging
+import os
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from sqlmodel import select
+
+from app import metrics
+from app.db import get_session
+from app.models import IngestJobRecord
+
+logger = logging.getLogger(__name__)
+
+# Pool sizing; can be overridden by env vars
+INGEST_MAX_WORKERS = int(os.environ.get("INGEST_MAX_WORKERS", "2"))
+INGEST_MAX_PENDING = int(os.environ.get("INGEST_MAX_PENDING", "100"))
+INGEST_JOB_HISTORY = int(os.environ.get("INGEST_JOB_HISTORY", "500"))
+# Minimum seconds between progress writes to the job table (status changes are always written)
+INGEST_JOB_PERSIST_INTERVAL = float(os.environ.get("INGEST_JOB_PERSIST_INTERVAL", "1.0"))
+
+STAGES = ("extract", "chunk", "embed", "store")
+
+
+class QueueFullError(RuntimeError):
+    """Raised when too many ingestion jobs are already waiting for a worker."""
+
+
+class IngestJob:
+    """
+    State of a single ingestion job. Mutated by the worker, read by the status endpoints.
+    Every change is also written to the SQL job table (progress at most once per
+    INGEST_JOB_PERSIST_INTERVAL), so a status poll answered by another worker process
+    sees the same job.
+    """
+
+    def __init__(self, filename, content_type=None, tenant_id=None):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.content_type = content_type
+        self.tenant_id = tenant_id
+        self.status = "queued"  # queued | running | success | error
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.traceback = None
+        self.stages = {
+            name: {"status": "pending", "progress": 0.0, "started_at": None, "finished_at": None}
+            for name in STAGES
+        }
+        self._lock = threading.Lock()
+        self._persisted_at = 0.0
+
+    def start_stage(self, name):
+        with self._lock:
+            stage = self.stages[name]
+            stage["status"] = "running"
+            stage["started_at"] = time.time()
+        _persist(self)
+
+    def update_stage(self, name, done=None, total=None, **counts):
+        """
+        Record progress for a running stage: running counts such as chunks=..., plus the
+        fraction done/total when the total is known up front.
+        """
+        with self._lock:
+            stage = self.stages[name]
+            if total:
+                stage["progress"] = round(done / total, 4)
+            stage.update(counts)
+        _persist(self, force=False)
+
+    def finish_stage(self, name, **info):
+        with self._lock:
+            stage = self.stages[name]
+            stage["status"] = "done"
+            stage["progress"] = 1.0
+            stage["finished_at"] = time.time()
+            stage.update(info)
+        _persist(self)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "filename": self.filename,
+                "content_type": self.content_type,
+                "tenant_id": self.tenant_id,
+                "status": self.status,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "stages": {name: dict(stage) for name, stage in self.stages.items()},
+                "result": self.result,
+                "error": self.error,
+                "traceback": self.traceback,
+            }
+
+
+def _persist(job, force=True):
+    """Write the job's current state to the job table; failures only cost cross-worker visibility."""
+    now = time.time()
+    if not force and now - job._persisted_at < INGEST_JOB_PERSIST_INTERVAL:
+        return
+    job._persisted_at = now
+    state = job.to_dict()
+    try:
+        with get_session() as session:
+            record = session.get(IngestJobRecord, job.id) or IngestJobRecord(job_id=job.id, created_at=job.created_at)
+            record.status = state["status"]
+            record.updated_at = now
+            record.state = json.dumps(state, default=str)
+            session.add(record)
+            session.commit()
+    except Exception as e:
+        logger.warning("Could not persist ingestion job %s: %s", job.id, e)
+
+
+def _trim_persisted_history():
+    """Drop finished job rows beyond the newest INGEST_JOB_HISTORY jobs."""
+    try:
+        with get_session() as session:
+            keep = select(IngestJobRecord.job_id).order_by(IngestJobRecord.created_at.desc()).limit(INGEST_JOB_HISTORY)
+            old = session.exec(select(IngestJobRecord).where(
+                IngestJobRecord.status.in_(("success", "error")), IngestJobRecord.job_id.not_in(keep)
+            )).all()
+            for record in old:
+                session.delete(record)
+            session.commit()
+    except Exception as e:
+        logger.warning("Could not trim ingestion job history: %s", e)
+
+
+_EXECUTOR = None
+_EXECUTOR_LOCK = threading.Lock()
+_JOBS: "OrderedDict[str, IngestJob]" = OrderedDict()
+_JOBS_LOCK = threading.Lock()
+
+
+# Per-source locks: key -> [lock, number of holders and waiters]
+_SOURCE_LOCKS: dict = {}
+_SOURCE_LOCKS_LOCK = threading.Lock()
+
+
+@contextmanager
+def source_lock(*key):
+    """
+    Serialize work on one source, e.g. source_lock(tenant, filename), so two jobs for the
+    same file never read the same stored chunks and write over each other. Covers the jobs
+    of this process only.
+    """
+    with _SOURCE_LOCKS_LOCK:
+        entry = _SOURCE_LOCKS.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _SOURCE_LOCKS_LOCK:
+            entry[1] -= 1
+            if not entry[1]:
+                del _SOURCE_LOCKS[key]
+
+
+def _get_executor():
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ThreadPoolExecutor(max_workers=INGEST_MAX_WORKERS, thread_name_prefix="ingest")
+        return _EXECUTOR
+
+
+def _pending_count():
+    return sum(1 for job in _JOBS.values() if job.status in ("queued", "running"))
+
+
+def _trim_history():
+    """Drop the oldest finished jobs once the registry exceeds INGEST_JOB_HISTORY."""
+    excess = len(_JOBS) - INGEST_JOB_HISTORY
+    if excess <= 0:
+        return
+    for job_id in [jid for jid, job in _JOBS.items() if job.status in ("success", "error")][:excess]:
+        del _JOBS[job_id]
+
+
+def _run(job, fn, args, kwargs):
+    with job._lock:
+        job.status = "running"
+        job.started_at = time.time()
+    _persist(job)
+    labels = {"file_type": metrics.file_type_label(job.filename, job.content_type), "tenant": metrics.tenant_label(job.tenant_id)}
+    try:
+        with metrics.span("ingest", **labels):
+            result = fn(job, *args, **kwargs)
+        with job._lock:
+            job.result = result
+            job.status = "success"
+    except Exception as e:
+        tb = traceback.format_exc()
+        logger.error("Job %s failed for %s", job.id, job.filename, exc_info=True)
+        with job._lock:
+            job.error = str(e)
+            job.traceback = tb
+            job.status = "error"
+            for stage in job.stages.values():
+                if stage["status"] == "running":
+                    stage["status"] = "error"
+    finally:
+        with job._lock:
+            job.finished_at = time.time()
+        _persist(job)
+        status = (job.result or {}).get("status", job.status) if job.status == "success" else job.status
+        metrics.INGESTED_DOCUMENTS.inc(status=status, **labels)
+
+
+def submit_job(job, fn, *args, **kwargs):
+    """
+    Queue fn(job, *args, **kwargs) on the ingestion worker pool and return the job.
+    Raises QueueFullError when INGEST_MAX_PENDING jobs are already queued or running.
+    """
+    with _JOBS_LOCK:
+        if _pending_count() >= INGEST_MAX_PENDING:
+            raise QueueFullError(f"Too many pending ingestion jobs (limit {INGEST_MAX_PENDING})")
+        _JOBS[job.id] = job
+        _trim_history()
+    _persist(job)
+    _trim_persisted_history()
+    _get_executor().submit(_run, job, fn, args, kwargs)
+    return job
+
+
+def get_job(job_id):
+    """Return a job queued by this process (None if it was queued elsewhere or has been trimmed)."""
+    with _JOBS_LOCK:
+        return _JOBS.get(job_id)
+
+
+def list_jobs():
+    with _JOBS_LOCK:
+        return list(_JOBS.values())
+
+
+def job_status(job_id):
+    """
+    Return the state of any job (as IngestJob.to_dict()), whichever worker process runs it.
+    A job whose process died mid-run keeps its last persisted state. None if unknown.
+    """
+    job = get_job(job_id)
+    if job is not None:
+        return job.to_dict()
+    try:
+        with get_session() as session:
+            record = session.get(IngestJobRecord, job_id)
+            return json.loads(record.state) if record is not None else None
+    except Exception as e:
+        logger.warning("Could not load ingestion job %s: %s", job_id, e)
+        return None
+
+
+def job_statuses():
+    """Return the state of the newest INGEST_JOB_HISTORY jobs across all worker processes, oldest first."""
+    states = {}
+    try:
+        with get_session() as session:
+            records = session.exec(
+                select(IngestJobRecord).order_by(IngestJobRecord.created_at.desc()).limit(INGEST_JOB_HISTORY)
+            ).all()
+        states = {record.job_id: json.loads(record.state) for record in records}
+    except Exception as e:
+        logger.warning("Could not list persisted ingestion jobs: %s", e)
+    # This process's own jobs are always current
+    states.update((job.id, job.to_dict()) for job in list_jobs())
+    return sorted(states.values(), key=lambda state: state["created_at"])
+
+
+def queue_stats():
+    with _JOBS_LOCK:
+        return {"pending": _pending_count(), "tracked": len(_JOBS), "max_pending": INGEST_MAX_PENDING, "workers": INGEST_MAX_WORKERS}
+
+
+metrics.register_stats("rag_ingest_queue", "Ingestion job queue.", queue_stats)
@@ -0,0 +1,72 @@
+# Bounded producer/consumer stages for streaming ingestion
+
+import os
+import queue
+import threading
+
+# Defaults; can be overridden by env vars
+INGEST_BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", "128"))
+# Items a stage may run ahead of the next one; with batches this caps chunks held in memory
+INGEST_QUEUE_DEPTH = int(os.environ.get("INGEST_QUEUE_DEPTH", "2"))
+
+_ITEM, _END, _ERROR = range(3)
+
+
+def batched(iterable, size=INGEST_BATCH_SIZE):
+    """Group an iterable into lists of up to `size` items."""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def staged(iterable, fn=None, maxsize=INGEST_QUEUE_DEPTH, name="stage"):
+    """
+    Consume `iterable` (applying `fn` to each item, if given) on a background thread and
+    yield the results through a queue of at most `maxsize` items. The producer blocks
+    while the queue is full, so the stages overlap in time without either getting more
+    than `maxsize` items ahead. Producer exceptions are re-raised here; closing this
+    generator stops the producer.
+    """
+    items = queue.Queue(maxsize=max(1, maxsize))
+    stop = threading.Event()
+
+    def put(entry):
+        while not stop.is_set():
+            try:
+                items.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((_ITEM, fn(item) if fn else item)):
+                    return
+            put((_END, None))
+        except BaseException as e:
+            put((_ERROR, e))
+        finally:
+            close = getattr(iterable, "close", None)
+            if close is not None:
+                close()
+
+    thread = threading.Thread(target=produce, name=f"ingest-{name}", daemon=True)
+    thread.start()
+    try:
+        while True:
+            kind, value = items.get()
+            if kind == _ITEM:
+                yield value
+            elif kind == _ERROR:
+                raise value
+            else:
+                return
+    finally:
+        stop.set()
@@ -1,13 +1,50 @@
 # ChromaDB vector store integration
 
 import chromadb
+import functools
+import hashlib
+import json
+import logging
 import os
+import re
+import threading
+from array import array
 from pathlib import Path
 
+from chromadb.errors import NotFoundError
+
+from app import metrics
+from app.cache import TTLCache
+from app.vectorstore import lexical_index, term_index
+
+logger = logging.getLogger(__name__)
+
 # Default persistence directory; can be overridden by env var CHROMA_PERSIST_DIR
 PERSIST_PATH = os.environ.get("CHROMA_PERSIST_DIR", "./chroma_db")
 COLLECTION_NAME = "documents2"
 
+# Retrieval result cache; can be overridden by env vars
+RETRIEVAL_CACHE_SIZE = int(os.environ.get("RETRIEVAL_CACHE_SIZE", "1024"))
+RETRIEVAL_CACHE_TTL = float(os.environ.get("RETRIEVAL_CACHE_TTL", "300"))
+# Reciprocal rank fusion: rank constant and how many candidates each retriever contributes
+RRF_K = int(os.environ.get("RRF_K", "60"))
+HYBRID_CANDIDATES = int(os.environ.get("HYBRID_CANDIDATES", "50"))
+_RETRIEVAL_CACHE = TTLCache(maxsize=RETRIEVAL_CACHE_SIZE, ttl=RETRIEVAL_CACHE_TTL)
+metrics.register_stats("rag_retrieval_cache", "Retrieval result cache.", _RETRIEVAL_CACHE.stats)
+
+
+def collection_version(name):
+    """
+    The collection's change counter. It lives in the term index database next to the Chroma
+    data, so a write made by any worker on the host changes the version every worker sees.
+    """
+    return term_index.get_term_index().version(name)
+
+
+def bump_collection_version(name):
+    """Mark a collection as changed, invalidating cached retrievals and answers against it."""
+    return term_index.get_term_index().bump_version(name)
+
 
 def _ensure_writable_dir(path: str) -> str:
     """Create the directory if needed and verify write permissions. Returns absolute path."""
@@ -27,46 +64,287 @@ def _ensure_writable_dir(path: str) -> str:
     return str(p)
 
 
+_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+_COLLECTIONS: dict = {}
+
+
 def get_chroma_client():
     """
-    Returns a persistent, writable ChromaDB client instance.
+    Returns the process-wide persistent, writable ChromaDB client.
+    The persist dir is checked and the client created once, on first use (or at startup).
+    """
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            persist_dir = _ensure_writable_dir(PERSIST_PATH)
+            _CLIENT = chromadb.PersistentClient(path=persist_dir)
+        return _CLIENT
+
+
+def collection_name_for_tenant(tenant_id=None):
+    """
+    Returns the collection holding a tenant's chunks. The default tenant (no tenant_id)
+    keeps COLLECTION_NAME; every other tenant gets its own collection, so a search only
+    touches that tenant's data.
+    """
+    if not tenant_id or tenant_id == "default":
+        return COLLECTION_NAME
+    slug = re.sub(r"[^a-zA-Z0-9_-]", "-", str(tenant_id))[:40].strip("-_") or "tenant"
+    if slug != str(tenant_id):
+        # Keep tenants whose IDs sanitize to the same slug apart
+        slug = f"{slug}-{hashlib.sha1(str(tenant_id).encode('utf-8')).hexdigest()[:8]}"
+    return f"{COLLECTION_NAME}_t_{slug}"
+
+
+def get_tenant_collection(tenant_id=None):
+    """
+    Returns a cached handle to the tenant's collection, creating it on first use.
+    """
+    return get_collection(collection_name_for_tenant(tenant_id))
+
+
+class _CollectionHandle:
+    """
+    Process-cached collection handle. Handles are cached per worker, so another worker can
+    drop or reset the collection underneath one; when a call raises NotFoundError the stale
+    handle is replaced through get_or_create_collection and the call is retried once.
+    Everything else is passed through to the Chroma collection.
+    """
+
+    def __init__(self, name, collection):
+        self.name = name
+        self._collection = collection
+
+    def _reopen(self, stale):
+        client = get_chroma_client()
+        with _CLIENT_LOCK:
+            if self._collection is stale:
+                logger.info("Collection %s was dropped by another worker; reopening it", self.name)
+                self._collection = client.get_or_create_collection(self.name)
+            return self._collection
+
+    def __getattr__(self, attr):
+        value = getattr(self._collection, attr)
+        if not callable(value):
+            return value
+
+        @functools.wraps(value)
+        def call(*args, **kwargs):
+            collection = self._collection
+            try:
+                return getattr(collection, attr)(*args, **kwargs)
+            except NotFoundError:
+                return getattr(self._reopen(collection), attr)(*args, **kwargs)
+
+        return call
+
+
+def get_collection(name=COLLECTION_NAME):
+    """
+    Returns a cached handle to the named collection, creating it on first use.
+    """
+    collection = _COLLECTIONS.get(name)
+    if collection is None:
+        client = get_chroma_client()
+        with _CLIENT_LOCK:
+            collection = _COLLECTIONS.get(name)
+            if collection is None:
+                collection = _CollectionHandle(name, client.get_or_create_collection(name))
+                _COLLECTIONS[name] = collection
+    return collection
+
+
+def drop_collection(name=COLLECTION_NAME):
+    """
+    Deletes the named collection and forgets its cached handle.
+    """
+    client = get_chroma_client()
+    with _CLIENT_LOCK:
+        _COLLECTIONS.pop(name, None)
+        try:
+            client.delete_collection(name)
+        except NotFoundError:
+            logger.info("Collection %s was already dropped", name)
+    term_index.get_term_index().drop(name)
+    bump_collection_version(name)
+    lexical_index.drop_index(name)
+
+
+def content_hash(text):
+    """SHA-256 hex digest of a chunk's text."""
+    return hashlib.sha256(text.encode("utf-8", errors="surrogatepass")).hexdigest()
+
+
+def make_chunk_ids(source, chunks, seen=None):
     """
-    persist_dir = _ensure_writable_dir(PERSIST_PATH)
-    return chromadb.PersistentClient(path=persist_dir)
+    Deterministic chunk IDs derived from (source, content hash, position).
+    Position is the occurrence index of identical text within the source, so editing one
+    part of a document leaves the IDs of untouched chunks (and their embeddings) unchanged.
+    Pass the same `seen` dict to successive calls to number a source given in batches.
+    """
+    source_key = hashlib.sha1(str(source).encode("utf-8")).hexdigest()[:16]
+    seen = {} if seen is None else seen
+    ids = []
+    for text in chunks:
+        digest = content_hash(text)
+        position = seen.get(digest, 0)
+        seen[digest] = position + 1
+        ids.append(f"{source_key}_{digest[:32]}_{position}")
+    return ids
 
 
-def add_embeddings(collection, embeddings, metadatas):
+def add_embeddings(collection, embeddings, metadatas, ids=None):
     """
-    Adds embeddings and metadata to the ChromaDB collection.
+    Upserts embeddings and metadata into the ChromaDB collection.
     Each embedding must be a list of floats.
-    Generates unique IDs using UUID to avoid collisions.
+    IDs default to make_chunk_ids() over each chunk's filename/url, so re-adding the same
+    content overwrites instead of duplicating.
     """
-    import uuid
     from datetime import datetime
-    
-    # Generate unique IDs for each document chunk
-    ids = [f"{metadatas[i].get('filename', 'unknown')}_{uuid.uuid4().hex[:8]}_{i}" for i in range(len(embeddings))]
+
+    if ids is None:
+        ids = [None] * len(metadatas)
+        by_source = {}
+        for i, meta in enumerate(metadatas):
+            by_source.setdefault(meta.get("filename") or meta.get("url") or "unknown", []).append(i)
+        for source, positions in by_source.items():
+            for i, chunk_id in zip(positions, make_chunk_ids(source, [metadatas[i]["text"] for i in positions])):
+                ids[i] = chunk_id
     documents = [meta["text"] for meta in metadatas]
-    
+
     # Add timestamp to metadata for tracking
     for meta in metadatas:
         if "timestamp" not in meta:
             meta["timestamp"] = datetime.now().isoformat()
-    
-    print(f"[CHROMADB] Adding {len(ids)} documents with unique IDs")
-    
+
+    logger.debug("Upserting %d documents", len(ids))
+
     # Chroma expects: ids, embeddings, metadatas, documents
-    collection.add(
+    collection.upsert(
         ids=ids,
         embeddings=embeddings,
         metadatas=metadatas,
         documents=documents
     )
+    term_index.get_term_index().add(collection.name, ids, documents)
+    version = bump_collection_version(collection.name)
+    lexical_index.on_add(collection.name, ids, documents, metadatas, version)
+
+
+def get_source_chunks(collection, where):
+    """
+    Returns {id: metadata} for every chunk matching a metadata filter, e.g. {"filename": name}.
+    """
+    results = collection.get(where=where, include=["metadatas"])
+    return dict(zip(results.get("ids", []), results.get("metadatas", []) or []))
+
+
+def update_metadatas(collection, ids, metadatas):
+    """
+    Replaces metadata on existing chunks without touching their embeddings.
+    """
+    collection.update(ids=ids, metadatas=metadatas)
+    version = bump_collection_version(collection.name)
+    lexical_index.on_update(collection.name, ids, metadatas, version)
+
+
+def delete_embeddings(collection, ids):
+    """
+    Deletes chunks by ID from the ChromaDB collection.
+    """
+    collection.delete(ids=ids)
+    term_index.get_term_index().remove(collection.name, ids)
+    version = bump_collection_version(collection.name)
+    lexical_index.on_delete(collection.name, ids, version)
+
+
+def _retrieval_cache_key(collection, version, query_embeddings, k, where, query_text):
+    digest = hashlib.sha1()
+    for emb in query_embeddings:
+        digest.update(array("f", emb).tobytes())
+    filters = json.dumps(where, sort_keys=True, default=str) if where else ""
+    return (collection.name, version, digest.hexdigest(), k, filters, query_text or "")
 
 
-def hybrid_search(collection, query_embeddings, k=5):
+def _copy_results(results):
+    """Copy the per-query lists so callers can reorder them without touching the cached entry."""
+    return {key: [list(v) for v in value] if isinstance(value, list) else value for key, value in results.items()}
+
+
+def _vector_query(collection, query_embeddings, n_results, where):
+    query_args = {"query_embeddings": query_embeddings, "n_results": n_results}
+    if where:
+        query_args["where"] = where
+    return collection.query(**query_args)
+
+
+def _fuse(collection, vector_results, lexical_hits, k):
     """
-    Performs a vector search in ChromaDB collection using pre-computed embeddings.
+    Reciprocal rank fusion of one vector result list and one BM25 hit list:
+    score(d) = sum over retrievers of 1 / (RRF_K + rank). Returns a Chroma-shaped result.
     """
-    results = collection.query(query_embeddings=query_embeddings, n_results=k)
-    return results
+    vec_ids = vector_results.get("ids", [[]])[0]
+    vec_docs = (vector_results.get("documents") or [[]])[0]
+    vec_metas = (vector_results.get("metadatas") or [[]])[0]
+    vec_dists = (vector_results.get("distances") or [[]])[0]
+
+    scores = {}
+    for rank, chunk_id in enumerate(vec_ids):
+        scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+    for rank, (chunk_id, _) in enumerate(lexical_hits):
+        scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+    fused_ids = sorted(scores, key=lambda cid: scores[cid], reverse=True)[:k]
+
+    rows = {cid: (vec_docs[i], vec_metas[i], vec_dists[i] if i < len(vec_dists) else None)
+            for i, cid in enumerate(vec_ids)}
+    missing = [cid for cid in fused_ids if cid not in rows]
+    if missing:
+        fetched = collection.get(ids=missing, include=["documents", "metadatas"])
+        for cid, doc, meta in zip(fetched.get("ids", []), fetched.get("documents", []), fetched.get("metadatas", [])):
+            rows[cid] = (doc, meta, None)
+    fused_ids = [cid for cid in fused_ids if cid in rows]
+
+    return {
+        "ids": [fused_ids],
+        "documents": [[rows[cid][0] for cid in fused_ids]],
+        "metadatas": [[rows[cid][1] for cid in fused_ids]],
+        "distances": [[rows[cid][2] for cid in fused_ids]],
+        "scores": [[scores[cid] for cid in fused_ids]],
+    }
+
+
+def hybrid_search(collection, query_embeddings, k=5, where=None, query_text=None):
+    """
+    Performs a hybrid search in ChromaDB collection using pre-computed embeddings.
+    When query_text is given, the vector hits and BM25 hits over chunk text are fused with
+    reciprocal rank fusion; otherwise this is a plain vector query. While the collection's
+    BM25 index is still being built in the background, queries are served vector-only.
+    Results are cached per (embedding, k, filters, query text, collection version), except
+    those served without an up-to-date BM25 index. Blocking; call from a worker thread.
+    """
+    version = collection_version(collection.name)
+    key = _retrieval_cache_key(collection, version, query_embeddings, k, where, query_text)
+    cached = _RETRIEVAL_CACHE.get(key)
+    if cached is not None:
+        return _copy_results(cached)
+
+    hybrid = bool(query_text) and lexical_index.supports_filter(where)
+    index = lexical_index.get_index(collection, version) if hybrid else None
+    if index is not None:
+        candidates = max(k, HYBRID_CANDIDATES)
+        vector_results = _vector_query(collection, query_embeddings, candidates, where)
+        lexical_hits = index.search(query_text, k=candidates, where=where)
+        results = _fuse(collection, vector_results, lexical_hits, k)
+    else:
+        results = _vector_query(collection, query_embeddings, k, where)
+    if not hybrid or (index is not None and index.version == version):
+        _RETRIEVAL_CACHE.set(key, dict(results))
+    return _copy_results(results)
+
+
+def warm_lexical_indexes():
+    """Start background BM25 builds for every stored collection, so the first queries find them ready."""
+    for collection in get_chroma_client().list_collections():
+        name = getattr(collection, "name", collection)
+        lexical_index.get_index(get_collection(name), collection_version(name))
@@ -0,0 +1,297 @@
+# In-process BM25 inverted index over chunk text, kept in step with the Chroma collections.
+# Every worker process holds its own copy: writes made here are applied directly, and writes
+# made by other workers are picked up by diffing the stored chunk IDs when the shared
+# collection version moves.
+
+import heapq
+import logging
+import math
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# BM25 parameters; can be overridden by env vars
+BM25_K1 = float(os.environ.get("BM25_K1", "1.5"))
+BM25_B = float(os.environ.get("BM25_B", "0.75"))
+# Minimum seconds between background catch-ups of one collection's index with other workers' writes
+BM25_REBUILD_INTERVAL = float(os.environ.get("BM25_REBUILD_INTERVAL", "10"))
+# Builds and catch-ups running at once across all collections
+BM25_BUILD_CONCURRENCY = int(os.environ.get("BM25_BUILD_CONCURRENCY", "2"))
+# Metadata fields kept per chunk for where filters; filters on other fields are served vector-only
+BM25_FILTER_FIELDS = tuple(
+    field.strip() for field in os.environ.get("BM25_FILTER_FIELDS", "filename,url,content_type").split(",") if field.strip()
+)
+_BUILD_PAGE_SIZE = 1000
+
+_TOKEN_RE = re.compile(r"\w+(?:[-./]\w+)*")
+
+
+def tokenize(text):
+    """
+    Lowercased word tokens. Compound tokens such as product codes ("XJ-900", "v2.1") are
+    kept whole and also split into their parts, so both exact codes and pieces match.
+    """
+    tokens = []
+    for match in _TOKEN_RE.finditer(text.lower()):
+        token = match.group(0)
+        tokens.append(token)
+        if any(ch in token for ch in "-./"):
+            tokens.extend(part for part in re.split(r"[-./]", token) if part)
+    return tokens
+
+
+def _matches(meta, where):
+    """Evaluate a flat equality filter ({"field": value, ...}) against a chunk's metadata."""
+    return all(meta.get(field) == value for field, value in where.items())
+
+
+def supports_filter(where):
+    return not where or all(field in BM25_FILTER_FIELDS and not isinstance(value, dict) for field, value in where.items())
+
+
+def _filter_fields(meta):
+    """The part of a chunk's metadata that where filters can use; the chunk text is never kept."""
+    return {field: meta[field] for field in BM25_FILTER_FIELDS if field in meta} if meta else {}
+
+
+class BM25Index:
+    """
+    Inverted index (term -> {chunk id: term frequency}) with Okapi BM25 scoring.
+    Adding an existing ID replaces it; all operations are thread-safe. Only BM25_FILTER_FIELDS
+    are kept from each chunk's metadata. `version` is the collection version whose contents
+    the index reflects.
+    """
+
+    def __init__(self, k1=BM25_K1, b=BM25_B, version=None):
+        self.k1 = k1
+        self.b = b
+        self.version = version
+        self._postings = {}
+        self._doc_terms = {}
+        self._doc_len = {}
+        self._doc_meta = {}
+        self._total_len = 0
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._doc_len)
+
+    def add(self, ids, texts, metadatas=None):
+        with self.lock:
+            for i, (chunk_id, text) in enumerate(zip(ids, texts)):
+                self._remove_one(chunk_id)
+                tokens = tokenize(text or "")
+                freqs = {}
+                for token in tokens:
+                    freqs[token] = freqs.get(token, 0) + 1
+                for token, tf in freqs.items():
+                    self._postings.setdefault(token, {})[chunk_id] = tf
+                self._doc_terms[chunk_id] = tuple(freqs)
+                self._doc_len[chunk_id] = len(tokens)
+                self._doc_meta[chunk_id] = _filter_fields(metadatas[i]) if metadatas else {}
+                self._total_len += len(tokens)
+
+    def update_metadata(self, ids, metadatas):
+        with self.lock:
+            for chunk_id, meta in zip(ids, metadatas):
+                if chunk_id in self._doc_meta:
+                    self._doc_meta[chunk_id] = _filter_fields(meta)
+
+    def remove(self, ids):
+        with self.lock:
+            for chunk_id in ids:
+                self._remove_one(chunk_id)
+
+    def _remove_one(self, chunk_id):
+        terms = self._doc_terms.pop(chunk_id, None)
+        if terms is None:
+            return
+        for token in terms:
+            posting = self._postings.get(token)
+            if posting is not None:
+                posting.pop(chunk_id, None)
+                if not posting:
+                    del self._postings[token]
+        self._total_len -= self._doc_len.pop(chunk_id, 0)
+        self._doc_meta.pop(chunk_id, None)
+
+    def search(self, query, k=10, where=None):
+        """Return up to k (chunk id, BM25 score) pairs, best first. Only chunks sharing a term are scored."""
+        with self.lock:
+            n_docs = len(self._doc_len)
+            if not n_docs:
+                return []
+            avg_len = self._total_len / n_docs or 1.0
+            scores = {}
+            for token in set(tokenize(query)):
+                posting = self._postings.get(token)
+                if not posting:
+                    continue
+                idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+                for chunk_id, tf in posting.items():
+                    norm = tf + self.k1 * (1 - self.b + self.b * self._doc_len[chunk_id] / avg_len)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+            if where:
+                scores = {cid: s for cid, s in scores.items() if _matches(self._doc_meta.get(cid, {}), where)}
+            return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def ids_containing(self, tokens):
+        """Return the IDs of chunks that contain every one of the given tokens."""
+        with self.lock:
+            postings = sorted((self._postings.get(token, {}) for token in set(tokens)), key=len)
+            if not postings:
+                return []
+            result = set(postings[0])
+            for posting in postings[1:]:
+                result.intersection_update(posting)
+                if not result:
+                    break
+            return list(result)
+
+    def metadata(self, chunk_id):
+        with self.lock:
+            return self._doc_meta.get(chunk_id)
+
+    def ids(self):
+        with self.lock:
+            return set(self._doc_len)
+
+
+_INDEXES: dict = {}
+_BUILDING: set = set()
+_LAST_BUILD: dict = {}
+_INDEXES_LOCK = threading.Lock()
+_BUILD_EXECUTOR = ThreadPoolExecutor(max_workers=max(1, BM25_BUILD_CONCURRENCY), thread_name_prefix="bm25")
+
+
+def get_index(collection, version):
+    """
+    Return the collection's BM25 index, or None until one has been built. When there is no
+    index yet a build is queued; when it is behind `version` because another worker wrote to
+    the collection, a catch-up is queued (at most once per BM25_REBUILD_INTERVAL) and the
+    current index keeps serving meanwhile. Both run on a pool of BM25_BUILD_CONCURRENCY
+    threads. Never blocks on a build.
+    """
+    name = collection.name
+    with _INDEXES_LOCK:
+        index = _INDEXES.get(name)
+        stale = index is None or index.version != version
+        if stale and name not in _BUILDING and (
+                index is None or time.monotonic() - _LAST_BUILD.get(name, 0.0) >= BM25_REBUILD_INTERVAL):
+            _BUILDING.add(name)
+            _LAST_BUILD[name] = time.monotonic()
+            if index is None:
+                _BUILD_EXECUTOR.submit(_build, collection, version)
+            else:
+                _BUILD_EXECUTOR.submit(_catch_up, collection, index, version)
+    return index
+
+
+def _add_pages(index, collection, ids=None):
+    """Fetch chunk text and metadata page by page (every chunk, or just `ids`) and add it to the index."""
+    if ids is None:
+        offset = 0
+        while True:
+            page = collection.get(include=["documents", "metadatas"], limit=_BUILD_PAGE_SIZE, offset=offset)
+            if not page.get("ids"):
+                return
+            index.add(page["ids"], page.get("documents", []), page.get("metadatas", []))
+            offset += len(page["ids"])
+    for start in range(0, len(ids), _BUILD_PAGE_SIZE):
+        page = collection.get(ids=ids[start:start + _BUILD_PAGE_SIZE], include=["documents", "metadatas"])
+        index.add(page.get("ids", []), page.get("documents", []), page.get("metadatas", []))
+
+
+def _stored_ids(collection):
+    ids = set()
+    while True:
+        page = collection.get(include=[], limit=_BUILD_PAGE_SIZE, offset=len(ids))
+        page_ids = page.get("ids", [])
+        if not page_ids:
+            return ids
+        ids.update(page_ids)
+
+
+def _build(collection, version):
+    """Index every stored chunk of a collection and install the result. Runs on the build pool."""
+    name = collection.name
+    try:
+        index = BM25Index(version=version)
+        _add_pages(index, collection)
+        with _INDEXES_LOCK:
+            _INDEXES[name] = index
+        logger.info("Built BM25 index for '%s': %d chunks", name, len(index))
+    except Exception as e:
+        logger.warning("Building the BM25 index for '%s' failed: %s", name, e)
+    finally:
+        with _INDEXES_LOCK:
+            _BUILDING.discard(name)
+
+
+def _catch_up(collection, index, version):
+    """
+    Apply other workers' writes to an existing index: diff the stored chunk IDs against the
+    indexed ones, fetch and add only the new chunks and drop the removed ones. Chunk IDs are
+    derived from source and content, so a kept ID still has the same text. Runs on the build pool.
+    """
+    name = collection.name
+    try:
+        # IDs indexed before the scan; anything added locally meanwhile must not look removed
+        indexed = index.ids()
+        stored = _stored_ids(collection)
+        removed = indexed - stored
+        added = sorted(stored - index.ids())
+        index.remove(removed)
+        _add_pages(index, collection, added)
+        with index.lock:
+            if index.version is None or index.version < version:
+                index.version = version
+        logger.info("Caught up BM25 index for '%s': %d added, %d removed", name, len(added), len(removed))
+    except Exception as e:
+        logger.warning("Catching up the BM25 index for '%s' failed: %s", name, e)
+    finally:
+        with _INDEXES_LOCK:
+            _BUILDING.discard(name)
+
+
+def _loaded_index(name):
+    """Return the index if one has been built; a collection without one picks up writes when it is built."""
+    with _INDEXES_LOCK:
+        return _INDEXES.get(name)
+
+
+def _advance(index, version):
+    # A local write moves the index to the new version only if it had seen every earlier one
+    if version is not None and index.version is not None and index.version == version - 1:
+        index.version = version
+
+
+def on_add(name, ids, documents, metadatas, version=None):
+    index = _loaded_index(name)
+    if index is not None:
+        index.add(ids, documents, metadatas)
+        _advance(index, version)
+
+
+def on_update(name, ids, metadatas, version=None):
+    index = _loaded_index(name)
+    if index is not None:
+        index.update_metadata(ids, metadatas)
+        _advance(index, version)
+
+
+def on_delete(name, ids, version=None):
+    index = _loaded_index(name)
+    if index is not None:
+        index.remove(ids)
+        _advance(index, version)
+
+
+def drop_index(name):
+    with _INDEXES_LOCK:
+        _INDEXES.pop(name, None)
+        _LAST_BUILD.pop(name, None)
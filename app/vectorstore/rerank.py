@@ -0,0 +1,114 @@
+# Second-stage reranking of retrieved candidates with pluggable scorers
+
+import logging
+import os
+import time
+
+from app.vectorstore.lexical_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+# Defaults; can be overridden by env vars
+RERANKER = os.environ.get("RERANKER", "lexical")  # lexical | none | any registered name
+RERANK_CANDIDATES = int(os.environ.get("RERANK_CANDIDATES", "30"))
+# Chunks kept after reranking; defaults to ASK_TOP_K so reranking reorders without shrinking the context
+RERANK_TOP_K = int(os.environ.get("RERANK_TOP_K", os.environ.get("ASK_TOP_K", "10")))
+RERANK_BUDGET_MS = float(os.environ.get("RERANK_BUDGET_MS", "50"))
+
+# Metadata fields whose text counts as a field match (e.g. the query names the file)
+_FIELDS = ("filename", "url", "title")
+
+
+class LexicalReranker:
+    """
+    Fast local scorer with no model: query-term coverage in the chunk, in-order query bigrams
+    (phrase evidence), matches in metadata fields such as the filename, and a small prior
+    for the original retrieval rank.
+    """
+
+    name = "lexical"
+
+    def __init__(self, coverage_weight=1.0, phrase_weight=0.5, field_weight=0.3, rank_weight=0.2):
+        self.coverage_weight = coverage_weight
+        self.phrase_weight = phrase_weight
+        self.field_weight = field_weight
+        self.rank_weight = rank_weight
+
+    def prepare(self, query):
+        """Precompute per-query state passed to score()."""
+        tokens = [t for t in tokenize(query) if len(t) > 2]
+        # Longer tokens are usually more specific, so they count for more
+        weights = {t: len(t) for t in tokens}
+        bigrams = set(zip(tokens, tokens[1:]))
+        return weights, bigrams
+
+    def score(self, prepared, doc, meta, rank, total):
+        weights, bigrams = prepared
+        if not weights:
+            return self.rank_weight * (1.0 - rank / total)
+        tokens = tokenize(doc or "")
+        present = set(tokens)
+        coverage = sum(w for t, w in weights.items() if t in present) / sum(weights.values())
+        phrase = len(bigrams & set(zip(tokens, tokens[1:]))) / len(bigrams) if bigrams else 0.0
+        field_tokens = set()
+        for field in _FIELDS:
+            if meta and meta.get(field):
+                field_tokens.update(tokenize(str(meta[field])))
+        field = sum(1 for t in weights if t in field_tokens) / len(weights)
+        return (self.coverage_weight * coverage + self.phrase_weight * phrase
+                + self.field_weight * field + self.rank_weight * (1.0 - rank / total))
+
+
+_RERANKERS = {"lexical": LexicalReranker}
+
+
+def register_reranker(name, factory):
+    """Make a scorer selectable with RERANKER=<name>. `factory()` must return an object with prepare() and score()."""
+    _RERANKERS[name] = factory
+
+
+_INSTANCES = {}
+
+
+def get_reranker(name=None):
+    """Return the configured reranker, or None when reranking is disabled."""
+    name = (name or RERANKER).lower()
+    if name in ("", "none", "off", "0"):
+        return None
+    if name not in _RERANKERS:
+        raise ValueError(f"Unknown RERANKER: {name!r}")
+    if name not in _INSTANCES:
+        _INSTANCES[name] = _RERANKERS[name]()
+    return _INSTANCES[name]
+
+
+def rerank(reranker, query, results, k, budget_ms=RERANK_BUDGET_MS):
+    """
+    Reorder a Chroma-shaped result by reranker score and cut it to k. Candidates are scored
+    in retrieval order until `budget_ms` runs out; any left unscored keep their original
+    order behind the scored ones.
+    """
+    ids = results.get("ids", [[]])[0]
+    docs = (results.get("documents") or [[]])[0]
+    metas = (results.get("metadatas") or [[]])[0] or [None] * len(ids)
+    deadline = time.perf_counter() + budget_ms / 1000.0
+    prepared = reranker.prepare(query)
+    scored = []
+    for rank in range(len(ids)):
+        if time.perf_counter() > deadline:
+            logger.info("Budget of %sms exhausted after %d/%d candidates", budget_ms, rank, len(ids))
+            break
+        scored.append((reranker.score(prepared, docs[rank], metas[rank], rank, len(ids)), rank))
+    scored.sort(key=lambda item: item[0], reverse=True)
+    order = [rank for _, rank in scored] + list(range(len(scored), len(ids)))
+    order = order[:k]
+    scores = {rank: score for score, rank in scored}
+
+    reranked = {}
+    for key, value in results.items():
+        if isinstance(value, list) and value and isinstance(value[0], list) and len(value[0]) == len(ids):
+            reranked[key] = [[value[0][i] for i in order]]
+        else:
+            reranked[key] = value
+    reranked["rerank_scores"] = [[scores.get(i) for i in order]]
+    return reranked
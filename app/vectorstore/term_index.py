@@ -0,0 +1,279 @@
+# Persistent positional term index for "which chunks contain X" lookups (SQLite)
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+from array import array
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"\w+")
+_BUILD_PAGE_SIZE = 1000
+# Max chunk IDs bound into one SQL statement
+_SQL_BATCH = 500
+
+
+def _tokenize_with_offsets(text):
+    """Yield (lowercased token, start, end) for each word in the original text."""
+    for match in _WORD_RE.finditer(text):
+        yield match.group(0).lower(), match.start(), match.end()
+
+
+def _query_tokens(term):
+    return [match.group(0).lower() for match in _WORD_RE.finditer(term)]
+
+
+class TermIndex:
+    """
+    Positional inverted index stored next to the Chroma data, shared by every worker on the host.
+    One row per (collection, token, chunk) holds the packed (position, start, end) triples of
+    each occurrence. Phrases match consecutive positions; the last word also matches as a
+    prefix, so "capacit" finds "capacitor". Match offsets come straight from the index.
+    The same database keeps a change counter per collection (see bump_version), read and
+    written through a connection of its own so version checks never wait on postings writes.
+    """
+
+    def __init__(self, path):
+        self.path = str(Path(path).expanduser().resolve())
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._built = set()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS postings (
+                collection TEXT NOT NULL,
+                token TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                occurrences BLOB NOT NULL,
+                PRIMARY KEY (collection, token, chunk_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings(collection, chunk_id);
+            CREATE TABLE IF NOT EXISTS indexed_chunks (
+                collection TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                PRIMARY KEY (collection, chunk_id)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS built_collections (collection TEXT PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS collection_versions (
+                collection TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            );
+            """
+        )
+        self._conn.commit()
+        self._version_lock = threading.Lock()
+        self._version_conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+
+    # -- writes ---------------------------------------------------------------------------
+
+    def _delete_locked(self, collection, ids):
+        for i in range(0, len(ids), _SQL_BATCH):
+            part = ids[i:i + _SQL_BATCH]
+            placeholders = ",".join("?" * len(part))
+            self._conn.execute(
+                f"DELETE FROM postings WHERE collection = ? AND chunk_id IN ({placeholders})", [collection, *part]
+            )
+            self._conn.execute(
+                f"DELETE FROM indexed_chunks WHERE collection = ? AND chunk_id IN ({placeholders})", [collection, *part]
+            )
+
+    def add(self, collection, ids, documents):
+        """Index (or re-index) chunks."""
+        rows = []
+        for chunk_id, text in zip(ids, documents):
+            occurrences = {}
+            for position, (token, start, end) in enumerate(_tokenize_with_offsets(text or "")):
+                occurrences.setdefault(token, array("I")).extend((position, start, end))
+            rows.extend((collection, token, chunk_id, occ.tobytes()) for token, occ in occurrences.items())
+        with self._lock:
+            self._delete_locked(collection, list(ids))
+            self._conn.executemany(
+                "INSERT INTO postings (collection, token, chunk_id, occurrences) VALUES (?, ?, ?, ?)", rows
+            )
+            self._conn.executemany(
+                "INSERT INTO indexed_chunks (collection, chunk_id) VALUES (?, ?)", [(collection, cid) for cid in ids]
+            )
+            self._conn.commit()
+
+    def remove(self, collection, ids):
+        with self._lock:
+            self._delete_locked(collection, list(ids))
+            self._conn.commit()
+
+    def drop(self, collection):
+        with self._lock:
+            self._conn.execute("DELETE FROM postings WHERE collection = ?", (collection,))
+            self._conn.execute("DELETE FROM indexed_chunks WHERE collection = ?", (collection,))
+            self._conn.execute("DELETE FROM built_collections WHERE collection = ?", (collection,))
+            self._conn.commit()
+            self._built.discard(collection)
+
+    def bump_version(self, collection):
+        """Increment and return the collection's change counter (shared by every worker on the host)."""
+        with self._version_lock:
+            self._version_conn.execute(
+                "INSERT INTO collection_versions (collection, version) VALUES (?, 1) "
+                "ON CONFLICT(collection) DO UPDATE SET version = version + 1",
+                (collection,),
+            )
+            version = self._version_conn.execute(
+                "SELECT version FROM collection_versions WHERE collection = ?", (collection,)
+            ).fetchone()[0]
+            self._version_conn.commit()
+            return version
+
+    def ensure_built(self, chroma_collection):
+        """Index every stored chunk of a collection the first time it is queried on this host."""
+        name = chroma_collection.name
+        if name in self._built:
+            return
+        with self._lock:
+            built = self._conn.execute("SELECT 1 FROM built_collections WHERE collection = ?", (name,)).fetchone()
+        if not built:
+            offset = 0
+            while True:
+                page = chroma_collection.get(include=["documents"], limit=_BUILD_PAGE_SIZE, offset=offset)
+                ids = page.get("ids", [])
+                if not ids:
+                    break
+                self.add(name, ids, page.get("documents", []))
+                offset += len(ids)
+            with self._lock:
+                self._conn.execute("INSERT OR IGNORE INTO built_collections (collection) VALUES (?)", (name,))
+                self._conn.commit()
+            logger.info("Built term index for '%s': %d chunks", name, offset)
+        self._built.add(name)
+
+    # -- reads ----------------------------------------------------------------------------
+
+    def version(self, collection):
+        with self._version_lock:
+            row = self._version_conn.execute(
+                "SELECT version FROM collection_versions WHERE collection = ?", (collection,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def chunk_count(self, collection):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM indexed_chunks WHERE collection = ?", (collection,)
+            ).fetchone()[0]
+
+    def _token_clause(self, token, prefix):
+        if prefix:
+            return "token >= ? AND token < ?", [token, token + "\U0010ffff"]
+        return "token = ?", [token]
+
+    def find(self, collection, term):
+        """
+        Return [(chunk_id, start, end)] for the first occurrence of `term` in every chunk that
+        contains it, across the whole collection.
+        """
+        tokens = _query_tokens(term)
+        if not tokens:
+            return []
+        clauses = [self._token_clause(token, prefix=(i == len(tokens) - 1)) for i, token in enumerate(tokens)]
+        with self._lock:
+            # Candidate chunks contain every word; the rarest-first ordering is left to SQLite
+            candidate_sql = " INTERSECT ".join(
+                f"SELECT chunk_id FROM postings WHERE collection = ? AND {clause}" for clause, _ in clauses
+            )
+            params = [p for clause, clause_params in clauses for p in [collection, *clause_params]]
+            candidates = [row[0] for row in self._conn.execute(candidate_sql, params)]
+            if len(tokens) == 1:
+                return self._first_occurrences(collection, candidates, clauses[0])
+            return self._phrase_matches(collection, candidates, clauses)
+
+    def _fetch_occurrences(self, collection, chunk_ids, clause):
+        """Return {chunk_id: [(position, start, end), ...]} for one query word over some chunks."""
+        sql, params = clause
+        found = {}
+        for i in range(0, len(chunk_ids), _SQL_BATCH):
+            part = chunk_ids[i:i + _SQL_BATCH]
+            placeholders = ",".join("?" * len(part))
+            for chunk_id, blob in self._conn.execute(
+                f"SELECT chunk_id, occurrences FROM postings WHERE collection = ? AND {sql} AND chunk_id IN ({placeholders})",
+                [collection, *params, *part],
+            ):
+                occ = array("I")
+                occ.frombytes(blob)
+                found.setdefault(chunk_id, []).extend(zip(occ[0::3], occ[1::3], occ[2::3]))
+        return found
+
+    def _first_occurrences(self, collection, chunk_ids, clause):
+        found = self._fetch_occurrences(collection, chunk_ids, clause)
+        matches = []
+        for chunk_id in chunk_ids:
+            if chunk_id in found:
+                _, start, end = min(found[chunk_id])
+                matches.append((chunk_id, start, end))
+        return matches
+
+    def _phrase_matches(self, collection, chunk_ids, clauses):
+        per_word = [self._fetch_occurrences(collection, chunk_ids, clause) for clause in clauses]
+        matches = []
+        for chunk_id in chunk_ids:
+            first_word = sorted(per_word[0].get(chunk_id, []))
+            following = [{pos: end for pos, _, end in word.get(chunk_id, [])} for word in per_word[1:]]
+            for position, start, _ in first_word:
+                if all(position + i + 1 in positions for i, positions in enumerate(following)):
+                    matches.append((chunk_id, start, following[-1][position + len(following)]))
+                    break
+        return matches
+
+
+_INDEX = None
+_INDEX_LOCK = threading.Lock()
+
+
+def get_term_index():
+    """Return the process-wide TermIndex stored in the Chroma persist dir."""
+    global _INDEX
+    with _INDEX_LOCK:
+        if _INDEX is None:
+            from app.vectorstore import chromadb_store
+            path = os.environ.get("TERM_INDEX_PATH", os.path.join(chromadb_store.PERSIST_PATH, "term_index.sqlite3"))
+            _INDEX = TermIndex(path)
+        return _INDEX
+
+
+def search_term(collection, term, limit=50, context=80):
+    """
+    Find chunks containing `term` (case-insensitive, whole words, last word as prefix).
+    Returns the total match count plus up to `limit` matches with snippets cut around the
+    indexed offsets and the chunk's metadata.
+    """
+    index = get_term_index()
+    index.ensure_built(collection)
+    matches = index.find(collection.name, term)
+    shown = matches[:limit]
+    rows = {}
+    if shown:
+        fetched = collection.get(ids=[chunk_id for chunk_id, _, _ in shown], include=["documents", "metadatas"])
+        rows = {cid: (doc or "", meta or {}) for cid, doc, meta in
+                zip(fetched.get("ids", []), fetched.get("documents", []), fetched.get("metadatas", []))}
+    results = []
+    for chunk_id, start, end in shown:
+        if chunk_id not in rows:
+            continue
+        doc, meta = rows[chunk_id]
+        results.append({
+            "chunk_id": chunk_id,
+            "chunk_index": meta.get("chunk"),
+            "start": start,
+            "end": end,
+            "snippet": doc[max(0, start - context):end + context],
+            "meta": meta,
+        })
+    return {
+        "term": term,
+        "matches": results,
+        "match_count": len(matches),
+        "doc_count": index.chunk_count(collection.name),
+    }
@@ -0,0 +1,342 @@
+"""
+Offline end-to-end benchmarks: ingest throughput per file format, and /api/ask latency
+percentiles at several corpus sizes and concurrency levels.
+
+The real app runs under uvicorn on a local port with EMBEDDING_BACKEND=fake and
+LLM_BACKEND=fake against throwaway Chroma/SQLite state, so neither Ollama nor Gemini is
+needed. Run from the repository root:
+
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --corpus-sizes 50,500 --concurrency 1,8,32 --output bench.json
+"""
+
+import argparse
+import io
+import json
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORDS = (
+    "account adapter analysis anchor archive balance battery bearing benchmark boundary cable capacitor "
+    "catalog channel circuit cluster compliance contract controller coupling cycle dataset delivery "
+    "density deployment diagram engine estimate factor failure filter firmware forecast gateway gradient "
+    "harness inventory invoice kernel latency ledger license manifest margin matrix module network "
+    "operator payload pipeline policy portal premium protocol quota ratio reactor register release "
+    "resistor revenue router sample schedule sensor server shipment signal storage supplier switch "
+    "tariff tenant terminal threshold throughput ticket turbine upgrade vendor voltage warranty workload"
+).split()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--formats", default="txt,md,html,csv,json,docx,xlsx,pptx,pdf",
+                        help="comma-separated file formats for the ingest benchmark")
+    parser.add_argument("--ingest-docs", type=int, default=10, help="documents ingested per format")
+    parser.add_argument("--doc-words", type=int, default=1500, help="approximate words per generated document")
+    parser.add_argument("--corpus-sizes", default="20,100", help="comma-separated corpus sizes (documents) for the ask benchmark")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated concurrent askers")
+    parser.add_argument("--questions", type=int, default=100, help="questions asked per (corpus size, concurrency)")
+    parser.add_argument("--embed-dim", type=int, default=384, help="fake embedding dimension")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="simulated latency per embedding batch")
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0, help="simulated LLM latency per answer")
+    parser.add_argument("--answer-cache", action="store_true", help="leave the semantic answer cache on")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="also write the results as JSON to this path")
+    parser.add_argument("--verbose", action="store_true", help="show the app's own output")
+    return parser.parse_args()
+
+
+def configure_env(workdir, args):
+    """Point all state at a scratch directory and select the offline backends (before the app is imported)."""
+    os.environ.update({
+        "EMBEDDING_BACKEND": "fake",
+        "EMBED_FAKE_DIM": str(args.embed_dim),
+        "EMBED_FAKE_LATENCY_MS": str(args.embed_latency_ms),
+        "LLM_BACKEND": "fake",
+        "FAKE_LLM_LATENCY_MS": str(args.llm_latency_ms),
+        "CHROMA_PERSIST_DIR": os.path.join(workdir, "chroma"),
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'rag_platform.db')}",
+        "EMBED_CACHE_PATH": os.path.join(workdir, "embedding_cache.db"),
+        "CONVERSATION_STATE_PATH": os.path.join(workdir, "conversation_state.db"),
+        "INGEST_MAX_PENDING": "100000",
+    })
+    if not args.answer_cache:
+        os.environ["ANSWER_CACHE_ENABLED"] = "0"
+    if not args.verbose:
+        # Keep the app's own logging out of the timings and the report
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+# -- document generation ---------------------------------------------------------------------
+
+def make_paragraphs(rng, n_words):
+    paragraphs, words = [], 0
+    while words < n_words:
+        sentences = []
+        for _ in range(rng.randint(3, 7)):
+            sentence = rng.sample(WORDS, rng.randint(6, 14))
+            sentence[0] = sentence[0].capitalize()
+            sentences.append(" ".join(sentence) + ".")
+            words += len(sentence)
+        paragraphs.append(" ".join(sentences))
+    return paragraphs
+
+
+def make_rows(rng, n_words):
+    rows = []
+    for i in range(max(1, n_words // 8)):
+        rows.append([str(i), rng.choice(WORDS), " ".join(rng.sample(WORDS, 5)), f"{rng.uniform(1, 1000):.2f}"])
+    return ["id", "name", "description", "value"], rows
+
+
+def make_pdf(paragraphs):
+    """Build a minimal valid PDF (Helvetica text, one page per ~40 lines) without any PDF library."""
+    lines = []
+    for paragraph in paragraphs:
+        words = paragraph.split()
+        for i in range(0, len(words), 12):
+            lines.append(" ".join(words[i:i + 12]))
+        lines.append("")
+    pages = [lines[i:i + 40] for i in range(0, len(lines), 40)] or [[""]]
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page_lines in pages:
+        ops = ["BT", "/F1 10 Tf", "12 TL", "50 780 Td"]
+        for line in page_lines:
+            escaped = line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            ops.append(f"({escaped}) Tj T*")
+        ops.append("ET")
+        stream = "\n".join(ops)
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+    out, offsets = io.BytesIO(), []
+    out.write(b"%PDF-1.4\n")
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+
+def make_document(fmt, rng, n_words):
+    """Return (content_type, bytes) for a synthetic document, or None if the format's library is missing."""
+    paragraphs = make_paragraphs(rng, n_words)
+    if fmt == "txt":
+        return "text/plain", "\n\n".join(paragraphs).encode()
+    if fmt == "md":
+        body = "\n\n".join(f"## Section {i}\n\n{p}" for i, p in enumerate(paragraphs))
+        return "text/markdown", f"# Benchmark document\n\n{body}".encode()
+    if fmt == "html":
+        body = "".join(f"<h2>Section {i}</h2><p>{p}</p>" for i, p in enumerate(paragraphs))
+        return "text/html", f"<html><body><h1>Benchmark document</h1>{body}</body></html>".encode()
+    if fmt == "csv":
+        header, rows = make_rows(rng, n_words)
+        return "text/csv", "\n".join(",".join(row) for row in [header] + rows).encode()
+    if fmt == "json":
+        header, rows = make_rows(rng, n_words)
+        return "application/json", json.dumps([dict(zip(header, row)) for row in rows]).encode()
+    if fmt == "pdf":
+        return "application/pdf", make_pdf(paragraphs)
+    buffer = io.BytesIO()
+    try:
+        if fmt == "docx":
+            import docx
+            document = docx.Document()
+            for paragraph in paragraphs:
+                document.add_paragraph(paragraph)
+            document.save(buffer)
+            return "application/vnd.openxmlformats-officedocument.wordprocessingml.document", buffer.getvalue()
+        if fmt == "xlsx":
+            import openpyxl
+            workbook = openpyxl.Workbook()
+            sheet = workbook.active
+            header, rows = make_rows(rng, n_words)
+            for row in [header] + rows:
+                sheet.append(row)
+            workbook.save(buffer)
+            return "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", buffer.getvalue()
+        if fmt == "pptx":
+            import pptx
+            presentation = pptx.Presentation()
+            for paragraph in paragraphs:
+                slide = presentation.slides.add_slide(presentation.slide_layouts[1])
+                slide.shapes.title.text = paragraph.split(".")[0][:60]
+                slide.placeholders[1].text = paragraph
+            presentation.save(buffer)
+            return "application/vnd.openxmlformats-officedocument.presentationml.presentation", buffer.getvalue()
+    except ImportError:
+        return None
+    raise ValueError(f"Unknown format: {fmt}")
+
+
+# -- server and client -----------------------------------------------------------------------
+
+def start_server():
+    import uvicorn
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config("app.main:app", host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))]
+
+
+def ingest_batch(session, base_url, documents, tenant_id):
+    """Upload documents, wait for every job and return (wall seconds, finished job dicts)."""
+    started = time.perf_counter()
+    job_ids = []
+    for filename, content_type, payload in documents:
+        response = session.post(f"{base_url}/api/ingest/file", files={"file": (filename, payload, content_type)},
+                                data={"tenant_id": tenant_id})
+        response.raise_for_status()
+        job_ids.append(response.json()["job_id"])
+    jobs, pending = {}, set(job_ids)
+    while pending:
+        for job_id in list(pending):
+            job = session.get(f"{base_url}/api/ingest/jobs/{job_id}").json()
+            if job["status"] in ("success", "error"):
+                jobs[job_id] = job
+                pending.discard(job_id)
+        if pending:
+            time.sleep(0.05)
+    return time.perf_counter() - started, [jobs[job_id] for job_id in job_ids]
+
+
+def stage_seconds(jobs):
+    totals = {}
+    for job in jobs:
+        for name, stage in job["stages"].items():
+            if stage.get("started_at") and stage.get("finished_at"):
+                totals[name] = totals.get(name, 0.0) + stage["finished_at"] - stage["started_at"]
+    return {name: round(total / len(jobs), 4) for name, total in totals.items()}
+
+
+def bench_ingest(session, base_url, args, rng, report):
+    results = []
+    for fmt in args.formats.split(","):
+        documents = []
+        for i in range(args.ingest_docs):
+            made = make_document(fmt, rng, args.doc_words)
+            if made is None:
+                break
+            documents.append((f"bench_{i}.{fmt}", made[0], made[1]))
+        if not documents:
+            report(f"  {fmt:<6} skipped (library not installed)")
+            continue
+        seconds, jobs = ingest_batch(session, base_url, documents, f"bench-ingest-{fmt}")
+        ok = [job for job in jobs if job["status"] == "success"]
+        chunks = sum((job.get("result") or {}).get("chunks", 0) for job in ok)
+        size = sum(len(payload) for _, _, payload in documents)
+        row = {
+            "format": fmt,
+            "documents": len(documents),
+            "errors": len(jobs) - len(ok),
+            "seconds": round(seconds, 3),
+            "docs_per_s": round(len(documents) / seconds, 2),
+            "mb_per_s": round(size / seconds / 1e6, 3),
+            "chunks_per_s": round(chunks / seconds, 1),
+            "mean_stage_seconds": stage_seconds(ok),
+        }
+        results.append(row)
+        report(f"  {fmt:<6} {row['documents']:>4} docs  {row['docs_per_s']:>8.2f} docs/s  {row['mb_per_s']:>7.3f} MB/s  "
+               f"{row['chunks_per_s']:>8.1f} chunks/s  errors={row['errors']}  stages={row['mean_stage_seconds']}")
+    return results
+
+
+def bench_ask(session, base_url, args, rng, report):
+    results = []
+    local = threading.local()
+
+    def ask(question, tenant_id):
+        import requests
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        started = time.perf_counter()
+        response = local.session.post(f"{base_url}/api/ask", json={"question": question, "tenant_id": tenant_id})
+        return time.perf_counter() - started, response.status_code == 200
+
+    for size in (int(s) for s in args.corpus_sizes.split(",")):
+        tenant_id = f"bench-corpus-{size}"
+        documents = [(f"doc_{i}.txt", *make_document("txt", rng, args.doc_words)) for i in range(size)]
+        ingest_batch(session, base_url, documents, tenant_id)
+        for concurrency in (int(c) for c in args.concurrency.split(",")):
+            # Distinct questions, so answers are computed rather than served from a cache
+            questions = [f"What does the {' '.join(rng.sample(WORDS, 3))} section say about item {i}?"
+                         for i in range(args.questions)]
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                outcomes = list(pool.map(lambda q: ask(q, tenant_id), questions))
+            wall = time.perf_counter() - started
+            latencies = [seconds * 1000 for seconds, ok in outcomes if ok]
+            row = {
+                "corpus_size": size,
+                "concurrency": concurrency,
+                "requests": len(outcomes),
+                "errors": sum(1 for _, ok in outcomes if not ok),
+                "requests_per_s": round(len(outcomes) / wall, 2),
+                "p50_ms": round(percentile(latencies, 50) or 0, 1),
+                "p95_ms": round(percentile(latencies, 95) or 0, 1),
+                "p99_ms": round(percentile(latencies, 99) or 0, 1),
+            }
+            results.append(row)
+            report(f"  corpus={size:<6} concurrency={concurrency:<4} {row['requests_per_s']:>8.2f} req/s  "
+                   f"p50={row['p50_ms']:>8.1f}ms  p95={row['p95_ms']:>8.1f}ms  p99={row['p99_ms']:>8.1f}ms  "
+                   f"errors={row['errors']}")
+    return results
+
+
+def main():
+    args = parse_args()
+    def report(line):
+        print(line, flush=True)
+
+    workdir = tempfile.mkdtemp(prefix="rag_bench_")
+    configure_env(workdir, args)
+
+    import requests
+
+    server, base_url = start_server()
+    rng = random.Random(args.seed)
+    session = requests.Session()
+    try:
+        report(f"Workdir: {workdir}")
+        report("Ingest throughput per format:")
+        ingest = bench_ingest(session, base_url, args, rng, report)
+        report("Ask latency:")
+        asks = bench_ask(session, base_url, args, rng, report)
+    finally:
+        server.should_exit = True
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "ingest": ingest, "ask": asks}, f, indent=2)
+        report(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -201,6 +201,18 @@ const App = () => {
     setLoading(false);
   };
 
+  // Poll a background ingestion job until it finishes; resolves with the job result
+  const waitForIngestJob = async (jobId) => {
+    for (;;) {
+      const res = await fetch(`/api/ingest/jobs/${jobId}`);
+      if (!res.ok) throw new Error(`Lost track of ingestion job ${jobId}`);
+      const job = await res.json();
+      if (job.status === 'success') return job.result;
+      if (job.status === 'error') throw new Error(job.error || `Failed to ingest ${job.filename}`);
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+    }
+  };
+
   const handleIngest = async (data) => {
     clearStatus();
     setLoading(true);
@@ -217,7 +229,9 @@ const App = () => {
             body: formData,
           });
           if (!res.ok) throw new Error(`Failed to upload ${file.name}`);
-          const result = await res.json();
+          const queued = await res.json();
+          if (queued.status === 'error') throw new Error(queued.message || `Failed to upload ${file.name}`);
+          const result = await waitForIngestJob(queued.job_id);
           addStatus(`${file.name}: Chunked into ${result.chunks} pieces.`, 'info');
         }
         addStatus('All files uploaded successfully!', 'success');
@@ -41,6 +41,16 @@ export const FileUpload = () => {
         }
     };
 
+    // Poll a background ingestion job until it finishes; resolves with the job result
+    const waitForIngestJob = async (jobId) => {
+        for (;;) {
+            const { data: job } = await axios.get(`/api/ingest/jobs/${jobId}`);
+            if (job.status === "success") return job.result;
+            if (job.status === "error") throw new Error(job.error || `Failed to ingest ${job.filename}`);
+            await new Promise((resolve) => setTimeout(resolve, 1000));
+        }
+    };
+
     const uploadFile = async (fileToUpload) => {
         setUploadStatus({ type: 'loading', message: `Uploading ${fileToUpload.name}...` });
 
@@ -48,11 +58,16 @@ export const FileUpload = () => {
         formData.append("file", fileToUpload.file);
 
         try {
-            await axios.post("/api/ingest/file", formData, {
+            const { data: queued } = await axios.post("/api/ingest/file", formData, {
                 headers: {
                     "Content-Type": "multipart/form-data",
                 },
             });
+            if (queued.status === "error") throw new Error(queued.message || `Failed to upload ${fileToUpload.name}`);
+
+            // The upload is only queued at this point; wait for ingestion to finish
+            setUploadStatus({ type: 'loading', message: `Processing ${fileToUpload.name}...` });
+            await waitForIngestJob(queued.job_id);
 
             // Update file status to uploaded
             setFiles(prev => prev.map(f =>
@@ -65,7 +80,7 @@ export const FileUpload = () => {
             // Clear status after 3 seconds
             setTimeout(() => setUploadStatus(null), 3000);
         } catch (error) {
-            console.error("Upload failed:", error); const errorMessage = error.response?.data?.detail || `Failed to upload ${fileToUpload.name}`;
+            console.error("Upload failed:", error); const errorMessage = error.response?.data?.detail || error.message || `Failed to upload ${fileToUpload.name}`;
             setUploadStatus({ type: 'error', message: errorMessage });
             toast.error(errorMessage);
 
@@ -0,0 +1,58 @@
+import time
+
+from app.cache import SemanticAnswerCache, TTLCache
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["hits"] == 3 and cache.stats()["misses"] == 1
+
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(ttl=0.05)
+    cache.set("short", 1)
+    cache.set("forever", 2, ttl=None)
+    time.sleep(0.1)
+    assert cache.get("short", "gone") == "gone"
+    assert cache.get("forever") == 2
+    assert len(cache) == 1
+
+
+def test_semantic_cache_matches_similar_questions_only():
+    cache = SemanticAnswerCache(threshold=0.95, ttl=60)
+    cache.store("t1", "what is the refund policy", [1.0, 0.0, 0.1], "v1", {"answer": "30 days"}, llm_seconds=2.0)
+
+    hit = cache.lookup("t1", [0.99, 0.0, 0.12], "v1")
+    assert hit is not None and hit[0] == {"answer": "30 days"} and hit[1] > 0.95
+    assert cache.lookup("t1", [0.0, 1.0, 0.0], "v1") is None
+    assert cache.lookup("t2", [1.0, 0.0, 0.1], "v1") is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 2
+    assert stats["saved_llm_seconds"] == 2.0
+
+
+def test_semantic_cache_drops_entries_from_older_versions_and_expired_ones():
+    cache = SemanticAnswerCache(ttl=0.05)
+    cache.store("t1", "q", [1.0, 0.0], "v1", {"answer": "a"})
+    assert cache.lookup("t1", [1.0, 0.0], "v2") is None
+    assert cache.stats()["entries"] == 0
+
+    cache.store("t1", "q", [1.0, 0.0], "v2", {"answer": "a"})
+    time.sleep(0.1)
+    assert cache.lookup("t1", [1.0, 0.0], "v2") is None
+
+
+def test_semantic_cache_bounds_entries_per_tenant():
+    cache = SemanticAnswerCache(maxsize=2)
+    for i in range(3):
+        cache.store("t1", f"q{i}", [float(i), 1.0], "v1", {"answer": str(i)})
+    cache.store("t2", "q", [1.0, 0.0], "v1", {"answer": "x"})
+    assert cache.stats()["entries"] == 3
+    assert cache.lookup("t1", [0.0, 1.0], "v1") is None
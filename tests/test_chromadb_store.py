@@ -0,0 +1,25 @@
+import pytest
+
+from app.vectorstore import chromadb_store
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(chromadb_store, "PERSIST_PATH", str(tmp_path / "chroma"))
+    monkeypatch.setattr(chromadb_store, "_CLIENT", None)
+    monkeypatch.setattr(chromadb_store, "_COLLECTIONS", {})
+    return chromadb_store
+
+
+def test_cached_handle_survives_a_drop_by_another_worker(store):
+    collection = store.get_collection("tcoll")
+    collection.upsert(ids=["a"], embeddings=[[1.0, 0.0]], documents=["alpha"])
+    assert collection.count() == 1
+
+    # Another worker drops the collection; this worker's cached handle now points at nothing
+    store.get_chroma_client().delete_collection("tcoll")
+
+    assert collection.count() == 0
+    collection.upsert(ids=["b"], embeddings=[[0.0, 1.0]], documents=["beta"])
+    assert store.get_collection("tcoll").get()["ids"] == ["b"]
+    assert collection.name == "tcoll"
@@ -0,0 +1,83 @@
+import random
+
+import pytest
+
+from app.processing.chunking import SEPARATORS, iter_chunks
+from app.processing.context_builder import estimate_tokens
+
+text_splitters = pytest.importorskip("langchain_text_splitters")
+
+_PIECES = ["\n\n", "\n", ". ", " ", "  ", "\t", "\n \n"]
+
+
+def _random_text(rng, length):
+    """Words of mixed length (some longer than any chunk) joined by every kind of separator."""
+    parts = []
+    size = 0
+    while size < length:
+        if rng.random() < 0.02:
+            word = "x" * rng.randint(50, 400)
+        else:
+            word = "".join(rng.choice("abcdefghij") for _ in range(rng.randint(1, 12)))
+        part = word + rng.choice(_PIECES)
+        parts.append(part)
+        size += len(part)
+    return "".join(parts)
+
+
+def _fragments(rng, text):
+    """Cut text at random points, including inside separators."""
+    cuts = sorted(rng.sample(range(1, len(text)), min(len(text) - 1, rng.randint(1, 200))))
+    return [text[a:b] for a, b in zip([0, *cuts], [*cuts, len(text)])]
+
+
+def _expected(text, chunk_size, overlap, length_function=len):
+    splitter = text_splitters.RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=overlap,
+        separators=SEPARATORS,
+        length_function=length_function,
+    )
+    return splitter.split_text(text)
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_matches_recursive_splitter(seed):
+    rng = random.Random(seed)
+    chunk_size = rng.choice([20, 50, 100, 300, 1000])
+    overlap = rng.randint(0, chunk_size // 2)
+    text = _random_text(rng, rng.randint(1, 6000))
+    expected = _expected(text, chunk_size, overlap)
+
+    for source in (text, _fragments(rng, text)):
+        chunks = list(iter_chunks(source, chunk_size=chunk_size, overlap=overlap, unit="chars"))
+        assert [chunk["text"] for chunk in chunks] == expected
+        for chunk in chunks:
+            assert text[chunk["start"]:chunk["end"]] == chunk["text"]
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_token_unit_matches_recursive_splitter(seed):
+    rng = random.Random(1000 + seed)
+    text = _random_text(rng, 4000)
+    chunks = list(iter_chunks(_fragments(rng, text), chunk_size=60, overlap=15, unit="tokens"))
+    assert [chunk["text"] for chunk in chunks] == _expected(text, 60, 15, estimate_tokens)
+
+
+def test_offsets_span_many_small_items():
+    lines = [f"row {i}: value {i * 7}\n" for i in range(20000)]
+    text = "".join(lines)
+    chunks = list(iter_chunks(lines, chunk_size=200, overlap=40, unit="chars"))
+    assert [chunk["text"] for chunk in chunks] == _expected(text, 200, 40)
+    assert all(text[chunk["start"]:chunk["end"]] == chunk["text"] for chunk in chunks)
+
+
+def test_empty_and_whitespace_input():
+    assert list(iter_chunks("")) == []
+    assert list(iter_chunks(["  ", "\n\n", "\t"])) == []
+
+
+@pytest.mark.parametrize("kwargs", [{"chunk_size": 0}, {"chunk_size": 10, "overlap": 11}, {"unit": "bytes"}])
+def test_rejects_bad_settings(kwargs):
+    with pytest.raises(ValueError):
+        list(iter_chunks("text", **kwargs))
@@ -0,0 +1,31 @@
+import asyncio
+import threading
+
+from app.processing.embedding_service import EmbeddingService, FakeEmbeddings
+
+
+class _BlockingEmbeddings(FakeEmbeddings):
+    """Fake embedder whose document batches wait until released; single-text calls pass straight through."""
+
+    def __init__(self):
+        super().__init__(dim=8)
+        self.release = threading.Event()
+
+    def embed_documents(self, texts):
+        if len(texts) > 1:
+            self.release.wait(5)
+        return super().embed_documents(texts)
+
+
+def test_queries_do_not_queue_behind_document_batches():
+    embedder = _BlockingEmbeddings()
+    service = EmbeddingService(model="fake", batch_size=2, max_concurrency=1, embedder=embedder)
+    upload = threading.Thread(target=service.embed_documents, args=(["a b", "c d", "e f", "g h"],))
+    upload.start()
+    try:
+        assert len(service.embed_query("question")) == 8
+        assert len(asyncio.run(service.aembed_query("question"))) == 8
+        assert upload.is_alive()
+    finally:
+        embedder.release.set()
+        upload.join()
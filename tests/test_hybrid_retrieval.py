@@ -0,0 +1,123 @@
+from app.vectorstore import chromadb_store, lexical_index
+from app.vectorstore.lexical_index import BM25Index, supports_filter, tokenize
+
+
+class _Collection:
+    """Just enough of a Chroma collection for _fuse and the BM25 builds to fetch chunks."""
+
+    name = "tcoll"
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def get(self, ids=None, include=(), limit=None, offset=0):
+        found = [cid for cid in ids if cid in self.rows] if ids is not None else list(self.rows)[offset:offset + limit]
+        return {
+            "ids": found,
+            "documents": [self.rows[cid][0] for cid in found],
+            "metadatas": [self.rows[cid][1] for cid in found],
+        }
+
+
+def _index():
+    index = BM25Index()
+    index.add(
+        ["a", "b", "c", "d"],
+        [
+            "The XJ-900 capacitor bank is rated for 400 volts.",
+            "Capacitors store charge; a capacitor bank stores more.",
+            "Quarterly revenue grew in every region.",
+            "Revenue from the XJ-900 line doubled.",
+        ],
+        [{"filename": "spec.pdf"}, {"filename": "notes.txt"}, {"filename": "report.pdf"}, {"filename": "report.pdf"}],
+    )
+    return index
+
+
+def test_tokenize_keeps_compound_codes_and_their_parts():
+    assert tokenize("Model XJ-900, v2.1") == ["model", "xj-900", "xj", "900", "v2.1", "v2", "1"]
+
+
+def test_bm25_ranks_rarer_and_repeated_terms_higher():
+    hits = _index().search("capacitor bank", k=4)
+    assert [cid for cid, _ in hits] == ["b", "a"]
+    assert hits[0][1] > hits[1][1] > 0
+
+
+def test_bm25_matches_exact_codes():
+    assert {cid for cid, _ in _index().search("xj-900")} == {"a", "d"}
+
+
+def test_bm25_where_filter_and_replace_and_remove():
+    index = _index()
+    assert {cid for cid, _ in index.search("revenue", where={"filename": "report.pdf"})} == {"c", "d"}
+    assert index.search("revenue", where={"filename": "spec.pdf"}) == []
+
+    index.add(["c"], ["Nothing about money here."], [{"filename": "report.pdf"}])
+    assert [cid for cid, _ in index.search("revenue")] == ["d"]
+    index.remove(["d"])
+    assert index.search("revenue") == []
+    assert len(index) == 3
+    assert sorted(index.ids_containing(["capacitor", "bank"])) == ["a", "b"]
+
+
+def test_supports_only_flat_equality_filters():
+    assert supports_filter(None)
+    assert supports_filter({"filename": "a.pdf"})
+    assert not supports_filter({"$and": [{"filename": "a.pdf"}]})
+    assert not supports_filter({"chunk": {"$gt": 3}})
+    assert not supports_filter({"upload_time": "2024-01-01"})
+
+
+def test_index_keeps_only_filter_fields_of_metadata():
+    index = BM25Index()
+    index.add(["a"], ["some text"], [{"filename": "a.pdf", "text": "some text", "chunk": 0}])
+    assert index.metadata("a") == {"filename": "a.pdf"}
+
+
+def test_catch_up_applies_only_the_other_workers_changes(monkeypatch):
+    monkeypatch.setattr(lexical_index, "_BUILD_PAGE_SIZE", 2)
+    collection = _Collection({cid: (f"chunk {cid} capacitor", {"filename": "f.txt"}) for cid in "abcde"})
+    lexical_index._build(collection, version=1)
+    index = lexical_index._INDEXES.pop("tcoll")
+    assert len(index) == 5 and index.version == 1
+
+    # Another worker replaced chunk "b" with "x"
+    del collection.rows["b"]
+    collection.rows["x"] = ("chunk x resistor", {"filename": "f.txt"})
+    fetched = []
+    get = collection.get
+    monkeypatch.setattr(collection, "get", lambda **kw: fetched.append(kw.get("ids")) or get(**kw))
+
+    lexical_index._BUILDING.add("tcoll")
+    lexical_index._catch_up(collection, index, version=3)
+    assert index.version == 3 and "tcoll" not in lexical_index._BUILDING
+    assert index.ids() == set("acdex")
+    assert [cid for cid, _ in index.search("resistor")] == ["x"]
+    assert [ids for ids in fetched if ids is not None] == [["x"]]
+
+
+def test_reciprocal_rank_fusion():
+    vector_results = {
+        "ids": [["v1", "both", "v2"]],
+        "documents": [["doc v1", "doc both", "doc v2"]],
+        "metadatas": [[{"n": 1}, {"n": 2}, {"n": 3}]],
+        "distances": [[0.1, 0.2, 0.3]],
+    }
+    lexical_hits = [("lex", 9.0), ("both", 5.0), ("gone", 1.0)]
+    collection = _Collection({"lex": ("doc lex", {"n": 4})})
+
+    fused = chromadb_store._fuse(collection, vector_results, lexical_hits, k=4)
+
+    k = chromadb_store.RRF_K
+    # "both" is ranked by both retrievers, so it wins; ties keep vector order first
+    assert fused["ids"][0] == ["both", "v1", "lex", "v2"]
+    assert fused["scores"][0][0] == 1 / (k + 2) + 1 / (k + 2)
+    assert fused["documents"][0] == ["doc both", "doc v1", "doc lex", "doc v2"]
+    assert fused["distances"][0] == [0.2, 0.1, None, 0.3]
+
+
+def test_fusion_drops_lexical_hits_no_longer_stored():
+    vector_results = {"ids": [["v1"]], "documents": [["doc v1"]], "metadatas": [[{}]], "distances": [[0.1]]}
+    fused = chromadb_store._fuse(_Collection({}), vector_results, [("gone", 3.0)], k=5)
+    assert fused["ids"][0] == ["v1"]
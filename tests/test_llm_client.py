@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from app.llm import FakeChatModel, LLMClient, LLMTimeoutError
+
+
+class _CountingModel(FakeChatModel):
+    """Fake model that counts calls and tracks how many run at once."""
+
+    def __init__(self, latency_ms=50, **kwargs):
+        super().__init__(latency_ms=latency_ms, **kwargs)
+        self.calls = 0
+        self.running = 0
+        self.peak = 0
+
+    async def ainvoke(self, prompt):
+        self.calls += 1
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            return await super().ainvoke(prompt)
+        finally:
+            self.running -= 1
+
+    async def astream(self, prompt):
+        self.calls += 1
+        async for chunk in super().astream(prompt):
+            yield chunk
+
+
+def _client(model, **kwargs):
+    return LLMClient(llm_factory=lambda: model, **kwargs)
+
+
+def test_identical_prompts_in_flight_share_one_call():
+    model = _CountingModel()
+    client = _client(model)
+
+    async def run():
+        return await asyncio.gather(*(client.ainvoke("same prompt") for _ in range(5)), client.ainvoke("other"))
+
+    answers = asyncio.run(run())
+    assert len(set(answers[:5])) == 1
+    assert model.calls == 2
+    assert client.stats()["coalesced"] == 4
+    assert client.stats()["in_flight"] == 0
+
+
+def test_finished_prompts_are_sent_again():
+    model = _CountingModel(latency_ms=0)
+    client = _client(model)
+
+    async def run():
+        await client.ainvoke("prompt")
+        await client.ainvoke("prompt")
+
+    asyncio.run(run())
+    assert model.calls == 2
+
+
+def test_concurrency_is_bounded():
+    model = _CountingModel(latency_ms=20)
+    client = _client(model, max_concurrency=2)
+
+    async def run():
+        await asyncio.gather(*(client.ainvoke(f"prompt {i}") for i in range(6)))
+
+    asyncio.run(run())
+    assert model.calls == 6
+    assert model.peak == 2
+
+
+def test_timeout_raises_and_is_counted():
+    client = _client(_CountingModel(latency_ms=500), timeout=0.05)
+
+    with pytest.raises(LLMTimeoutError):
+        asyncio.run(client.ainvoke("slow"))
+    assert client.stats()["timeouts"] == 1
+
+
+def test_stream_is_shared_with_concurrent_callers():
+    model = _CountingModel(latency_ms=40, response="one two three four five six seven eight")
+    client = _client(model)
+
+    async def collect():
+        return [piece async for piece in client.astream("prompt")]
+
+    async def later_caller():
+        await asyncio.sleep(0.01)
+        return await client.ainvoke("prompt")
+
+    async def run():
+        return await asyncio.gather(collect(), later_caller())
+
+    pieces, shared = asyncio.run(run())
+    assert len(pieces) > 1
+    assert "".join(pieces) == shared == model.response
+    assert model.calls == 1
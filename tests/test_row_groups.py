@@ -0,0 +1,44 @@
+import io
+
+import pytest
+
+from app.processing import document_processing
+
+
+def test_csv_keeps_empty_cells_aligned_with_the_header():
+    groups = list(document_processing.iter_csv_row_groups(b"id,name,amount\n1,,50\n,bob,\n,,\n"))
+    assert groups == ["id | name | amount\n1 |  | 50\n | bob"]
+
+
+def test_every_group_starts_with_the_header():
+    rows = "".join(f"{i},,{i * 10}\n" for i in range(500))
+    groups = list(document_processing.iter_csv_row_groups(("id,name,amount\n" + rows).encode(), group_chars=200))
+    assert len(groups) > 1
+    assert all(group.startswith("id | name | amount\n") for group in groups)
+    assert groups[0].splitlines()[1] == "0 |  | 0"
+
+
+def test_excel_keeps_empty_cells_aligned_with_the_header():
+    openpyxl = pytest.importorskip("openpyxl")
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = "Orders"
+    for row in (["id", "name", "amount"], [1, None, 50], [None, "bob", None]):
+        sheet.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+
+    groups = list(document_processing.iter_excel_row_groups(buffer.getvalue()))
+    assert groups == ["[Sheet: Orders]\nid | name | amount\n1 |  | 50\n | bob"]
+
+
+def test_extraction_failing_mid_document_raises_instead_of_returning_partial_text(monkeypatch):
+    def broken_row_groups(source):
+        yield "id | name\n1 | a"
+        raise ValueError("corrupt row")
+
+    monkeypatch.setattr(document_processing, "iter_csv_row_groups", broken_row_groups)
+    units = document_processing.iter_document_text(b"id,name\n1,a\n", "text/csv")
+    assert next(units) == "id | name\n1 | a"
+    with pytest.raises(ValueError):
+        next(units)
@@ -0,0 +1,74 @@
+import pytest
+
+from app.vectorstore.term_index import TermIndex
+
+DOCS = {
+    "a": "The capacitor bank failed. Replace the Capacitor Bank soon.",
+    "b": "Bank holidays close the office; the capacitor stays charged.",
+    "c": "Capacitance is measured in farads.",
+}
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = TermIndex(tmp_path / "terms.sqlite3")
+    index.add("docs", list(DOCS), list(DOCS.values()))
+    return index
+
+
+def _matched(index, term):
+    return {chunk_id: DOCS[chunk_id][start:end] for chunk_id, start, end in index.find("docs", term)}
+
+
+def _find_ids(index, term):
+    return sorted(chunk_id for chunk_id, _, _ in index.find("docs", term))
+
+
+def test_single_word_is_case_insensitive_with_offsets_of_first_occurrence(index):
+    matches = index.find("docs", "BANK")
+    assert {chunk_id for chunk_id, _, _ in matches} == {"a", "b"}
+    assert _matched(index, "bank") == {"a": "bank", "b": "Bank"}
+
+
+def test_phrase_needs_consecutive_words(index):
+    assert _matched(index, "capacitor bank") == {"a": "capacitor bank"}
+    assert _matched(index, "bank capacitor") == {}
+
+
+def test_last_word_matches_as_prefix(index):
+    assert _matched(index, "capacit") == {"a": "capacitor", "b": "capacitor", "c": "Capacitance"}
+    assert _matched(index, "the capacitor b") == {"a": "The capacitor bank"}
+
+
+def test_reindex_remove_and_drop(index):
+    index.add("docs", ["c"], ["Now the capacitor bank is here too."])
+    assert set(_find_ids(index, "capacitor bank")) == {"a", "c"}
+    index.remove("docs", ["a"])
+    assert _find_ids(index, "capacitor bank") == ["c"]
+    assert index.chunk_count("docs") == 2
+    index.drop("docs")
+    assert index.find("docs", "capacitor") == []
+    assert index.chunk_count("docs") == 0
+
+
+def test_collections_are_separate(index):
+    index.add("other", ["x"], ["capacitor"])
+    assert _find_ids(index, "farads") == ["c"]
+    assert [chunk_id for chunk_id, _, _ in index.find("other", "farads")] == []
+
+
+def test_versions_are_shared_through_the_database(tmp_path):
+    first = TermIndex(tmp_path / "terms.sqlite3")
+    second = TermIndex(tmp_path / "terms.sqlite3")
+    assert first.version("docs") == 0
+    assert first.bump_version("docs") == 1
+    assert second.bump_version("docs") == 2
+    first.drop("docs")
+    assert first.version("docs") == 2
+
+
+def test_version_reads_do_not_wait_on_postings_writes(index):
+    index.bump_version("docs")
+    with index._lock:
+        # A postings write holds the index lock; the version is still readable
+        assert index.version("docs") == 1